@@ -0,0 +1,25 @@
+"""email_message (gmail_account_id, message_id) index
+
+Revision ID: 3f1a9c2d7b10
+Revises: c76c72edbee3
+Create Date: 2026-10-18 09:12:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1a9c2d7b10'
+down_revision: Union[str, None] = 'c76c72edbee3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_email_gmail_message', 'email_message', ['gmail_account_id', 'message_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_gmail_message', table_name='email_message')
@@ -0,0 +1,29 @@
+"""email_message.hydrated_at for metadata-first sync
+
+Revision ID: 5c7e1b9a4d22
+Revises: 8b2e4d6f1a37
+Create Date: 2026-10-18 13:26:08.540127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5c7e1b9a4d22'
+down_revision: Union[str, None] = '8b2e4d6f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('email_message', sa.Column('hydrated_at', sa.DateTime(timezone=True), nullable=True))
+    # every existing row was synced with format=FULL
+    op.execute("UPDATE email_message SET hydrated_at = COALESCE(indexed_at, created_at, now())")
+    op.create_index('ix_email_unhydrated', 'email_message', ['gmail_account_id', 'date', 'message_id'], unique=False, postgresql_where=sa.text('hydrated_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_email_unhydrated', table_name='email_message', postgresql_where=sa.text('hydrated_at IS NULL'))
+    op.drop_column('email_message', 'hydrated_at')
@@ -0,0 +1,44 @@
+"""sync_run checkpoints
+
+Revision ID: 8b2e4d6f1a37
+Revises: 3f1a9c2d7b10
+Create Date: 2026-10-18 11:04:52.331870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e4d6f1a37'
+down_revision: Union[str, None] = '3f1a9c2d7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('sync_run',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('gmail_account_id', sa.UUID(), nullable=False),
+    sa.Column('kind', sa.String(length=32), nullable=False),
+    sa.Column('state', sa.String(length=32), nullable=False),
+    sa.Column('query', sa.Text(), nullable=True),
+    sa.Column('page_token', sa.String(length=256), nullable=True),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('high_water_mark', sa.String(length=128), nullable=True),
+    sa.Column('resume_count', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['gmail_account_id'], ['gmail_account.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sync_run_account_started', 'sync_run', ['gmail_account_id', 'started_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sync_run_account_started', table_name='sync_run')
+    op.drop_table('sync_run')
@@ -0,0 +1,25 @@
+"""email_message.chunk_count
+
+Revision ID: a4d93e0c6b51
+Revises: 5c7e1b9a4d22
+Create Date: 2026-10-18 14:02:37.915402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d93e0c6b51'
+down_revision: Union[str, None] = '5c7e1b9a4d22'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('email_message', sa.Column('chunk_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('email_message', 'chunk_count')
@@ -0,0 +1,96 @@
+"""email_body: zstd-compressed bodies moved out of email_message
+
+Revision ID: b93f0d6e4a18
+Revises: e81c4a7f2b96
+Create Date: 2026-10-18 19:02:17.553904
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import zstandard as zstd
+
+# revision identifiers, used by Alembic.
+revision: str = 'b93f0d6e4a18'
+down_revision: Union[str, None] = 'e81c4a7f2b96'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# rows copied per round trip
+BATCH = 1000
+# same as app/utils/body_codec.py
+ZSTD_LEVEL = 6
+
+
+def _pack(s):
+    return zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(s.encode('utf-8')) if s else None
+
+
+def _unpack(b):
+    return zstd.ZstdDecompressor().decompress(b).decode('utf-8') if b is not None else None
+
+
+def upgrade() -> None:
+    op.create_table('email_body',
+    sa.Column('message_id', sa.String(length=128), nullable=False),
+    sa.Column('body_text_z', sa.LargeBinary(), nullable=True),
+    sa.Column('body_html_z', sa.LargeBinary(), nullable=True),
+    sa.Column('headers_json_z', sa.LargeBinary(), nullable=True),
+    sa.ForeignKeyConstraint(['message_id'], ['email_message.message_id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('message_id')
+    )
+    # already compressed: keep TOAST from trying pglz on top
+    for col in ('body_text_z', 'body_html_z', 'headers_json_z'):
+        op.execute(f'ALTER TABLE email_body ALTER COLUMN {col} SET STORAGE EXTERNAL')
+
+    conn = op.get_bind()
+    last = ''
+    while True:
+        rows = conn.execute(sa.text(
+            'SELECT message_id, body_text, body_html, headers_json FROM email_message '
+            'WHERE message_id > :last AND (body_text IS NOT NULL OR body_html IS NOT NULL '
+            'OR headers_json IS NOT NULL) ORDER BY message_id LIMIT :n'),
+            {'last': last, 'n': BATCH}).all()
+        if not rows:
+            break
+        conn.execute(sa.text(
+            'INSERT INTO email_body (message_id, body_text_z, body_html_z, headers_json_z) '
+            'VALUES (:mid, :t, :h, :j)'),
+            [{'mid': r.message_id, 't': _pack(r.body_text), 'h': _pack(r.body_html),
+              'j': _pack(json.dumps(r.headers_json, ensure_ascii=False, separators=(',', ':'))
+                         if r.headers_json else None)}
+             for r in rows])
+        last = rows[-1].message_id
+
+    op.drop_column('email_message', 'body_html')
+    op.drop_column('email_message', 'body_text')
+    op.drop_column('email_message', 'headers_json')
+
+
+def downgrade() -> None:
+    op.add_column('email_message', sa.Column('headers_json',
+                                             postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('email_message', sa.Column('body_text', sa.Text(), nullable=True))
+    op.add_column('email_message', sa.Column('body_html', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    last = ''
+    while True:
+        rows = conn.execute(sa.text(
+            'SELECT message_id, body_text_z, body_html_z, headers_json_z FROM email_body '
+            'WHERE message_id > :last ORDER BY message_id LIMIT :n'),
+            {'last': last, 'n': BATCH}).all()
+        if not rows:
+            break
+        conn.execute(sa.text(
+            'UPDATE email_message SET body_text = :t, body_html = :h, '
+            'headers_json = CAST(:j AS JSONB) WHERE message_id = :mid'),
+            [{'mid': r.message_id, 't': _unpack(r.body_text_z), 'h': _unpack(r.body_html_z),
+              'j': _unpack(r.headers_json_z)}
+             for r in rows])
+        last = rows[-1].message_id
+
+    op.drop_table('email_body')
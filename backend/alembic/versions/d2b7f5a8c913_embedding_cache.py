@@ -0,0 +1,36 @@
+"""embedding_cache
+
+Revision ID: d2b7f5a8c913
+Revises: a4d93e0c6b51
+Create Date: 2026-10-18 15:11:40.207318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b7f5a8c913'
+down_revision: Union[str, None] = 'a4d93e0c6b51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('embedding_cache',
+    sa.Column('key', sa.LargeBinary(length=32), nullable=False),
+    sa.Column('model', sa.String(length=128), nullable=False),
+    sa.Column('dims', sa.Integer(), nullable=False),
+    sa.Column('dtype', sa.String(length=8), nullable=False),
+    sa.Column('vector', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_embedding_cache_last_used', 'embedding_cache', ['last_used_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_embedding_cache_last_used', table_name='embedding_cache')
+    op.drop_table('embedding_cache')
@@ -0,0 +1,34 @@
+"""gmail_account sync schedule columns
+
+Revision ID: e81c4a7f2b96
+Revises: d2b7f5a8c913
+Create Date: 2026-10-18 16:11:52.408113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e81c4a7f2b96'
+down_revision: Union[str, None] = 'd2b7f5a8c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('gmail_account', sa.Column('change_rate', sa.Float(),
+                                             server_default='0', nullable=False))
+    op.add_column('gmail_account', sa.Column('last_checked_at',
+                                             sa.DateTime(timezone=True), nullable=True))
+    op.add_column('gmail_account', sa.Column('next_sync_at',
+                                             sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_gmail_account_next_sync', 'gmail_account', ['next_sync_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_gmail_account_next_sync', table_name='gmail_account')
+    op.drop_column('gmail_account', 'next_sync_at')
+    op.drop_column('gmail_account', 'last_checked_at')
+    op.drop_column('gmail_account', 'change_rate')
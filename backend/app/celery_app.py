@@ -24,6 +24,8 @@ celery_app.autodiscover_tasks(["app.tasks"])
 
 try:
     import app.tasks.beat_schedule
+    # one event loop + pooled clients per worker process (signal handlers)
+    import app.tasks.worker_loop
     from app.tasks import sync_tasks
 except Exception:
     pass
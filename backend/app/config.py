@@ -8,6 +8,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 class Settings(BaseSettings):
 
     DATABASE_URL: str
+    # driver URL for the async engine (e.g. postgresql+asyncpg://...); defaults
+    # to DATABASE_URL on psycopg's async mode
+    ASYNC_DATABASE_URL: str | None = None
     REDIS_URL: str
     ALLOW_ORIGIN: str
 
@@ -27,6 +30,84 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str | None = None
     OPENAI_CHAT_MODEL: str | None = None
 
+    # shared Google API client (app/utils/http.py)
+    HTTP_MAX_CONNECTIONS: int = 50
+    HTTP_MAX_KEEPALIVE: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+
+    # UpsertAggregator: Pinecone request limits (2MB / 1000 vectors) and parallelism
+    PINECONE_UPSERT_MAX_VECTORS: int = 200
+    PINECONE_UPSERT_MAX_BYTES: int = 1_800_000
+    PINECONE_UPSERT_CONCURRENCY: int = 4
+    # threads issuing metadata-only updates (one Pinecone call per chunk id)
+    PINECONE_UPDATE_CONCURRENCY: int = 8
+
+    # Gmail per-user quota (units/s) for the shared limiter; AIMD between min and max
+    GMAIL_QUOTA_UNITS_PER_SEC: float = 250
+    GMAIL_QUOTA_MIN_UNITS_PER_SEC: float = 25
+    GMAIL_QUOTA_INCREASE: float = 5
+    GMAIL_RATE_LIMIT_SHARED: bool = True
+
+    # EmbeddingBatcher: token budget per embeddings request (provider cap is 300k)
+    EMBED_MAX_TOKENS_PER_REQUEST: int = 250_000
+    EMBED_REQUEST_CONCURRENCY: int = 4
+    # persistent embedding cache (embedding_cache table) + in-process LRU entries
+    EMBED_CACHE_ENABLED: bool = True
+    EMBED_CACHE_DTYPE: str = "float32"  # or "float16": half the bytes, ~3 digits
+    EMBED_CACHE_LRU_SIZE: int = 2000
+    EMBED_CACHE_MAX_ROWS: int = 1_000_000
+    # query vectors for /search and chat: local TTL LRU, optional shared Redis tier
+    QUERY_EMBED_CACHE_SIZE: int = 1000
+    QUERY_EMBED_CACHE_TTL_S: float = 3600
+    QUERY_EMBED_CACHE_REDIS: bool = True
+    QUERY_EMBED_CACHE_REDIS_TTL_S: int = 86400
+
+    # initial sync pipeline: workers per stage + bounded queue size between stages
+    SYNC_FETCH_CONCURRENCY: int = 2
+    SYNC_PARSE_CONCURRENCY: int = 2
+    SYNC_EMBED_CONCURRENCY: int = 4
+    SYNC_UPSERT_CONCURRENCY: int = 2
+    SYNC_QUEUE_SIZE: int = 64
+    # processes decoding/hashing/chunking fetched bodies (0 = on the event
+    # loop), and messages handed to one process per call
+    SYNC_PARSE_PROCESSES: int = 2
+    SYNC_PARSE_BATCH: int = 16
+    # fetch workers for the body hydration phase (runs after the metadata pass)
+    SYNC_HYDRATE_FETCH_CONCURRENCY: int = 1
+    # emails whose chunks are embedded together
+    SYNC_EMBED_BATCH: int = 32
+    # emails whose vectors are upserted together
+    SYNC_UPSERT_BATCH: int = 32
+    # EmailBulkWriter: commit every N rows or every T ms, whichever first
+    SYNC_WRITE_BATCH: int = 500
+    SYNC_WRITE_INTERVAL_MS: int = 1000
+    # stored message ids preloaded for the "already synced" diff (8 bytes each)
+    SYNC_KNOWN_IDS_MAX: int = 2_000_000
+    # sharded initial sync over Celery (needs a result backend for the chords)
+    SYNC_INITIAL_VIA_CELERY: bool = False
+    SYNC_SHARD_SIZE: int = 500
+    SYNC_SHARD_MAX_RETRIES: int = 3
+    # per-account sync lease: expires unless renewed (heartbeat every ttl/3);
+    # a sharded initial sync is renewed by its shards, so it gets longer
+    SYNC_LEASE_TTL_S: int = 120
+    SYNC_SHARD_LEASE_TTL_S: int = 1800
+    # ... and by a keeper task while shards wait in the queue, for at most this
+    SYNC_SHARD_LEASE_MAX_S: int = 24 * 3600
+    # incremental sync scheduler: a beat tick claims due accounts and checks
+    # their historyId; the next check is about SYNC_SCHED_TARGET_CHANGES away
+    # at the account's decayed change rate, within [MIN, MAX], +/- JITTER
+    SYNC_SCHED_TICK_S: int = 60
+    SYNC_SCHED_BATCH: int = 500
+    SYNC_SCHED_MIN_INTERVAL_S: int = 120
+    SYNC_SCHED_MAX_INTERVAL_S: int = 3600
+    SYNC_SCHED_TARGET_CHANGES: float = 5
+    SYNC_SCHED_RATE_WINDOW_S: int = 6 * 3600
+    SYNC_SCHED_JITTER: float = 0.2
+    # sync progress is pushed to Redis / SSE at most this often
+    SYNC_PROGRESS_INTERVAL_MS: int = 500
+    # messages per Gmail batch request (Gmail allows 100, recommends <= 50)
+    GMAIL_BATCH_SIZE: int = 50
+
     @property
     def allow_origins(self) -> list[str]:
         return [o.strip() for o in self.ALLOW_ORIGIN.split(",")]
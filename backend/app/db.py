@@ -1,7 +1,11 @@
+import asyncio
 from contextlib import contextmanager
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
+                                    async_sessionmaker, create_async_engine)
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from .config import settings
@@ -11,6 +15,52 @@ SessionLocal = sessionmaker(
     bind=engine, autoflush=False, autocommit=False, future=True)
 
 
+def _async_database_url() -> str:
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(settings.DATABASE_URL)
+    # psycopg 3 does both; psycopg2 (the plain "postgresql" default) does not
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+psycopg")
+    return url.render_as_string(hide_password=False)
+
+
+_async_engine: AsyncEngine | None = None
+_async_engine_loop: asyncio.AbstractEventLoop | None = None
+_async_sessions: async_sessionmaker[AsyncSession] | None = None
+
+
+def async_engine() -> AsyncEngine:
+    """
+    Process-wide async engine (ASYNC_DATABASE_URL, else DATABASE_URL on
+    psycopg's async mode). Like get_redis(), its pooled connections belong to
+    one event loop, so a new engine is built when called from another loop.
+    """
+    global _async_engine, _async_engine_loop, _async_sessions
+    loop = asyncio.get_running_loop()
+    if _async_engine is None or _async_engine_loop is not loop:
+        _async_engine = create_async_engine(_async_database_url(), pool_pre_ping=True)
+        _async_engine_loop = loop
+        # no expiry on commit: attributes are never lazily reloaded under await
+        _async_sessions = async_sessionmaker(
+            _async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+def async_session() -> AsyncSession:
+    async_engine()
+    return _async_sessions()
+
+
+async def aclose_async_engine():
+    global _async_engine, _async_engine_loop, _async_sessions
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_engine_loop = None
+    _async_sessions = None
+
+
 class Base(DeclarativeBase):
     pass
 # Dependency for FastAPI routes
@@ -29,3 +79,8 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with async_session() as db:
+        yield db
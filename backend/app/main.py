@@ -3,7 +3,6 @@ import json
 import logging
 from uuid import uuid4
 
-import httpx
 from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,7 +12,7 @@ from sqlalchemy.orm import Session
 
 from . import models
 from .config import settings
-from .db import get_db
+from .db import aclose_async_engine, get_db
 from .routes import auth
 from .routes import chat as chats_route
 from .routes import email as email_route
@@ -23,7 +22,10 @@ from .routes import jobs as jobs_route
 from .routes import me as me_route
 from .routes import search as search_route
 from .routes import sync as sync_route
+from .services.ingest_pool import shutdown_pool
+from .utils.http import aclose_http_client, http_client
 from .utils.jwt import get_user_id_from_cookie
+from .utils.redis_client import aclose_redis
 from .utils.security import decrypt, encrypt
 
 # from pinecone import Pinecone
@@ -60,6 +62,14 @@ api.include_router(email_route.router)
 app.include_router(api)
 
 
+@app.on_event("shutdown")
+async def _close_shared_clients():
+    await aclose_http_client()
+    await aclose_redis()
+    await aclose_async_engine()
+    shutdown_pool(wait=False)
+
+
 @api.get("/")
 def root():
 
@@ -75,9 +85,8 @@ async def debug_scopes(request: Request, db: Session = Depends(get_db)):
     acct = db.query(models.GmailAccount).filter(
         models.GmailAccount.user_id == uid).first()
     access = decrypt(acct.access_token)
-    async with httpx.AsyncClient() as client:
-        r = await client.get("https://www.googleapis.com/oauth2/v3/tokeninfo", params={"access_token": access})
-        return r.json()
+    r = await http_client().get("https://www.googleapis.com/oauth2/v3/tokeninfo", params={"access_token": access})
+    return r.json()
 
 
 @api.get("/auth/debug/whoami")
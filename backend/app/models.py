@@ -1,8 +1,8 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import (Column, DateTime, Enum, ForeignKey, Index, Integer,
-                        String, Text, UniqueConstraint)
+from sqlalchemy import (Column, DateTime, Enum, Float, ForeignKey, Index, Integer,
+                        LargeBinary, String, Text, UniqueConstraint, text)
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -50,14 +50,27 @@ class GmailAccount(Base):
     token_updated_at: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True))
 
+    # incremental sync scheduler (services/sync_schedule.py): decayed mailbox
+    # change rate (changes/hour) and when to look at the account next
+    change_rate: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0.0, server_default="0")
+    last_checked_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True))
+    next_sync_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True))
+
     user = relationship("User", back_populates="gmail_accounts")
     emails = relationship("EmailMessage", back_populates="gmail_account",
                           cascade="all, delete-orphan",
                           passive_deletes=True)
+    sync_runs = relationship("SyncRun", back_populates="gmail_account",
+                             cascade="all, delete-orphan",
+                             passive_deletes=True)
 
     __table_args__ = (
         UniqueConstraint("user_id", "google_user_id",
                          name="uq_user_google_user"),
+        Index("ix_gmail_account_next_sync", "next_sync_at"),
     )
 
 
@@ -81,10 +94,6 @@ class EmailMessage(Base):
 
     date: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
     snippet: Mapped[str | None] = mapped_column(Text)
-    headers_json: Mapped[dict | None] = mapped_column(JSONB)
-
-    body_text: Mapped[str | None] = mapped_column(Text)
-    body_html: Mapped[str | None] = mapped_column(Text)
 
     size_estimate: Mapped[int | None] = mapped_column(Integer)
     label_ids: Mapped[list[str] | None] = mapped_column(ARRAY(String))
@@ -92,15 +101,80 @@ class EmailMessage(Base):
     hash_dedup: Mapped[str | None] = mapped_column(String(64))
     indexed_at: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True))
+    # vectors `{message_id}#0..n-1` written when indexed (NULL: not recorded)
+    chunk_count: Mapped[int | None] = mapped_column(Integer)
+    # NULL while the row only holds headers (metadata-first sync) or its
+    # stored body is not indexed yet; set together with indexed_at
+    hydrated_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True))
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=datetime.utcnow)
 
     gmail_account = relationship("GmailAccount", back_populates="emails")
+    # never loaded implicitly: only the email detail view reads bodies
+    body = relationship("EmailBody", uselist=False, lazy="raise",
+                        passive_deletes=True)
 
     __table_args__ = (
         Index("ix_email_gmail_date", "gmail_account_id", "date"),
+        Index("ix_email_gmail_message", "gmail_account_id", "message_id"),
         Index("ix_email_labels", "label_ids", postgresql_using="gin"),
         Index("ix_email_hash", "hash_dedup"),
+        Index("ix_email_unhydrated", "gmail_account_id", "date", "message_id",
+              postgresql_where=text("hydrated_at IS NULL")),
+    )
+
+
+class EmailBody(Base):
+    """
+    Bodies and full headers of an EmailMessage, zstd-compressed
+    (app/utils/body_codec.py). Kept out of email_message so list, search and
+    chat queries only read narrow rows.
+    """
+    __tablename__ = "email_body"
+
+    message_id: Mapped[str] = mapped_column(
+        String(128), ForeignKey("email_message.message_id", ondelete="CASCADE"),
+        primary_key=True)
+    body_text_z: Mapped[bytes | None] = mapped_column(LargeBinary)
+    body_html_z: Mapped[bytes | None] = mapped_column(LargeBinary)
+    headers_json_z: Mapped[bytes | None] = mapped_column(LargeBinary)
+
+
+class SyncRun(Base):
+    """Checkpoint of a (possibly interrupted) sync, so a restart can resume it."""
+    __tablename__ = "sync_run"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    gmail_account_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("gmail_account.id"), nullable=False)
+
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    state: Mapped[str] = mapped_column(String(32), nullable=False)
+    query: Mapped[str | None] = mapped_column(Text)
+
+    # listing page to resume from; every id before it has been handled
+    page_token: Mapped[str | None] = mapped_column(String(256))
+    processed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total: Mapped[int | None] = mapped_column(Integer)
+    # last message id (in listing order) covered by the checkpoint
+    high_water_mark: Mapped[str | None] = mapped_column(String(128))
+    resume_count: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False)
+    error: Mapped[str | None] = mapped_column(Text)
+
+    started_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.utcnow)
+    finished_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True))
+
+    gmail_account = relationship("GmailAccount", back_populates="sync_runs")
+
+    __table_args__ = (
+        Index("ix_sync_run_account_started", "gmail_account_id", "started_at"),
     )
 
 
@@ -146,3 +220,23 @@ class ChatMessage(Base):
 
 Index("ix_chat_messages_session_created",
       ChatMessage.chat_session_id, ChatMessage.created_at)
+
+
+class EmbeddingCache(Base):
+    """Embedding vectors keyed by sha256(model, dims, normalized text)."""
+    __tablename__ = "embedding_cache"
+
+    key: Mapped[bytes] = mapped_column(LargeBinary(32), primary_key=True)
+    model: Mapped[str] = mapped_column(String(128), nullable=False)
+    dims: Mapped[int] = mapped_column(Integer, nullable=False)
+    # "float32" | "float16", little-endian
+    dtype: Mapped[str] = mapped_column(String(8), nullable=False)
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.utcnow)
+    last_used_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_embedding_cache_last_used", "last_used_at"),
+    )
@@ -69,7 +69,7 @@ async def google_callback(code: str | None = None, state: str | None = None, req
             access_token=enc_access,
             refresh_token=enc_refresh,
             expiry=expiry,
-            token_scope=settings.GOOGLE_OAUTH_SCOPES,
+            token_scope=raw.get("scope") or settings.GOOGLE_OAUTH_SCOPES,
         )
         db.add(acct)
     else:
@@ -78,7 +78,7 @@ async def google_callback(code: str | None = None, state: str | None = None, req
         if enc_refresh:
             acct.refresh_token = enc_refresh
             acct.expiry = expiry
-            acct.token_scope = settings.GOOGLE_OAUTH_SCOPES
+            acct.token_scope = raw.get("scope") or settings.GOOGLE_OAUTH_SCOPES
 
     db.commit()
 
@@ -7,15 +7,15 @@ from typing import AsyncGenerator, List, Optional
 from fastapi import (APIRouter, Depends, HTTPException, Query, Request,
                      Response, status)
 from fastapi.responses import StreamingResponse
-from sqlalchemy import and_, or_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
-from ..db import get_db
+from ..db import async_session, get_async_db
 from ..services.rag import (_load_chat_history,
                             build_context_and_pills_from_message_ids,
                             build_messages, collapse_chunk_matches_to_messages)
-from ..utils.embeddings import embed_text
+from ..utils.embeddings import embed_query
 from ..utils.jwt import get_user_id_from_cookie
 from ..utils.llm import stream_chat
 from ..utils.time import utcnow
@@ -34,51 +34,49 @@ def _require_user(request: Request) -> str:
 
 
 @router.post("")
-async def create_chat(request: Request, db: Session = Depends(get_db)):
+async def create_chat(request: Request, db: AsyncSession = Depends(get_async_db)):
     uid = _require_user(request)
     cs = models.ChatSession(user_id=uid, title=None, created_at=datetime.now(
         timezone.utc), updated_at=datetime.now(timezone.utc))
     db.add(cs)
-    db.commit()
+    await db.commit()
     return {"id": str(cs.id)}
 
 
 @router.get("")
-async def list_chats(request: Request, db: Session = Depends(get_db)):
+async def list_chats(request: Request, db: AsyncSession = Depends(get_async_db)):
     uid = _require_user(request)
-    rows = (
-        db.query(models.ChatSession)
-        .filter(models.ChatSession.user_id == uid)
+    rows = (await db.scalars(
+        select(models.ChatSession)
+        .where(models.ChatSession.user_id == uid)
         .order_by(models.ChatSession.updated_at.desc())
-        .all()
-    )
+    )).all()
     return [{"id": str(r.id), "title": r.title, "updated_at": r.updated_at.isoformat()} for r in rows]
 
 
 @router.delete("/{chat_id}")
-async def delete_chat(chat_id: str, request: Request, db: Session = Depends(get_db)):
+async def delete_chat(chat_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     uid = _require_user(request)
-    row = (
-        db.query(models.ChatSession)
-        .filter(models.ChatSession.id == chat_id, models.ChatSession.user_id == uid)
-        .one_or_none()
-    )
+    row = (await db.scalars(
+        select(models.ChatSession)
+        .where(models.ChatSession.id == chat_id, models.ChatSession.user_id == uid)
+    )).one_or_none()
     if not row:
         raise HTTPException(status_code=404, detail="Chat not found")
-    db.delete(row)
-    db.commit()
+    await db.delete(row)
+    await db.commit()
     return {"ok": True}
 # --- SSE ask ---
 
 
 @router.get("/{chat_id}/ask")
-async def chat_ask(chat_id: str, request: Request, q: str, db: Session = Depends(get_db)):
+async def chat_ask(chat_id: str, request: Request, q: str,
+                   db: AsyncSession = Depends(get_async_db)):
     uid = _require_user(request)
-    chat = (
-        db.query(models.ChatSession)
-        .filter(models.ChatSession.id == chat_id, models.ChatSession.user_id == uid)
-        .one_or_none()
-    )
+    chat = (await db.scalars(
+        select(models.ChatSession)
+        .where(models.ChatSession.id == chat_id, models.ChatSession.user_id == uid)
+    )).one_or_none()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     chat_id_str = str(chat.id)
@@ -95,21 +93,23 @@ async def chat_ask(chat_id: str, request: Request, q: str, db: Session = Depends
         created_at=datetime.now(timezone.utc),
     )
     db.add(user_msg)
-    db.commit()
-    acct = db.query(models.GmailAccount).filter(
-        models.GmailAccount.user_id == uid).first()
+    await db.commit()
+    acct = (await db.scalars(
+        select(models.GmailAccount).where(models.GmailAccount.user_id == uid).limit(1)
+    )).first()
     if not acct:
         raise HTTPException(status_code=400, detail="No linked Gmail account")
-    history = _load_chat_history(db, chat_id_str)  # load NOW
+    acct_id = acct.id
+    history = await _load_chat_history(db, chat_id_str)  # load NOW
 
     async def event_stream() -> AsyncGenerator[bytes, None]:
         yield b"event: state\n"
         yield b"data: {\"value\": \"searching\"}\n\n"
-        qvec = await embed_text(question)
+        qvec = await embed_query(question)
         matches = []
         if qvec is not None:
             matches = await query_top_k(
-                namespace=str(acct.id),
+                namespace=str(acct_id),
                 vector=qvec,
                 top_k=24,
                 filter={"type": {"$eq": "email_chunk"}},
@@ -117,8 +117,10 @@ async def chat_ask(chat_id: str, request: Request, q: str, db: Session = Depends
 
         msg_rows = collapse_chunk_matches_to_messages(
             matches, top_k_messages=8, min_score=0.2)
-        context, pills = build_context_and_pills_from_message_ids(
-            db, acct_id=acct.id, message_rows=msg_rows)
+        # own sessions: the request's is closed once streaming starts
+        async with async_session() as sdb:
+            context, pills = await build_context_and_pills_from_message_ids(
+                sdb, acct_id=acct_id, message_rows=msg_rows)
 
         yield b"event: state\n"
         yield b"data: {\"value\": \"answering\"}\n\n"
@@ -133,8 +135,7 @@ async def chat_ask(chat_id: str, request: Request, q: str, db: Session = Depends
             yield b"event: message\ndata: " + json.dumps({"delta": delta}).encode() + b"\n\n"
         final_text = "".join(parts)
 
-        from app.db import SessionLocal
-        with SessionLocal() as db2:
+        async with async_session() as db2:
             asst_msg = models.ChatMessage(
                 chat_session_id=chat_id_str,
                 role="assistant",
@@ -144,16 +145,18 @@ async def chat_ask(chat_id: str, request: Request, q: str, db: Session = Depends
             )
             db2.add(asst_msg)
             # update title if empty
-            db2.query(models.ChatSession).filter(
-                models.ChatSession.id == chat_id_str,
-                models.ChatSession.user_id == uid,
-            ).update(
-                {
-                    models.ChatSession.title: (q[:60] if not chat_title else chat_title),
-                    models.ChatSession.updated_at: utcnow(),
-                }
+            await db2.execute(
+                update(models.ChatSession)
+                .where(
+                    models.ChatSession.id == chat_id_str,
+                    models.ChatSession.user_id == uid,
+                )
+                .values(
+                    title=(q[:60] if not chat_title else chat_title),
+                    updated_at=utcnow(),
+                )
             )
-            db2.commit()
+            await db2.commit()
 
         chat_payload = {"id": chat_id_str, "title": (
             q[:60] if not chat_title else chat_title), "updated_at": utcnow().isoformat()}
@@ -168,7 +171,7 @@ async def chat_ask(chat_id: str, request: Request, q: str, db: Session = Depends
 async def list_chat_messages(
     chat_id: str,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     limit: int = Query(100, ge=1, le=200),
     after: Optional[str] = Query(
         None, description="Return messages strictly after this message_id (cursor)"),
@@ -180,29 +183,27 @@ async def list_chat_messages(
     """
     uid = _require_user(request)
 
-    chat = (
-        db.query(models.ChatSession)
-        .filter(models.ChatSession.id == chat_id, models.ChatSession.user_id == uid)
-        .one_or_none()
-    )
+    chat = (await db.scalars(
+        select(models.ChatSession)
+        .where(models.ChatSession.id == chat_id, models.ChatSession.user_id == uid)
+    )).one_or_none()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
 
     q = (
-        db.query(models.ChatMessage)
-        .filter(models.ChatMessage.chat_session_id == chat_id)
+        select(models.ChatMessage)
+        .where(models.ChatMessage.chat_session_id == chat_id)
     )
 
     if after:
-        anchor = (
-            db.query(models.ChatMessage)
-            .filter(models.ChatMessage.id == after, models.ChatMessage.chat_session_id == chat_id)
-            .one_or_none()
-        )
+        anchor = (await db.scalars(
+            select(models.ChatMessage)
+            .where(models.ChatMessage.id == after, models.ChatMessage.chat_session_id == chat_id)
+        )).one_or_none()
         if not anchor:
             raise HTTPException(
                 status_code=400, detail="Invalid 'after' cursor")
-        q = q.filter(
+        q = q.where(
             or_(
                 models.ChatMessage.created_at > anchor.created_at,
                 and_(
@@ -215,7 +216,7 @@ async def list_chat_messages(
     q = q.order_by(models.ChatMessage.created_at.asc(),
                    models.ChatMessage.id.asc()).limit(limit)
 
-    rows: List[models.ChatMessage] = q.all()
+    rows: List[models.ChatMessage] = list((await db.scalars(q)).all())
 
     next_cursor = rows[-1].id if rows and len(rows) == limit else None
 
@@ -1,11 +1,16 @@
 # app/routes/emails.py
+from datetime import datetime
+
 from app import models
-from app.db import get_db
+from app.db import get_async_db
+from app.utils.body_codec import decompress_json, decompress_text
 from app.utils.jwt import get_user_id_from_cookie
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only
 
-from ..schemas import EmailDetail
+from ..schemas import EmailDetail, EmailList, EmailSummary
 
 router = APIRouter(prefix="/emails", tags=["emails"])
 
@@ -18,6 +23,14 @@ def _ensure_uid(request: Request) -> str:
     return uid
 
 
+async def _account_ids(db: AsyncSession, uid: str) -> list:
+    acct_ids = list((await db.scalars(
+        select(models.GmailAccount.id).where(models.GmailAccount.user_id == uid))).all())
+    if not acct_ids:
+        raise HTTPException(400, "No linked Gmail account")
+    return acct_ids
+
+
 def _gmail_web_url(message_id: str | None, thread_id: str | None) -> str | None:
     if message_id:
         return f"https://mail.google.com/mail/u/0/#inbox/{message_id}"
@@ -27,6 +40,7 @@ def _gmail_web_url(message_id: str | None, thread_id: str | None) -> str | None:
 
 
 def _to_detail(row: models.EmailMessage) -> EmailDetail:
+    body = row.body
     return EmailDetail(
         id=str(row.id),
         gmail_account_id=str(row.gmail_account_id),
@@ -39,43 +53,99 @@ def _to_detail(row: models.EmailMessage) -> EmailDetail:
         bcc=row.bcc,
         date=row.date.isoformat() if row.date else None,
         snippet=row.snippet,
-        body_text=row.body_text,
-        body_html=row.body_html,
-        headers_json=row.headers_json,
+        body_text=decompress_text(body.body_text_z) if body else None,
+        body_html=decompress_text(body.body_html_z) if body else None,
+        headers_json=decompress_json(body.headers_json_z) if body else None,
         label_ids=row.label_ids,
         gmail_web_url=_gmail_web_url(row.message_id, row.thread_id),
     )
 
 
+def _to_summary(row: models.EmailMessage) -> EmailSummary:
+    return EmailSummary(
+        id=str(row.id),
+        message_id=row.message_id,
+        thread_id=row.thread_id,
+        subject=row.subject,
+        from_addr=row.from_addr,
+        to_addr=row.to_addr,
+        date=row.date.isoformat() if row.date else None,
+        snippet=row.snippet,
+        label_ids=row.label_ids,
+        hydrated=row.hydrated_at is not None,
+    )
+
+
+@router.get("", response_model=EmailList)
+async def list_emails(
+    request: Request,
+    sender: str | None = Query(None, alias="from"),
+    subject: str | None = None,
+    label: str | None = None,
+    after: datetime | None = None,
+    before: datetime | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Browse by header fields, newest first; works on header-only rows too."""
+    uid = _ensure_uid(request)
+    acct_ids = await _account_ids(db, uid)
+
+    E = models.EmailMessage
+    conds = [E.gmail_account_id.in_(acct_ids)]
+    if sender:
+        conds.append(E.from_addr.ilike(f"%{sender}%"))
+    if subject:
+        conds.append(E.subject.ilike(f"%{subject}%"))
+    if label:
+        conds.append(E.label_ids.any(label))
+    if after:
+        conds.append(E.date >= after)
+    if before:
+        conds.append(E.date < before)
+
+    total = await db.scalar(select(func.count()).select_from(E).where(*conds))
+    rows = (await db.scalars(
+        select(E)
+        .options(load_only(E.id, E.message_id, E.thread_id, E.subject, E.from_addr,
+                           E.to_addr, E.date, E.snippet, E.label_ids, E.hydrated_at))
+        .where(*conds)
+        .order_by(E.date.desc().nulls_last(), E.id)
+        .offset(offset).limit(limit)
+    )).all()
+    return EmailList(items=[_to_summary(r) for r in rows], total=total)
+
+
 @router.get("/{email_id}", response_model=EmailDetail, response_model_exclude_none=True)
-async def get_email_by_db_id(email_id: str, request: Request, db: Session = Depends(get_db)):
+async def get_email_by_db_id(email_id: str, request: Request,
+                             db: AsyncSession = Depends(get_async_db)):
     uid = _ensure_uid(request)
-    acct_ids = [a.id for a in db.query(models.GmailAccount).filter(
-        models.GmailAccount.user_id == uid).all()]
-    if not acct_ids:
-        raise HTTPException(400, "No linked Gmail account")
+    acct_ids = await _account_ids(db, uid)
 
-    row = (db.query(models.EmailMessage)
-             .filter(models.EmailMessage.id == email_id,
-                     models.EmailMessage.gmail_account_id.in_(acct_ids))
-             .one_or_none())
+    row = (await db.scalars(
+        select(models.EmailMessage)
+        .options(joinedload(models.EmailMessage.body))
+        .where(models.EmailMessage.id == email_id,
+               models.EmailMessage.gmail_account_id.in_(acct_ids))
+    )).one_or_none()
     if not row:
         raise HTTPException(404, "Email not found")
     return _to_detail(row)
 
 
 @router.get("/by-gmail/{message_id}", response_model=EmailDetail, response_model_exclude_none=True)
-async def get_email_by_message_id(message_id: str, request: Request, db: Session = Depends(get_db)):
+async def get_email_by_message_id(message_id: str, request: Request,
+                                  db: AsyncSession = Depends(get_async_db)):
     uid = _ensure_uid(request)
-    acct_ids = [a.id for a in db.query(models.GmailAccount).filter(
-        models.GmailAccount.user_id == uid).all()]
-    if not acct_ids:
-        raise HTTPException(400, "No linked Gmail account")
+    acct_ids = await _account_ids(db, uid)
 
-    row = (db.query(models.EmailMessage)
-             .filter(models.EmailMessage.message_id == message_id,
-                     models.EmailMessage.gmail_account_id.in_(acct_ids))
-             .one_or_none())
+    row = (await db.scalars(
+        select(models.EmailMessage)
+        .options(joinedload(models.EmailMessage.body))
+        .where(models.EmailMessage.message_id == message_id,
+               models.EmailMessage.gmail_account_id.in_(acct_ids))
+    )).one_or_none()
     if not row:
         raise HTTPException(404, "Email not found")
     return _to_detail(row)
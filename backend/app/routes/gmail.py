@@ -27,7 +27,7 @@ def _get_acct(request: Request, db: Session) -> models.GmailAccount:
 @router.get("/list")
 async def list_ids(request: Request, db: Session = Depends(get_db)):
     acct = _get_acct(request, db)
-    client = GmailClient(db, acct)
+    client = GmailClient(acct)
     ids = []
     async for mid in client.list_message_ids():
         ids.append(mid)
@@ -37,6 +37,6 @@ async def list_ids(request: Request, db: Session = Depends(get_db)):
 @router.get("/message/{message_id}")
 async def get_message(message_id: str, request: Request, db: Session = Depends(get_db)):
     acct = _get_acct(request, db)
-    client = GmailClient(db, acct)
+    client = GmailClient(acct)
     full = await client.get_message_full(message_id)
     return full
@@ -1,6 +1,10 @@
 from fastapi import APIRouter
 
 from ..schemas import HealthOut
+from ..services.sync_lease import lease_metrics
+from ..utils.embedding_cache import cache_stats
+from ..utils.http import pool_stats
+from ..utils.query_cache import query_cache_stats
 
 router = APIRouter(prefix="/health", tags=["health"])
 
@@ -8,3 +12,24 @@ router = APIRouter(prefix="/health", tags=["health"])
 @router.get("/", response_model=HealthOut)
 def healthcheck():
     return {"status": "ok"}
+
+
+@router.get("/http-pool")
+def http_pool():
+    return pool_stats()
+
+
+@router.get("/embedding-cache")
+def embedding_cache_stats():
+    return cache_stats()
+
+
+@router.get("/query-cache")
+def query_cache_metrics():
+    return query_cache_stats()
+
+
+@router.get("/sync-leases")
+async def sync_lease_metrics():
+    # acquired / coalesced / skipped / reruns / lost, over all accounts
+    return await lease_metrics()
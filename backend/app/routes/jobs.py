@@ -4,24 +4,35 @@ from app.celery_app import celery_app
 from app.tasks.sync_tasks import (incremental_sync_account,
                                   schedule_incremental_for_all)
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
-from ..db import get_db
+from ..db import get_async_db
+from ..services.sync_lease import coalesce_if_running
 from ..utils.jwt import get_user_id_from_cookie
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
 
-@router.post("/incremental")
-async def kickoff_incremental(request: Request, db: Session = Depends(get_db)):
+async def _account(request: Request, db: AsyncSession) -> models.GmailAccount:
     uid = get_user_id_from_cookie(request)
     if not uid:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    acct = db.query(models.GmailAccount).filter(
-        models.GmailAccount.user_id == uid).first()
+    acct = (await db.scalars(
+        select(models.GmailAccount).where(models.GmailAccount.user_id == uid).limit(1)
+    )).first()
     if not acct:
         raise HTTPException(status_code=400, detail="No linked Gmail account")
+    return acct
+
+
+@router.post("/incremental")
+async def kickoff_incremental(request: Request, db: AsyncSession = Depends(get_async_db)):
+    acct = await _account(request, db)
+    # a running sync re-runs once when it finishes instead
+    if await coalesce_if_running(str(acct.id), "incremental"):
+        return {"ok": True, "coalesced": True}
     # incremental_sync_account.delay(str(acct.id))
     celery_app.send_task(
         'app.tasks.sync_tasks.incremental_sync_account', args=[str(acct.id)])
@@ -29,6 +40,18 @@ async def kickoff_incremental(request: Request, db: Session = Depends(get_db)):
     return {"ok": True}
 
 
+@router.post("/initial")
+async def kickoff_initial(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Sharded initial sync: a coordinator task fans the mailbox out to workers."""
+    acct = await _account(request, db)
+    # a second click while a sync runs must not fan out a second coordinator
+    if await coalesce_if_running(str(acct.id), "initial"):
+        return {"ok": True, "coalesced": True}
+    celery_app.send_task(
+        'app.tasks.sync_tasks.initial_sync_coordinator', args=[str(acct.id)])
+    return {"ok": True}
+
+
 @router.post("/incremental/all")
 async def kickoff_all():
     # schedule_incremental_for_all.delay()
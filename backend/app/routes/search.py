@@ -3,11 +3,13 @@ from __future__ import annotations
 from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
 from .. import models
-from ..db import get_db
-from ..utils.embeddings import embed_text
+from ..db import get_async_db
+from ..utils.embeddings import embed_query
 from ..utils.jwt import get_user_id_from_cookie
 from ..utils.vectorstore import query_top_k
 
@@ -54,21 +56,21 @@ async def search_emails(
     q: str = Query(..., min_length=1),
     topK: int = Query(8, ge=1, le=50),
     request: Request = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     uid = get_user_id_from_cookie(request)
     if not uid:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    acct = (
-        db.query(models.GmailAccount)
-        .filter(models.GmailAccount.user_id == uid)
-        .first()
-    )
+    acct = (await db.scalars(
+        select(models.GmailAccount)
+        .where(models.GmailAccount.user_id == uid)
+        .limit(1)
+    )).first()
     if not acct:
         raise HTTPException(status_code=400, detail="No linked Gmail account")
 
-    vec = await embed_text(q)
+    vec = await embed_query(q)
     if vec is None:
         return {"query": q, "results": []}
 
@@ -85,14 +87,16 @@ async def search_emails(
     if not mids:
         return {"query": q, "results": []}
 
-    rows = (
-        db.query(models.EmailMessage)
-        .filter(
-            models.EmailMessage.gmail_account_id == acct.id,
-            models.EmailMessage.message_id.in_(mids),
+    E = models.EmailMessage
+    rows = (await db.scalars(
+        select(E)
+        .options(load_only(E.id, E.message_id, E.thread_id, E.subject,
+                           E.from_addr, E.date, E.snippet))
+        .where(
+            E.gmail_account_id == acct.id,
+            E.message_id.in_(mids),
         )
-        .all()
-    )
+    )).all()
     by_mid = {r.message_id: r for r in rows}
 
     results: List[Dict[str, Any]] = []
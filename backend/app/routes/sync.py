@@ -1,84 +1,149 @@
+import json
+import uuid
+from typing import AsyncGenerator
+
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
-from ..db import SessionLocal, get_db
+from ..celery_app import celery_app
+from ..config import settings
+from ..db import async_session, get_async_db
+from ..services.progress import progress_channel, read_progress
+from ..services.sync_lease import coalesce_if_running, lease_status, run_exclusive
+from ..services.sync_runs import latest_run, run_summary
 from ..services.sync_service import SyncService
 from ..utils.jwt import get_user_id_from_cookie
+from ..utils.redis_client import get_redis
 
 router = APIRouter(prefix="/sync", tags=["sync"])
 
+# comment line sent on an idle stream so proxies keep it open
+KEEPALIVE_S = 15
+
+
+async def _account(db: AsyncSession, uid: str) -> models.GmailAccount:
+    acct = (await db.scalars(
+        select(models.GmailAccount).where(models.GmailAccount.user_id == uid).limit(1)
+    )).first()
+    if not acct:
+        raise HTTPException(status_code=400, detail="No linked Gmail account")
+    return acct
+
 
 async def _run_initial(acct_id: str):
-    db = SessionLocal()
-    try:
-        acct = db.query(models.GmailAccount).filter(
-            models.GmailAccount.id == acct_id).one_or_none()
+    async with async_session() as db:
+        acct = await db.get(models.GmailAccount, uuid.UUID(acct_id))
         if not acct:
             return
         svc = SyncService(db, acct)
-        await svc.initial_sync()
-    finally:
-        db.close()
+        await run_exclusive(acct_id, "initial", svc.initial_sync, svc.incremental_sync)
 
 
 @router.post("/initial")
-async def start_initial_sync(background: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def start_initial_sync(background: BackgroundTasks, request: Request,
+                             db: AsyncSession = Depends(get_async_db)):
     uid = get_user_id_from_cookie(request)
     if not uid:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    acct = db.query(models.GmailAccount).filter(
-        models.GmailAccount.user_id == uid).first()
-    if not acct:
-        raise HTTPException(status_code=400, detail="No linked Gmail account")
+    acct = await _account(db, uid)
 
+    if await coalesce_if_running(str(acct.id), "initial"):
+        return {"ok": True, "coalesced": True}
+    if settings.SYNC_INITIAL_VIA_CELERY:
+        # sharded across Celery workers (tasks/sync_tasks.py)
+        celery_app.send_task(
+            'app.tasks.sync_tasks.initial_sync_coordinator', args=[str(acct.id)])
+        return {"ok": True, "sharded": True}
     background.add_task(_run_initial, str(acct.id))
     return {"ok": True}
 
 
 @router.get("/status")
-async def sync_status(request: Request, db: Session = Depends(get_db)):
+async def sync_status(request: Request, db: AsyncSession = Depends(get_async_db)):
     uid = get_user_id_from_cookie(request)
     if not uid:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    acct = db.query(models.GmailAccount).filter(
-        models.GmailAccount.user_id == uid).first()
-    if not acct:
-        raise HTTPException(status_code=400, detail="No linked Gmail account")
+    acct = await _account(db, uid)
 
-    from ..services.sync_service import SyncService
-    prog = SyncService.get_progress(str(acct.id))
-    count = db.query(models.EmailMessage).filter(
-        models.EmailMessage.gmail_account_id == acct.id).count()
-    prog["db_emails"] = count
+    prog = await read_progress(str(acct.id))
+    # counts are recorded by the sync itself; only count when none is known yet
+    E = models.EmailMessage
+    count = select(func.count()).select_from(E).where(E.gmail_account_id == acct.id)
+    if "db_emails" not in prog:
+        prog["db_emails"] = await db.scalar(count)
+    if "db_bodies_pending" not in prog:
+        # header-only rows still waiting for the body phase
+        prog["db_bodies_pending"] = await db.scalar(count.where(E.hydrated_at.is_(None)))
     prog["history_id"] = acct.history_id
+    # persisted checkpoint: survives restarts, shows which run is being resumed
+    prog["run"] = run_summary(await latest_run(db, acct.id))
+    prog["lease"] = await lease_status(str(acct.id))
     return prog
 
 
+@router.get("/stream")
+async def sync_stream(request: Request):
+    """
+    Server-sent events: one `snapshot` with the full progress, then a
+    `progress` event per delta pushed by whichever worker runs the sync.
+    """
+    uid = get_user_id_from_cookie(request)
+    if not uid:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    # not Depends(get_async_db): that session would stay checked out for the
+    # whole life of the stream
+    async with async_session() as db:
+        acct_id = str((await _account(db, uid)).id)
+
+    async def event_stream() -> AsyncGenerator[bytes, None]:
+        pubsub = get_redis().pubsub()
+        # subscribe before the snapshot so no delta falls in between
+        await pubsub.subscribe(progress_channel(acct_id))
+        try:
+            snap = await read_progress(acct_id)
+            yield b"event: snapshot\ndata: " + json.dumps(snap, default=str).encode() + b"\n\n"
+            idle = 0.0
+            while not await request.is_disconnected():
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if msg is None:
+                    idle += 1.0
+                    if idle >= KEEPALIVE_S:
+                        yield b": keepalive\n\n"
+                        idle = 0.0
+                    continue
+                idle = 0.0
+                yield b"event: progress\ndata: " + msg["data"].encode() + b"\n\n"
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/incremental")
-async def run_incremental(background: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def run_incremental(background: BackgroundTasks, request: Request,
+                          db: AsyncSession = Depends(get_async_db)):
     uid = get_user_id_from_cookie(request)
     if not uid:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    acct = db.query(models.GmailAccount).filter(
-        models.GmailAccount.user_id == uid).first()
-    if not acct:
-        raise HTTPException(
-            status_code=400, detail="No linked Gmail account")
+    acct = await _account(db, uid)
 
     async def _task(acct_id: str):
-        from .. import models as M
-        from ..db import SessionLocal
-        local = SessionLocal()
-        try:
-            a = local.query(M.GmailAccount).filter(
-                M.GmailAccount.id == acct_id).one_or_none()
+        async with async_session() as local:
+            a = await local.get(models.GmailAccount, uuid.UUID(acct_id))
             if not a:
                 return
             svc = SyncService(local, a)
-            await svc.incremental_sync()
-        finally:
-            local.close()
+            # a sync already running for this account picks the request up
+            await run_exclusive(acct_id, "incremental",
+                                svc.incremental_sync, svc.incremental_sync)
 
-        background.add_task(_task, str(acct.id))
-        return {"ok": True}
+    background.add_task(_task, str(acct.id))
+    return {"ok": True}
@@ -17,6 +17,25 @@ class ChatMessageOut(BaseModel):
     created_at: datetime
 
 
+class EmailSummary(BaseModel):
+    id: str
+    message_id: str
+    thread_id: Optional[str] = None
+    subject: Optional[str] = None
+    from_addr: Optional[str] = None
+    to_addr: Optional[str] = None
+    date: Optional[str] = None
+    snippet: Optional[str] = None
+    label_ids: Optional[List[str]] = None
+    # False while only headers are synced (body not fetched yet)
+    hydrated: bool = True
+
+
+class EmailList(BaseModel):
+    items: List[EmailSummary]
+    total: int
+
+
 class EmailDetail(BaseModel):
     id: str
     gmail_account_id: str
@@ -0,0 +1,203 @@
+# app/services/bulk_writer.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..config import settings
+from ..utils.time import utcnow
+
+logger = logging.getLogger(__name__)
+
+EMAIL_TABLE = models.EmailMessage.__table__
+BODY_TABLE = models.EmailBody.__table__
+# row keys that belong to the message's email_body row
+_BODY_COLUMNS = frozenset(c.name for c in BODY_TABLE.c) - {"message_id"}
+
+# columns never overwritten when an existing message_id is upserted again
+_KEEP_ON_CONFLICT = {"id", "message_id", "gmail_account_id", "created_at"}
+
+
+class EmailBulkWriter:
+    """
+    Buffers EmailMessage rows and writes them with one
+    INSERT ... ON CONFLICT (message_id) DO UPDATE per batch.
+
+    Rows are keyed by column name (note `from`/`to`, not `from_addr`/`to_addr`);
+    email_body columns in a row are upserted into that table in the same
+    transaction. A conflicting row only has the columns present in `values` overwritten,
+    so a header-only row never blanks out a body that is already stored.
+    A batch is written when `max_rows` rows are pending or, while used as an
+    async context manager, every `interval_ms`. `mark_indexed()` (which also
+    sets `hydrated_at`: the message is done) and
+    `set_labels()` are buffered the same way and applied after pending rows,
+    so a message is never marked before its row exists.
+
+    Writes hold `lock`; pass the one guarding every other use of the same
+    AsyncSession (an AsyncSession allows one operation at a time).
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        *,
+        lock: Optional[asyncio.Lock] = None,
+        max_rows: Optional[int] = None,
+        interval_ms: Optional[int] = None,
+        on_error: Optional[Callable[[str, BaseException], None]] = None,
+    ):
+        self.db = db
+        self.lock = lock or asyncio.Lock()
+        self.max_rows = max_rows or settings.SYNC_WRITE_BATCH
+        self.interval = (interval_ms or settings.SYNC_WRITE_INTERVAL_MS) / 1000
+        self.on_error = on_error
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        self._indexed: Dict[str, Optional[int]] = {}
+        self._labels: Dict[str, List[str]] = {}
+        self._last_flush = time.monotonic()
+        self._ticker: Optional[asyncio.Task] = None
+        self.written = 0
+
+    # --- buffering ---
+
+    async def add(self, values: Dict[str, Any]):
+        # last write wins: ON CONFLICT cannot touch the same row twice per statement
+        self._rows[values["message_id"]] = values
+        await self._maybe_flush()
+
+    async def mark_indexed(self, message_id: str, chunk_count: Optional[int] = None):
+        self._indexed[message_id] = chunk_count
+        await self._maybe_flush()
+
+    async def set_labels(self, message_id: str, label_ids: List[str]):
+        """Replace the label set of an existing row."""
+        self._labels[message_id] = label_ids
+        await self._maybe_flush()
+
+    def pending(self) -> int:
+        return len(self._rows) + len(self._indexed) + len(self._labels)
+
+    async def _maybe_flush(self):
+        # awaiting the write is the back-pressure on whoever adds rows
+        if self.pending() >= self.max_rows or \
+                time.monotonic() - self._last_flush >= self.interval:
+            await self.flush()
+
+    # --- writing ---
+
+    def _upsert_stmt(self, table, columns: Iterable[str]):
+        stmt = insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.message_id],
+            set_={name: stmt.excluded[name]
+                  for name in columns if name not in _KEEP_ON_CONFLICT},
+        )
+
+    async def _write_rows(self, rows: List[Dict[str, Any]]):
+        # rows of one batch share their keys (see _flush)
+        body_cols = [k for k in rows[0] if k in _BODY_COLUMNS]
+        email_rows = rows
+        if body_cols:
+            email_rows = [{k: v for k, v in r.items() if k not in _BODY_COLUMNS}
+                          for r in rows]
+        try:
+            await self.db.execute(
+                self._upsert_stmt(EMAIL_TABLE, email_rows[0].keys()), email_rows)
+            if body_cols:
+                await self.db.execute(
+                    self._upsert_stmt(BODY_TABLE, ["message_id", *body_cols]),
+                    [{"message_id": r["message_id"], **{k: r[k] for k in body_cols}}
+                     for r in rows])
+            await self.db.commit()
+            self.written += len(rows)
+            return
+        except Exception as e:
+            await self.db.rollback()
+            if len(rows) == 1:
+                self._fail(rows[0]["message_id"], e)
+                return
+            logger.warning("bulk upsert of %d rows failed (%r); retrying row by row",
+                           len(rows), e)
+        for row in rows:
+            await self._write_rows([row])
+
+    def _fail(self, message_id: str, exc: BaseException):
+        logger.error("email upsert failed for %s: %r", message_id, exc)
+        if self.on_error:
+            self.on_error(message_id, exc)
+
+    async def flush(self):
+        async with self.lock:
+            await self._flush()
+
+    async def _flush(self):
+        rows = list(self._rows.values())
+        indexed = self._indexed
+        labels = self._labels
+        self._rows = {}
+        self._indexed = {}
+        self._labels = {}
+        self._last_flush = time.monotonic()
+        # one statement per column set (full rows vs header-only rows)
+        shapes: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for row in rows:
+            shapes.setdefault(frozenset(row), []).append(row)
+        for group in shapes.values():
+            await self._write_rows(group)
+        if indexed:
+            try:
+                now = utcnow()
+                await self.db.execute(
+                    update(EMAIL_TABLE)
+                    .where(EMAIL_TABLE.c.message_id == bindparam("mid"))
+                    .values(indexed_at=bindparam("at"), hydrated_at=bindparam("at"),
+                            chunk_count=bindparam("chunks")),
+                    [{"mid": mid, "at": now, "chunks": n} for mid, n in indexed.items()],
+                )
+                await self.db.commit()
+            except Exception as e:
+                await self.db.rollback()
+                logger.error("marking %d messages indexed failed: %r",
+                             len(indexed), e)
+        if labels:
+            try:
+                await self.db.execute(
+                    update(EMAIL_TABLE)
+                    .where(EMAIL_TABLE.c.message_id == bindparam("mid"))
+                    .values(label_ids=bindparam("labels")),
+                    [{"mid": mid, "labels": ids} for mid, ids in labels.items()],
+                )
+                await self.db.commit()
+            except Exception as e:
+                await self.db.rollback()
+                logger.error("updating labels of %d messages failed: %r",
+                             len(labels), e)
+
+    # --- timed flushing ---
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.pending() and time.monotonic() - self._last_flush >= self.interval:
+                await self.flush()
+
+    async def __aenter__(self) -> "EmailBulkWriter":
+        self._ticker = asyncio.create_task(self._tick())
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._ticker:
+            self._ticker.cancel()
+            try:
+                await self._ticker
+            except asyncio.CancelledError:
+                pass
+            self._ticker = None
+        await self.flush()
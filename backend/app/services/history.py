@@ -0,0 +1,113 @@
+# app/services/history.py
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+
+@dataclass
+class NetChange:
+    """What happened to one message over a whole history window."""
+    message_id: str
+    added: bool = False
+    deleted: bool = False
+    # full label set from the latest record that carried one
+    labels: Optional[List[str]] = None
+    # label edits seen after `labels` (or with no full set at all)
+    labels_added: Set[str] = field(default_factory=set)
+    labels_removed: Set[str] = field(default_factory=set)
+
+    @property
+    def labels_changed(self) -> bool:
+        return self.labels is not None or bool(self.labels_added or self.labels_removed)
+
+    def final_labels(self, stored: Optional[Iterable[str]]) -> List[str]:
+        base = set(self.labels if self.labels is not None else (stored or []))
+        return sorted((base | self.labels_added) - self.labels_removed)
+
+
+class HistoryCoalescer:
+    """
+    Folds Gmail history records into one NetChange per message, so a
+    message added then deleted in the same window is never fetched, and
+    five label edits become one write.
+
+    Records must be fed in history order (pages in order, records within a
+    page in order).
+    """
+
+    def __init__(self):
+        self._changes: Dict[str, NetChange] = {}
+        self.latest_history_id = 0
+        self.records = 0
+
+    def _change(self, msg: Dict[str, Any]) -> Optional[NetChange]:
+        mid = msg.get("id")
+        if not mid:
+            return None
+        ch = self._changes.get(mid)
+        if ch is None:
+            ch = self._changes[mid] = NetChange(mid)
+        return ch
+
+    @staticmethod
+    def _set_labels(ch: NetChange, msg: Dict[str, Any]):
+        # every record's message carries its label set as of that change
+        if "labelIds" in msg:
+            ch.labels = list(msg.get("labelIds") or [])
+            ch.labels_added.clear()
+            ch.labels_removed.clear()
+
+    def add_records(self, records: Iterable[Dict[str, Any]]):
+        for h in records:
+            self.records += 1
+            try:
+                self.latest_history_id = max(self.latest_history_id, int(h.get("id", 0)))
+            except (TypeError, ValueError):
+                pass
+
+            for ma in h.get("messagesAdded") or []:
+                msg = ma.get("message") or {}
+                ch = self._change(msg)
+                if ch:
+                    ch.added = True
+                    self._set_labels(ch, msg)
+
+            for md in h.get("messagesDeleted") or []:
+                ch = self._change(md.get("message") or {})
+                if ch:
+                    ch.deleted = True
+
+            for key, adding in (("labelsAdded", True), ("labelsRemoved", False)):
+                for lr in h.get(key) or []:
+                    msg = lr.get("message") or {}
+                    ch = self._change(msg)
+                    if not ch:
+                        continue
+                    if "labelIds" in msg:
+                        self._set_labels(ch, msg)
+                        continue
+                    changed = set(lr.get("labelIds") or [])
+                    if adding:
+                        ch.labels_added |= changed
+                        ch.labels_removed -= changed
+                    else:
+                        ch.labels_removed |= changed
+                        ch.labels_added -= changed
+
+    # --- net change set ---
+
+    def deleted(self) -> List[str]:
+        return [mid for mid, ch in self._changes.items() if ch.deleted]
+
+    def added(self) -> List[str]:
+        """Messages to fetch: added in the window and still there at its end."""
+        return [mid for mid, ch in self._changes.items() if ch.added and not ch.deleted]
+
+    def relabeled(self) -> List[NetChange]:
+        """Messages that existed before the window and only had label edits."""
+        return [ch for ch in self._changes.values()
+                if not ch.added and not ch.deleted and ch.labels_changed]
+
+    def __len__(self) -> int:
+        return len(self._changes)
@@ -4,14 +4,13 @@ from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
 from app.services.chunking import _plain_text, chunk_text_by_tokens
-from app.utils.embeddings import embed_text
+from app.utils.embeddings import EmbeddingBatcher
 
 logger = logging.getLogger(__name__)
 
 
-async def build_email_vectors_async(
+def chunk_email(
     *,
-    embed_text,
     message_id: str,
     gmail_account_id: str,
     subject: Optional[str],
@@ -22,22 +21,24 @@ async def build_email_vectors_async(
     doc_hash: Optional[str],
     max_tokens_per_chunk: int = 600,
     overlap: int = 80,
-) -> List[Dict]:
-    text = _plain_text(subject, body_text)
-    if not text.strip():
-        return []
-    chunks = chunk_text_by_tokens(
-        text, max_tokens=max_tokens_per_chunk, overlap=overlap)
+    chunks: Optional[List[Tuple[str, int, int]]] = None,
+) -> List[Tuple[Dict, str]]:
+    """
+    Split one email into (vector_without_values, chunk_text) pairs.
+    The vector dicts carry id + metadata; "values" is filled in after embedding.
+    `chunks` (from the ingest pool) skips tokenizing here.
+    """
+    if chunks is None:
+        text = _plain_text(subject, body_text)
+        if not text.strip():
+            return []
+        chunks = chunk_text_by_tokens(
+            text, max_tokens=max_tokens_per_chunk, overlap=overlap)
 
-    vectors: List[Dict] = []
+    out: List[Tuple[Dict, str]] = []
     for idx, (chunk_text, start_tok, end_tok) in enumerate(chunks):
-        logger.info("Chunk text %s :", chunk_text)
-        vec = await embed_text(chunk_text)
-        if vec is None:
-            continue
-        vectors.append({
+        out.append(({
             "id": f"{message_id}#{idx}",
-            "values": vec,
             "metadata": {
                 "type": "email_chunk",
                 "message_id": message_id,
@@ -51,5 +52,44 @@ async def build_email_vectors_async(
                 "start_tok": start_tok,
                 "end_tok": end_tok,
             },
-        })
-    return vectors
+        }, chunk_text))
+    return out
+
+
+def estimate_embedding_tokens(subject: Optional[str], body_text: Optional[str]) -> int:
+    """Rough embedding tokens for one email (~4 chars/token, overlap ignored)."""
+    text = _plain_text(subject, body_text)
+    return len(text) // 4 if text.strip() else 0
+
+
+async def build_email_vectors_batch_async(emails: List[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Chunk and embed many emails at once. Each entry of `emails` takes the
+    keyword arguments of `chunk_email`. Chunks of all emails share embedding
+    requests (see EmbeddingBatcher); returns {message_id: vectors}, where
+    chunks that embed to None are dropped, as in the per-email path.
+    """
+    batcher = EmbeddingBatcher()
+    pending: Dict[str, List[Dict]] = {}
+    for email in emails:
+        mid = email["message_id"]
+        pending[mid] = []
+        for vector, chunk_text in chunk_email(**email):
+            meta = vector["metadata"]
+            batcher.add((mid, meta["chunk_index"]), chunk_text,
+                        meta["end_tok"] - meta["start_tok"])
+            pending[mid].append(vector)
+
+    embedded = await batcher.run() if len(batcher) else {}
+
+    out: Dict[str, List[Dict]] = {}
+    for mid, vectors in pending.items():
+        out[mid] = []
+        for vector in vectors:
+            vec = embedded.get((mid, vector["metadata"]["chunk_index"]))
+            if vec is None:
+                continue
+            vector["values"] = vec
+            out[mid].append(vector)
+    return out
+
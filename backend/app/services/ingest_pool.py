@@ -0,0 +1,188 @@
+# app/services/ingest_pool.py
+from __future__ import annotations
+
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from ..config import settings
+from ..utils.body_codec import compress_json, compress_text
+from ..utils.mime_parse import parse_message
+from .chunking import _plain_text, chunk_text_by_tokens
+
+logger = logging.getLogger(__name__)
+
+# Everything here runs in worker processes too: keep the imports light (no
+# DB, HTTP or model modules) so a spawned worker starts quickly.
+
+
+class ParsedRecord(NamedTuple):
+    """What a worker sends back for one `format=FULL` message: plain values
+    only, so it pickles as a flat tuple. Stored bodies come back already
+    compressed; `body_text` stays plain for token estimates."""
+    message_id: str
+    thread_id: Optional[str]
+    headers: Dict[str, str]
+    body_text: str
+    body_text_z: Optional[bytes]
+    body_html_z: Optional[bytes]
+    headers_json_z: Optional[bytes]
+    doc_hash: str
+    date: Optional[datetime.datetime]
+    snippet: Optional[str]
+    size_estimate: Optional[int]
+    label_ids: List[str]
+    # (chunk_text, start_tok, end_tok) as chunk_text_by_tokens returns them
+    chunks: Optional[List[Tuple[str, int, int]]]
+
+
+def message_date(headers_map: Dict[str, str], gmsg: Dict[str, Any]) -> Optional[datetime.datetime]:
+    date_hdr = headers_map.get("date")
+    if date_hdr:
+        try:
+            return parsedate_to_datetime(date_hdr)
+        except Exception:
+            pass
+    # no usable Date header: fall back to when Gmail received it
+    internal = gmsg.get("internalDate")
+    if internal:
+        try:
+            return datetime.datetime.fromtimestamp(int(internal) / 1000, datetime.timezone.utc)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+def parse_full(gmsg: Dict[str, Any], *, chunk: bool = True) -> ParsedRecord:
+    """Decode, hash, compress and (optionally) chunk one `format=FULL` message."""
+    headers_map, body_text, body_html = parse_message(gmsg)
+
+    h = hashlib.sha256()
+    h.update(((headers_map.get("subject") or "") + "|" + (headers_map.get("from") or "") + "|" +
+             (body_text or "")).encode("utf-8", errors="ignore"))
+
+    chunks = None
+    if chunk:
+        text = _plain_text(headers_map.get("subject"), body_text)
+        chunks = chunk_text_by_tokens(text) if text.strip() else []
+    size_estimate = gmsg.get("sizeEstimate")
+    return ParsedRecord(
+        message_id=gmsg.get("id"),
+        thread_id=gmsg.get("threadId"),
+        headers=headers_map,
+        body_text=body_text or "",
+        body_text_z=compress_text(body_text),
+        body_html_z=compress_text(body_html),
+        headers_json_z=compress_json(headers_map),
+        doc_hash=h.hexdigest()[:64],
+        date=message_date(headers_map, gmsg),
+        snippet=gmsg.get("snippet"),
+        size_estimate=int(size_estimate) if size_estimate is not None else None,
+        label_ids=list(gmsg.get("labelIds") or []),
+        chunks=chunks,
+    )
+
+
+def _parse_batch(raws: List[bytes]) -> List[Union[ParsedRecord, Exception]]:
+    # runs in a worker: bytes in, records out; one failure doesn't sink the batch
+    out: List[Union[ParsedRecord, Exception]] = []
+    for raw in raws:
+        try:
+            out.append(parse_full(json.loads(raw)))
+        except Exception as e:
+            # plain ValueError: the original may not pickle
+            out.append(ValueError(f"parse failed: {e!r}"))
+    return out
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+# set once the pool can't be used in this process; parsing stays inline
+_inline_reason: Optional[str] = None
+# pools lost to dead workers; after MAX_BREAKS we stop restarting them
+_breaks = 0
+MAX_BREAKS = 3
+
+
+def _daemonic() -> bool:
+    """Celery prefork children are daemonic and may not start processes."""
+    if multiprocessing.current_process().daemon:
+        return True
+    try:
+        from billiard.process import current_process
+    except ImportError:
+        return False
+    return bool(current_process().daemon)
+
+
+def _go_inline(reason: str):
+    global _inline_reason
+    if _inline_reason is None:
+        logger.warning("ingest pool disabled in pid %s (%s); parsing in-process",
+                       os.getpid(), reason)
+    _inline_reason = reason
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool, _pool_pid
+    if settings.SYNC_PARSE_PROCESSES <= 0:
+        return None
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    if _inline_reason is not None:
+        return None
+    # a Celery worker already scales with its own concurrency: processes
+    # there would multiply to concurrency x SYNC_PARSE_PROCESSES
+    if _daemonic():
+        _go_inline("daemonic worker process")
+        return None
+    try:
+        # spawn, not fork: the parent runs an event loop and client threads
+        _pool = ProcessPoolExecutor(max_workers=settings.SYNC_PARSE_PROCESSES,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    except Exception as e:
+        _go_inline(repr(e))
+        return None
+    _pool_pid = os.getpid()
+    return _pool
+
+
+async def parse_many(raws: List[bytes]) -> List[Union[ParsedRecord, Exception]]:
+    """
+    Parse a batch of raw `format=FULL` JSON payloads in the process pool
+    (SYNC_PARSE_PROCESSES workers; 0, or a Celery worker process, parses on
+    the event loop). One call per batch keeps the pickling to one bytes list
+    out and one tuple list back.
+    """
+    global _breaks
+    pool = _get_pool()
+    if pool is None:
+        return _parse_batch(raws)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, _parse_batch, raws)
+    except BrokenProcessPool:
+        # a worker died (OOM, killed): start a fresh pool next time
+        _breaks += 1
+        shutdown_pool(wait=False)
+        if _breaks >= MAX_BREAKS:
+            _go_inline(f"pool broke {_breaks} times")
+        else:
+            logger.warning("ingest pool broken; restarting it")
+        return await asyncio.to_thread(_parse_batch, raws)
+
+
+def shutdown_pool(wait: bool = True):
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=wait, cancel_futures=True)
+    _pool = None
+    _pool_pid = None
@@ -0,0 +1,130 @@
+# app/services/known_ids.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 10_000
+
+
+def _as_u64(mid: str) -> Optional[int]:
+    """Gmail ids are 64-bit hex strings; pack them into an int when they are."""
+    if not mid or len(mid) > 16:
+        return None
+    try:
+        n = int(mid, 16)
+    except ValueError:
+        return None
+    # only canonical lowercase hex round-trips; anything else stays a string
+    return n if format(n, "x") == mid else None
+
+
+class KnownMessageIds:
+    """
+    The message_ids already stored for one Gmail account, used to diff a Gmail
+    listing without a query per id.
+
+    Ids are streamed in keyset pages and packed into sorted arrays of uint64
+    (8 bytes per id), one per hex length: pages come ordered by message_id,
+    and for canonical hex of one length that is numeric order, so each array
+    is filled already sorted and nothing is copied to sort it. If the account
+    has more than `max_ids` messages we stop preloading and answer `missing()`
+    with one IN query per chunk instead, holding `lock` (the one guarding
+    other uses of the session) for each.
+    """
+
+    def __init__(self, db: AsyncSession, acct_id, lock: Optional[asyncio.Lock] = None):
+        self.db = db
+        self.acct_id = acct_id
+        self.lock = lock or asyncio.Lock()
+        # hex length -> sorted ids of that length
+        self._packed: Dict[int, array] = {}
+        self._other: Set[str] = set()
+        self.preloaded = False
+
+    @classmethod
+    async def load(cls, db: AsyncSession, acct_id, max_ids: int,
+                   lock: Optional[asyncio.Lock] = None) -> "KnownMessageIds":
+        known = cls(db, acct_id, lock)
+        packed: Dict[int, array] = {}
+        unsorted: Set[int] = set()
+        count = 0
+        last = ""
+        while True:
+            async with known.lock:
+                rows = (await db.execute(
+                    select(models.EmailMessage.message_id)
+                    .where(
+                        models.EmailMessage.gmail_account_id == acct_id,
+                        models.EmailMessage.message_id > last,
+                    )
+                    .order_by(models.EmailMessage.message_id)
+                    .limit(PAGE_SIZE)
+                )).all()
+            if not rows:
+                break
+            for (mid,) in rows:
+                n = _as_u64(mid)
+                if n is None:
+                    known._other.add(mid)
+                    continue
+                arr = packed.get(len(mid))
+                if arr is None:
+                    arr = packed[len(mid)] = array("Q")
+                elif n < arr[-1]:
+                    # a collation that doesn't order hex like bytes
+                    unsorted.add(len(mid))
+                arr.append(n)
+            count += len(rows)
+            last = rows[-1][0]
+            if count > max_ids:
+                logger.info("account %s has > %d stored messages; diffing per chunk",
+                            acct_id, max_ids)
+                known._other.clear()
+                return known
+        for length in unsorted:
+            logger.warning("message ids of length %d not in order; sorting them", length)
+            packed[length] = array("Q", sorted(packed[length]))
+        known._packed = packed
+        known.preloaded = True
+        return known
+
+    def __len__(self) -> int:
+        return sum(len(a) for a in self._packed.values()) + len(self._other)
+
+    def _contains(self, mid: str) -> bool:
+        n = _as_u64(mid)
+        if n is None:
+            return mid in self._other
+        arr = self._packed.get(len(mid))
+        if arr is None:
+            return False
+        i = bisect_left(arr, n)
+        return i < len(arr) and arr[i] == n
+
+    async def missing(self, ids: Iterable[str]) -> List[str]:
+        """Return the ids (in order) that are not stored yet."""
+        ids = list(ids)
+        if self.preloaded:
+            return [mid for mid in ids if not self._contains(mid)]
+        if not ids:
+            return []
+        async with self.lock:
+            found = set((await self.db.scalars(
+                select(models.EmailMessage.message_id)
+                .where(
+                    models.EmailMessage.gmail_account_id == self.acct_id,
+                    models.EmailMessage.message_id.in_(ids),
+                )
+            )).all())
+        return [mid for mid in ids if mid not in found]
@@ -0,0 +1,151 @@
+# app/services/pipeline.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """One step of a pipeline: `fn` is run by `concurrency` workers.
+
+    `fn` receives the previous stage's output and returns the next stage's
+    input. Returning None drops the item (e.g. nothing left to do for it).
+
+    With `batch_size > 1` a worker collects up to that many queued items
+    (waiting at most `linger` seconds for stragglers) and `fn` receives a
+    list and must return a list of the same length; an Exception instance
+    in the result marks that single item as failed.
+    """
+    name: str
+    fn: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+    batch_size: int = 1
+    linger: float = 0.05
+
+
+async def run_pipeline(
+    source: AsyncIterable[Any],
+    stages: List[Stage],
+    *,
+    key: Callable[[Any], str],
+    queue_size: int = 64,
+    on_done: Optional[Callable[[str, Any], None]] = None,
+    on_error: Optional[Callable[[str, str, BaseException], None]] = None,
+) -> None:
+    """
+    Push items from `source` through `stages`, joined by bounded queues.
+
+    Items carry a key (taken from the source item via `key`) so callers can do
+    per-item accounting: `on_done(key, result)` fires when an item leaves the
+    last stage, `on_error(key, stage_name, exc)` when a stage raises. A failing
+    item is dropped; the rest of the pipeline keeps running.
+    """
+    queues: List[asyncio.Queue] = [
+        asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+
+    async def feed():
+        async for item in source:
+            await queues[0].put((key(item), item))
+
+    def fail(stage: Stage, k: str, e: BaseException):
+        logger.warning("pipeline stage %s failed for %s: %r",
+                       stage.name, k, e)
+        if on_error:
+            on_error(k, stage.name, e)
+
+    async def emit(outbox: Optional[asyncio.Queue], k: str, result: Any):
+        if result is None or outbox is None:
+            if on_done:
+                on_done(k, result)
+            return
+        await outbox.put((k, result))
+
+    async def take_batch(inbox: asyncio.Queue, stage: Stage):
+        """Block for one entry, then gather more until full or lingering ends."""
+        first = await inbox.get()
+        if first is _DONE:
+            return [], True
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + stage.linger
+        while len(batch) < stage.batch_size:
+            timeout = deadline - loop.time()
+            try:
+                if timeout <= 0:
+                    entry = inbox.get_nowait()
+                else:
+                    entry = await asyncio.wait_for(inbox.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if entry is _DONE:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    async def worker(i: int, stage: Stage):
+        inbox = queues[i]
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        while True:
+            if stage.batch_size > 1:
+                batch, closed = await take_batch(inbox, stage)
+                if batch:
+                    keys = [k for k, _ in batch]
+                    try:
+                        results = await stage.fn([p for _, p in batch])
+                        if len(results) != len(keys):
+                            raise RuntimeError(
+                                f"stage {stage.name} returned {len(results)} results "
+                                f"for {len(keys)} items")
+                    except Exception as e:
+                        results = [e] * len(keys)
+                    for k, result in zip(keys, results):
+                        if isinstance(result, Exception):
+                            fail(stage, k, result)
+                        else:
+                            await emit(outbox, k, result)
+                if closed:
+                    return
+                continue
+
+            entry = await inbox.get()
+            if entry is _DONE:
+                return
+            k, payload = entry
+            try:
+                result = await stage.fn(payload)
+            except Exception as e:
+                fail(stage, k, e)
+                continue
+            await emit(outbox, k, result)
+
+    async def run_stage(i: int, stage: Stage):
+        n = max(1, stage.concurrency)
+        await asyncio.gather(*(worker(i, stage) for _ in range(n)))
+        # every worker of this stage has drained; release the next stage
+        if i + 1 < len(stages):
+            for _ in range(max(1, stages[i + 1].concurrency)):
+                await queues[i + 1].put(_DONE)
+
+    async def feed_then_close():
+        try:
+            await feed()
+        finally:
+            for _ in range(max(1, stages[0].concurrency)):
+                await queues[0].put(_DONE)
+
+    tasks = [asyncio.create_task(feed_then_close())]
+    tasks += [asyncio.create_task(run_stage(i, s))
+              for i, s in enumerate(stages)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
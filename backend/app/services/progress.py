@@ -0,0 +1,219 @@
+# app/services/progress.py
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from ..config import settings
+from ..utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# in-process copy of every account's progress; Redis is the shared one
+SYNC_PROGRESS: Dict[str, Dict[str, Any]] = {}
+
+# a finished account's progress hash is kept this long
+PROGRESS_TTL_S = 7 * 24 * 3600
+
+_redis_warned = False
+
+
+def progress_key(acct_id: str) -> str:
+    return f"sync:progress:{acct_id}"
+
+
+def progress_channel(acct_id: str) -> str:
+    return f"sync:progress:{acct_id}:events"
+
+
+def shard_progress_key(acct_id: str) -> str:
+    # "<phase>.<counter>" -> count summed over Celery shards (HINCRBY)
+    return f"sync:progress:{acct_id}:shards"
+
+
+def default_progress() -> Dict[str, Any]:
+    return {
+        "state": "idle", "total": 0, "processed": 0, "indexed": 0, "errors": 0,
+        "phase": None,
+        # messages whose content hash matched the indexed copy (not re-embedded)
+        "skipped_unchanged": 0, "embed_tokens_saved": 0,
+        "metadata": {"state": "idle", "total": 0, "processed": 0, "errors": 0},
+        "bodies": {"state": "idle", "total": 0, "processed": 0, "indexed": 0, "errors": 0},
+    }
+
+
+def _redis_failed(e: Exception):
+    global _redis_warned
+    if not _redis_warned:
+        logger.warning("sync progress: redis unavailable (%r); progress stays local", e)
+        _redis_warned = True
+
+
+class ProgressReporter:
+    """
+    One account's sync progress. Updates land in the in-process dict at once
+    and are pushed to Redis (a hash, one JSON field per top-level key) plus a
+    pubsub delta on `progress_channel`, at most every
+    SYNC_PROGRESS_INTERVAL_MS. A change of `state` is pushed right away.
+
+    Pushes need a running event loop; call `aflush()` before the loop ends.
+    """
+
+    def __init__(self, acct_id: str, *, interval_ms: Optional[int] = None):
+        self.acct_id = acct_id
+        self.interval = (interval_ms if interval_ms is not None
+                         else settings.SYNC_PROGRESS_INTERVAL_MS) / 1000
+        self._dirty: Set[str] = set()
+        self._last_push = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._clear_shards = False
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        return SYNC_PROGRESS.setdefault(self.acct_id, default_progress())
+
+    # --- updates ---
+
+    def reset(self):
+        SYNC_PROGRESS[self.acct_id] = default_progress()
+        self.clear_shard_counts()
+        self._mark(self.data.keys(), urgent=True)
+
+    def clear_shard_counts(self):
+        """Drop counters left by a sharded sync (applied on the next push)."""
+        self._clear_shards = True
+
+    async def load(self):
+        """Start from what Redis holds (another process may own the run)."""
+        try:
+            raw = await get_redis().hgetall(progress_key(self.acct_id))
+        except Exception as e:
+            _redis_failed(e)
+            return
+        if raw:
+            self.data.update({k: json.loads(v) for k, v in raw.items()})
+
+    def update(self, **kwargs):
+        self.data.update(kwargs)
+        self._mark(kwargs, urgent="state" in kwargs)
+
+    def update_phase(self, phase: str, **kwargs):
+        """Update one phase's counters ("metadata" or "bodies")."""
+        curr = self.data
+        curr[phase].update(kwargs)
+        keys = {phase}
+        # the top-level counters follow the running phase, for older clients
+        if curr.get("phase") == phase:
+            top = {k: v for k, v in kwargs.items() if k != "state"}
+            curr.update(top)
+            keys.update(top)
+        self._mark(keys, urgent="state" in kwargs)
+
+    def incr(self, key: str, n: int = 1):
+        self.data[key] = self.data.get(key, 0) + n
+        self._mark((key,))
+
+    # --- pushing ---
+
+    def _mark(self, keys, urgent: bool = False):
+        self._dirty.update(keys)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        delay = 0.0 if urgent else max(0.0, self.interval - (time.monotonic() - self._last_push))
+        if self._timer is not None:
+            if not urgent:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_later(delay, self._spawn)
+
+    def _spawn(self):
+        self._timer = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._push())
+        else:
+            # a push is in flight; pick the rest up right after it
+            self._task.add_done_callback(lambda _: self._mark((), urgent=True))
+
+    async def _push(self):
+        if not self._dirty and not self._clear_shards:
+            return
+        keys, self._dirty = self._dirty, set()
+        clear_shards, self._clear_shards = self._clear_shards, False
+        self._last_push = time.monotonic()
+        data = self.data
+        delta = {k: data.get(k) for k in keys}
+        try:
+            r = get_redis()
+            key = progress_key(self.acct_id)
+            async with r.pipeline(transaction=False) as pipe:
+                if clear_shards:
+                    pipe.delete(shard_progress_key(self.acct_id))
+                pipe.hset(key, mapping={k: json.dumps(v, default=str) for k, v in delta.items()})
+                pipe.expire(key, PROGRESS_TTL_S)
+                pipe.publish(progress_channel(self.acct_id), json.dumps(delta, default=str))
+                await pipe.execute()
+        except Exception as e:
+            _redis_failed(e)
+
+    async def aflush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._task is not None and not self._task.done():
+            await self._task
+        await self._push()
+
+
+def _add_shard_counts(out: Dict[str, Any], shard_counts: Dict[str, str]):
+    for field, n in shard_counts.items():
+        phase, _, counter = field.partition(".")
+        if isinstance(out.get(phase), dict):
+            out[phase][counter] = out[phase].get(counter, 0) + int(n)
+    phase = out.get("phase")
+    if phase and isinstance(out.get(phase), dict):
+        out.update({k: v for k, v in out[phase].items() if k != "state"})
+
+
+async def read_progress(acct_id: str) -> Dict[str, Any]:
+    """Progress as any worker last pushed it; falls back to this process's copy."""
+    try:
+        r = get_redis()
+        raw = await r.hgetall(progress_key(acct_id))
+        shard_counts = await r.hgetall(shard_progress_key(acct_id)) if raw else {}
+    except Exception as e:
+        _redis_failed(e)
+        raw = None
+    if raw:
+        out = default_progress()
+        out.update({k: json.loads(v) for k, v in raw.items()})
+        _add_shard_counts(out, shard_counts)
+        return out
+    return dict(SYNC_PROGRESS.get(acct_id) or default_progress())
+
+
+async def add_shard_progress(acct_id: str, phase: str, **counts: int):
+    """
+    Add one Celery shard's counters to `phase` atomically, then publish the
+    phase's new totals. Other processes run other shards of the same sync.
+    """
+    try:
+        r = get_redis()
+        key = shard_progress_key(acct_id)
+        async with r.pipeline(transaction=True) as pipe:
+            for counter, n in counts.items():
+                pipe.hincrby(key, f"{phase}.{counter}", n)
+            pipe.expire(key, PROGRESS_TTL_S)
+            await pipe.execute()
+        prog = await read_progress(acct_id)
+        delta = {phase: prog[phase]}
+        if prog.get("phase") == phase:
+            delta.update({k: prog[k] for k in prog[phase] if k != "state"})
+        await r.publish(progress_channel(acct_id), json.dumps(delta, default=str))
+    except Exception as e:
+        _redis_failed(e)
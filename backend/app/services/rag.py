@@ -1,13 +1,12 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
 from typing import Any, Dict, List, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
-from ..utils.embeddings import embed_text
-from ..utils.vectorstore import query_top_k
+from ..utils.body_codec import decompress_text
 
 MAX_CONTEXT_CHARS = 8000
 MAX_HISTORY_CHARS = 6000
@@ -50,8 +49,8 @@ def collapse_chunk_matches_to_messages(matches: List[Any], top_k_messages: int =
     return rows[:top_k_messages]
 
 
-def build_context_and_pills_from_message_ids(
-    db: Session,
+async def build_context_and_pills_from_message_ids(
+    db: AsyncSession,
     acct_id,
     message_rows: List[Tuple[str, float, Any]],
     body_chars: int = 800
@@ -65,15 +64,20 @@ def build_context_and_pills_from_message_ids(
     if not mids:
         return "", []
 
-    rows = (
-        db.query(models.EmailMessage)
-        .filter(
-            models.EmailMessage.gmail_account_id == acct_id,
-            models.EmailMessage.message_id.in_(mids),
+    E, B = models.EmailMessage, models.EmailBody
+    rows = (await db.scalars(
+        select(E)
+        .where(
+            E.gmail_account_id == acct_id,
+            E.message_id.in_(mids),
         )
-        .all()
-    )
+    )).all()
     by_mid = {r.message_id: r for r in rows}
+    # only the plain-text blob, only for the few messages in the context
+    texts = dict((await db.execute(
+        select(B.message_id, B.body_text_z)
+        .where(B.message_id.in_(list(by_mid)))
+    )).all()) if by_mid else {}
 
     context_parts: List[str] = []
     pills: List[dict] = []
@@ -84,7 +88,7 @@ def build_context_and_pills_from_message_ids(
         if not r:
             continue
         rank += 1
-        body_preview = (r.body_text or r.snippet or "")[:body_chars].strip()
+        body_preview = (decompress_text(texts.get(mid)) or r.snippet or "")[:body_chars].strip()
 
         context_parts.append(
             f"=== Email #{rank} ===\n"
@@ -112,14 +116,13 @@ def build_context_and_pills_from_message_ids(
     return context, pills
 
 
-def _load_chat_history(db: Session, chat_id: str) -> List[Dict[str, str]]:
+async def _load_chat_history(db: AsyncSession, chat_id: str) -> List[Dict[str, str]]:
     """Return recent chat turns as OpenAI messages (without citations)."""
-    msgs = (
-        db.query(models.ChatMessage)
-        .filter(models.ChatMessage.chat_session_id == chat_id)
+    msgs = (await db.scalars(
+        select(models.ChatMessage)
+        .where(models.ChatMessage.chat_session_id == chat_id)
         .order_by(models.ChatMessage.created_at.asc())
-        .all()
-    )
+    )).all()
     msgs = msgs[-MAX_TURNS*2:]
 
     def clean(content: str | None) -> str:
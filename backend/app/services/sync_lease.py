@@ -0,0 +1,249 @@
+# app/services/sync_lease.py
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..config import settings
+from ..utils.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "sync:lease:metrics"
+
+# renew / release only while we still own the lease
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# a trigger that arrived while we ran keeps the lease for one more run;
+# otherwise the lease is dropped. Returns 1 = run again, 0 = released,
+# -1 = not ours any more.
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return -1 end
+if redis.call('DEL', KEYS[2]) == 1 then
+  redis.call('PEXPIRE', KEYS[1], ARGV[2])
+  return 1
+end
+redis.call('DEL', KEYS[1])
+return 0
+"""
+
+_DROP_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# flag a rerun only while a sync holds the lease (its release consumes it)
+_COALESCE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('SET', KEYS[2], ARGV[1], 'PX', ARGV[2])
+  return 1
+end
+return 0
+"""
+
+# in-process stand-in when Redis is unreachable: {acct_id: token}, plus
+# accounts with a coalesced trigger pending
+_local_leases: Dict[str, str] = {}
+_local_reruns: set = set()
+_redis_warned = False
+
+
+def _redis_failed(e: Exception):
+    global _redis_warned
+    if not _redis_warned:
+        logger.warning("sync lease: redis unavailable (%r); leases are per process", e)
+        _redis_warned = True
+
+
+def lease_key(acct_id: str) -> str:
+    return f"sync:lease:{acct_id}"
+
+
+def rerun_key(acct_id: str) -> str:
+    return f"sync:lease:{acct_id}:rerun"
+
+
+async def _count(field: str):
+    try:
+        await get_redis().hincrby(METRICS_KEY, field, 1)
+    except Exception as e:
+        _redis_failed(e)
+
+
+class SyncLease:
+    """
+    Per-account lease held by whichever sync is running, so triggers from
+    the beat schedule, the API and Celery never overlap on one mailbox.
+
+    The lease expires after `ttl_s` unless renewed (`heartbeat()` renews it
+    every ttl/3). A trigger that finds the lease taken is not run; it leaves
+    a "rerun" flag, and the holder runs once more before letting go.
+    """
+
+    def __init__(self, acct_id: str, kind: str, *, ttl_s: Optional[int] = None,
+                 token: Optional[str] = None):
+        self.acct_id = acct_id
+        self.kind = kind
+        self.ttl_ms = int((ttl_s or settings.SYNC_LEASE_TTL_S) * 1000)
+        self.token = token or f"{kind}:{uuid.uuid4().hex}"
+
+    async def acquire(self) -> bool:
+        try:
+            r = get_redis()
+            while True:
+                if await r.set(lease_key(self.acct_id), self.token, nx=True, px=self.ttl_ms):
+                    await _count("acquired")
+                    return True
+                # 0: the holder let go in between, try again
+                if await r.eval(_COALESCE_LUA, 2, lease_key(self.acct_id),
+                                rerun_key(self.acct_id), self.kind, self.ttl_ms * 10):
+                    break
+        except Exception as e:
+            _redis_failed(e)
+            if self.acct_id not in _local_leases:
+                _local_leases[self.acct_id] = self.token
+                return True
+            _local_reruns.add(self.acct_id)
+        logger.info("sync %s for %s coalesced into the running sync", self.kind, self.acct_id)
+        await _count("coalesced")
+        return False
+
+    async def renew(self) -> bool:
+        try:
+            ok = await get_redis().eval(_RENEW_LUA, 1, lease_key(self.acct_id),
+                                        self.token, self.ttl_ms)
+        except Exception as e:
+            _redis_failed(e)
+            return _local_leases.get(self.acct_id) == self.token
+        if not ok:
+            logger.warning("sync lease for %s lost (expired or taken over)", self.acct_id)
+            await _count("lost")
+        return bool(ok)
+
+    async def release(self) -> bool:
+        """Drop the lease; True means a trigger was coalesced: run once more."""
+        try:
+            res = await get_redis().eval(_RELEASE_LUA, 2, lease_key(self.acct_id),
+                                         rerun_key(self.acct_id), self.token, self.ttl_ms)
+        except Exception as e:
+            _redis_failed(e)
+            if self.acct_id in _local_reruns:
+                _local_reruns.discard(self.acct_id)
+                return True
+            if _local_leases.get(self.acct_id) == self.token:
+                del _local_leases[self.acct_id]
+            return False
+        if int(res) == 1:
+            await _count("reruns")
+            return True
+        return False
+
+    async def drop(self):
+        """Let go after a failed run; a pending rerun flag stays for the next trigger."""
+        try:
+            await get_redis().eval(_DROP_LUA, 1, lease_key(self.acct_id), self.token)
+        except Exception as e:
+            _redis_failed(e)
+            if _local_leases.get(self.acct_id) == self.token:
+                del _local_leases[self.acct_id]
+
+    @contextlib.asynccontextmanager
+    async def heartbeat(self):
+        async def beat():
+            while True:
+                await asyncio.sleep(self.ttl_ms / 3000)
+                await self.renew()
+
+        task = asyncio.create_task(beat())
+        try:
+            yield self
+        finally:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+
+async def run_exclusive(
+    acct_id: str,
+    kind: str,
+    run: Callable[[], Awaitable[Any]],
+    rerun: Callable[[], Awaitable[Any]],
+    *,
+    token: Optional[str] = None,
+) -> bool:
+    """
+    Run `run()` under the account's lease, then `rerun()` once per batch of
+    triggers coalesced meanwhile. Returns False when another sync held the
+    lease (this trigger became that sync's rerun).
+
+    `token` takes over a lease handed on by its holder (a sharded initial
+    sync passing its rerun to a task), so it is never free in between.
+    """
+    lease = SyncLease(acct_id, kind, token=token)
+    # a handed-on lease that expired meanwhile is acquired like any other
+    if not (token and await lease.renew()) and not await lease.acquire():
+        return False
+    try:
+        async with lease.heartbeat():
+            await run()
+            while await lease.release():
+                await rerun()
+    except BaseException:
+        await lease.drop()
+        raise
+    return True
+
+
+async def coalesce_if_running(acct_id: str, kind: str) -> bool:
+    """
+    For triggers that only enqueue work: if a sync holds the account's lease,
+    turn this trigger into that sync's rerun and return True (skip it).
+    """
+    try:
+        held = await get_redis().eval(
+            _COALESCE_LUA, 2, lease_key(acct_id), rerun_key(acct_id),
+            kind, settings.SYNC_LEASE_TTL_S * 10_000)
+    except Exception as e:
+        _redis_failed(e)
+        held = acct_id in _local_leases
+        if held:
+            _local_reruns.add(acct_id)
+    if held:
+        await _count("skipped")
+    return bool(held)
+
+
+async def lease_status(acct_id: str) -> Dict[str, Any]:
+    try:
+        r = get_redis()
+        holder = await r.get(lease_key(acct_id))
+        ttl_ms = await r.pttl(lease_key(acct_id)) if holder else None
+        pending = await r.exists(rerun_key(acct_id))
+    except Exception as e:
+        _redis_failed(e)
+        holder = _local_leases.get(acct_id)
+        ttl_ms, pending = None, acct_id in _local_reruns
+    return {
+        "held_by": holder.split(":", 1)[0] if holder else None,
+        "ttl_ms": ttl_ms,
+        "rerun_pending": bool(pending),
+    }
+
+
+async def lease_metrics() -> Dict[str, int]:
+    try:
+        raw = await get_redis().hgetall(METRICS_KEY)
+    except Exception as e:
+        _redis_failed(e)
+        return {}
+    return {k: int(v) for k, v in raw.items()}
@@ -0,0 +1,269 @@
+# app/services/sync_runs.py
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from httpx import HTTPStatusError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..utils.time import utcnow
+
+logger = logging.getLogger(__name__)
+
+RESUMABLE_STATES = ("running", "failed")
+
+
+async def start_or_resume_run(db: AsyncSession, acct_id, kind: str,
+                              query: str | None) -> models.SyncRun:
+    """
+    Pick up the latest unfinished run of `kind` for this account and query, or
+    start a new one. A run left in "running" means its process died mid-way.
+    """
+    q = (
+        select(models.SyncRun)
+        .where(
+            models.SyncRun.gmail_account_id == acct_id,
+            models.SyncRun.kind == kind,
+            models.SyncRun.state.in_(RESUMABLE_STATES),
+        )
+    )
+    q = q.where(models.SyncRun.query.is_(None) if query is None
+                else models.SyncRun.query == query)
+    run = (await db.scalars(q.order_by(models.SyncRun.started_at.desc()).limit(1))).first()
+    if run:
+        if not run.page_token:
+            # listing finished (or never got a page in): restart it, the
+            # stored-id diff skips whatever is already synced
+            run.processed = 0
+            run.high_water_mark = None
+        run.resume_count += 1
+        run.state = "running"
+        run.error = None
+        logger.info("resuming %s sync run %s at %d processed (page_token=%s)",
+                    kind, run.id, run.processed, run.page_token)
+    else:
+        run = models.SyncRun(
+            gmail_account_id=acct_id,
+            kind=kind,
+            state="running",
+            query=query,
+            processed=0,
+            resume_count=0,
+            started_at=utcnow(),
+        )
+    run.updated_at = utcnow()
+    db.add(run)
+    await db.commit()
+    return run
+
+
+async def resumable_pages(client, run: models.SyncRun, q: str | None,
+                          on_restart: Optional[Callable[[], None]] = None):
+    """
+    `client.list_message_pages` from the run's checkpointed page. Gmail
+    rejects a page token it no longer knows (expired, or listed under another
+    query) with a 400 on the first page; the resume point is then dropped and
+    the listing starts over, which the stored-id diff keeps cheap.
+    `on_restart` runs before the first page of the new listing.
+    """
+    started = False
+    try:
+        async for page in client.list_message_pages(q=q, page_token=run.page_token):
+            started = True
+            yield page
+        return
+    except HTTPStatusError as e:
+        if started or not run.page_token or e.response.status_code != 400:
+            raise
+        logger.warning("sync run %s: page token rejected (%s); listing from the start",
+                       run.id, e.response.status_code)
+    run.page_token = None
+    run.processed = 0
+    run.high_water_mark = None
+    if on_restart:
+        on_restart()
+    async for page in client.list_message_pages(q=q):
+        yield page
+
+
+async def finish_run(db: AsyncSession, run: models.SyncRun, state: str,
+                     error: str | None = None):
+    run.state = state
+    run.error = error
+    now = utcnow()
+    run.updated_at = now
+    if state == "done":
+        run.page_token = None
+        run.finished_at = now
+    try:
+        db.add(run)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        logger.exception("could not record %s for sync run %s", state, run.id)
+
+
+def run_summary(run: models.SyncRun | None) -> Optional[Dict[str, Any]]:
+    if run is None:
+        return None
+    return {
+        "id": str(run.id),
+        "kind": run.kind,
+        "state": run.state,
+        "processed": run.processed,
+        "total": run.total,
+        "high_water_mark": run.high_water_mark,
+        "resume_count": run.resume_count,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "updated_at": run.updated_at.isoformat() if run.updated_at else None,
+    }
+
+
+async def latest_run(db: AsyncSession, acct_id, kind: str = "initial") -> models.SyncRun | None:
+    return (await db.scalars(
+        select(models.SyncRun)
+        .where(models.SyncRun.gmail_account_id == acct_id, models.SyncRun.kind == kind)
+        .order_by(models.SyncRun.started_at.desc())
+        .limit(1)
+    )).first()
+
+
+@dataclass
+class _Page:
+    # tracked ids not finished yet
+    pending: Set[str]
+    # tracked ids, for forgetting them once the page is saved
+    ids: List[str]
+    next_token: Optional[str]
+    # run's processed / high_water_mark once this page is finished
+    processed: int
+    high_water_mark: Optional[str]
+
+
+class PageCheckpoint:
+    """
+    Tracks listing pages whose messages finish out of order (the pipeline is
+    concurrent) and moves the run's checkpoint forward only over a prefix of
+    fully finished pages.
+
+    A message that failed (`fail()`, from a stage or from the writer) is not
+    finished: the checkpoint stays at the page before its page for the rest
+    of the run, so a resume re-lists it and the stored-id diff re-fetches
+    only what is missing. `failed` counts such messages.
+
+    Saving happens in a background task: the finished prefix is snapshotted,
+    `flush` makes every row buffered up to then durable, and only then is the
+    snapshot committed (pulled back first if the flush failed a row in it).
+    `lock` guards the AsyncSession shared with the bulk writer. Await
+    `aclose()` for the last save.
+    """
+
+    def __init__(self, db: AsyncSession, run: models.SyncRun,
+                 flush: Callable[[], Awaitable[None]], lock: asyncio.Lock):
+        self.db = db
+        self.run = run
+        self.flush = flush
+        self.lock = lock
+        self._pages: List[_Page] = []
+        # ids of pages not saved yet -> page index
+        self._page_of: Dict[str, int] = {}
+        self._next = 0       # first page not finished
+        self._held: Optional[int] = None  # first page with a failed id
+        self._saved = 0      # pages covered by the committed checkpoint
+        self._base = (run.page_token, run.processed, run.high_water_mark)
+        self._task: Optional[asyncio.Task] = None
+        self.failed = 0
+
+    def restart(self):
+        """The listing starts over (see resumable_pages): drop the resume point."""
+        self._base = (None, 0, None)
+
+    def add_page(self, ids: List[str], next_token: Optional[str]):
+        idx = len(self._pages)
+        prev_processed, prev_hwm = (
+            (self._pages[-1].processed, self._pages[-1].high_water_mark)
+            if self._pages else self._base[1:])
+        page = _Page(set(), [], next_token, prev_processed + len(ids),
+                     ids[-1] if ids else prev_hwm)
+        self._pages.append(page)
+        for mid in ids:
+            # an id listed twice is tracked by its first page only
+            if mid not in self._page_of:
+                self._page_of[mid] = idx
+                page.pending.add(mid)
+                page.ids.append(mid)
+        self._advance()
+
+    def done(self, mid: str):
+        idx = self._page_of.get(mid)
+        if idx is None or mid not in self._pages[idx].pending:
+            return
+        self._pages[idx].pending.discard(mid)
+        if idx == self._next:
+            self._advance()
+
+    def fail(self, mid: str):
+        idx = self._page_of.get(mid)
+        if idx is None:
+            return
+        self._pages[idx].pending.discard(mid)
+        self.failed += 1
+        if self._held is None or idx < self._held:
+            self._held = idx
+        if idx == self._next:
+            self._advance()
+
+    def _limit(self) -> int:
+        return self._next if self._held is None else min(self._next, self._held)
+
+    def _state(self, n: int):
+        """(page_token, processed, high_water_mark) once the first n pages are done."""
+        if n == 0:
+            return self._base
+        page = self._pages[n - 1]
+        return page.next_token, page.processed, page.high_water_mark
+
+    def _advance(self):
+        start = self._next
+        while self._next < len(self._pages) and not self._pages[self._next].pending:
+            self._next += 1
+        if self._next != start and self._limit() > self._saved and \
+                (self._task is None or self._task.done()):
+            # a save already running picks the new state up when it is done
+            self._task = asyncio.ensure_future(self._save())
+
+    async def _save(self):
+        while self._limit() > self._saved:
+            n = self._limit()
+            await self.flush()
+            # a row of the snapshot may have failed while flushing
+            n = min(n, self._limit())
+            if n <= self._saved:
+                return
+            page_token, processed, high_water_mark = self._state(n)
+            async with self.lock:
+                self.run.page_token = page_token
+                self.run.processed = processed
+                self.run.high_water_mark = high_water_mark
+                self.run.updated_at = utcnow()
+                try:
+                    self.db.add(self.run)
+                    await self.db.commit()
+                except Exception:
+                    await self.db.rollback()
+                    logger.exception("sync run %s checkpoint failed", self.run.id)
+                    return
+            for page in self._pages[self._saved:n]:
+                for mid in page.ids:
+                    self._page_of.pop(mid, None)
+                page.ids = []
+            self._saved = n
+
+    async def aclose(self):
+        if self._task is not None:
+            await self._task
@@ -0,0 +1,89 @@
+# app/services/sync_schedule.py
+from __future__ import annotations
+
+import logging
+import math
+import random
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..utils.time import utcnow
+
+logger = logging.getLogger(__name__)
+
+
+def next_interval_s(change_rate: float) -> float:
+    """
+    Seconds until an account changing `change_rate` times an hour should be
+    looked at again: long enough to gather ~SYNC_SCHED_TARGET_CHANGES, clamped
+    to [MIN, MAX] and jittered so accounts don't all come due together.
+    """
+    lo, hi = settings.SYNC_SCHED_MIN_INTERVAL_S, settings.SYNC_SCHED_MAX_INTERVAL_S
+    if change_rate <= 0:
+        base = hi
+    else:
+        base = min(hi, max(lo, settings.SYNC_SCHED_TARGET_CHANGES * 3600 / change_rate))
+    j = settings.SYNC_SCHED_JITTER
+    return base * random.uniform(1 - j, 1 + j)
+
+
+def observe_changes(acct: models.GmailAccount, changes: int,
+                    now: Optional[datetime] = None):
+    """
+    Fold `changes` seen since the last check into the account's change rate
+    (exponentially decayed over SYNC_SCHED_RATE_WINDOW_S) and set its next
+    check. The caller commits.
+
+    A first observation has no interval to turn into a rate (after an
+    initial sync it would be the whole backlog), so it only starts the clock.
+    """
+    now = now or utcnow()
+    prev = acct.last_checked_at
+    rate = acct.change_rate or 0.0
+    if prev is not None:
+        elapsed = max(1.0, (now - prev).total_seconds())
+        observed = changes * 3600 / elapsed
+        weight = 1 - math.exp(-elapsed / settings.SYNC_SCHED_RATE_WINDOW_S)
+        rate += weight * (observed - rate)
+    acct.change_rate = rate
+    acct.last_checked_at = now
+    acct.next_sync_at = now + timedelta(seconds=next_interval_s(rate))
+
+
+def back_off(acct: models.GmailAccount, now: Optional[datetime] = None):
+    """A check failed (revoked token, quota): try again after the longest interval."""
+    now = now or utcnow()
+    acct.next_sync_at = now + timedelta(
+        seconds=settings.SYNC_SCHED_MAX_INTERVAL_S * random.uniform(1, 1 + settings.SYNC_SCHED_JITTER))
+
+
+def claim_due_accounts(db: Session, limit: Optional[int] = None) -> List[str]:
+    """
+    Ids of accounts whose next check is due, oldest first. Their next_sync_at
+    is pushed out by SYNC_SCHED_MIN_INTERVAL_S in the same statement (rows
+    locked by a concurrent tick are skipped), so a check that is lost gets
+    picked up again and overlapping ticks never claim an account twice.
+    """
+    A = models.GmailAccount
+    now = utcnow()
+    due = (
+        select(A.id)
+        .where(or_(A.next_sync_at.is_(None), A.next_sync_at <= now))
+        .order_by(A.next_sync_at.asc().nulls_first())
+        .limit(limit or settings.SYNC_SCHED_BATCH)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.execute(
+        update(A)
+        .where(A.id.in_(due.scalar_subquery()))
+        .values(next_sync_at=now + timedelta(seconds=settings.SYNC_SCHED_MIN_INTERVAL_S))
+        .returning(A.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [str(r.id) for r in rows]
@@ -1,186 +1,644 @@
 from __future__ import annotations
 
+import asyncio
 import datetime
-import hashlib
 import logging
-import traceback
-from typing import Any, Dict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
 
-from googleapiclient.errors import HttpError
 from httpx import HTTPStatusError
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
-from ..services.indexing import build_email_vectors_async
-from ..utils.embeddings import embed_text
-from ..utils.gmail_client import GmailClient
-from ..utils.mime_parse import parse_message
-from ..utils.vectorstore import delete_by_filter, delete_ids, upsert_vectors
+from ..config import settings
+from ..services.indexing import (build_email_vectors_batch_async,
+                                 estimate_embedding_tokens)
+from ..utils.body_codec import compress_json
+from ..utils.gmail_client import GmailApiError, GmailClient
+from ..utils.vectorstore import (UpsertAggregator, delete_by_filter,
+                                 update_message_metadata)
+from .bulk_writer import EmailBulkWriter
+from .history import HistoryCoalescer, NetChange
+from .ingest_pool import ParsedRecord, message_date, parse_full, parse_many
+from .known_ids import KnownMessageIds
+from .pipeline import Stage, run_pipeline
+from .progress import (SYNC_PROGRESS, ProgressReporter, add_shard_progress,
+                       default_progress)
+from .sync_runs import (PageCheckpoint, finish_run, resumable_pages,
+                        start_or_resume_run)
+from .sync_schedule import observe_changes
 
 logger = logging.getLogger(__name__)
 
 
-SYNC_PROGRESS: dict[str, Dict[str, Any]] = {}
+# ids diffed against the stored set per step (and per IN query when not preloaded)
+KNOWN_IDS_CHUNK = 500
+# header-only rows read per query by the body hydration phase
+HYDRATE_PAGE_SIZE = 500
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+@dataclass
+class ParsedEmail:
+    message_id: str
+    thread_id: Optional[str]
+    subject: Optional[str]
+    from_addr: Optional[str]
+    to_addr: Optional[str]
+    cc: Optional[str]
+    bcc: Optional[str]
+    date: Optional[datetime.datetime]
+    snippet: Optional[str]
+    headers: Dict[str, str]
+    body_text: str
+    # zstd blobs for the email_body row (see utils/body_codec.py)
+    body_text_z: Optional[bytes]
+    body_html_z: Optional[bytes]
+    headers_json_z: Optional[bytes]
+    size_estimate: Optional[int]
+    label_ids: List[str]
+    doc_hash: str
+    # token chunks computed by the ingest pool, if it parsed this message
+    chunks: Optional[List[Tuple[str, int, int]]] = None
+
+    def index_kwargs(self, gmail_account_id) -> Dict[str, Any]:
+        """Arguments for indexing.chunk_email / build_email_vectors_*."""
+        return {
+            "message_id": self.message_id,
+            "gmail_account_id": str(gmail_account_id),
+            "subject": self.subject,
+            "body_text": self.body_text,
+            "thread_id": self.thread_id,
+            "date": self.date,
+            "label_ids": self.label_ids,
+            "doc_hash": self.doc_hash,
+            "chunks": self.chunks,
+        }
+
+    def header_values(self, gmail_account_id) -> Dict[str, Any]:
+        """Columns known from a `format=METADATA` fetch (a header-only row;
+        `headers_json_z` goes to email_body)."""
+        return {
+            "gmail_account_id": gmail_account_id,
+            "message_id": self.message_id,
+            "thread_id": self.thread_id,
+            "subject": self.subject,
+            "from": self.from_addr,
+            "to": self.to_addr,
+            "cc": self.cc,
+            "bcc": self.bcc,
+            "date": self.date,
+            "snippet": self.snippet,
+            "headers_json_z": self.headers_json_z,
+            "size_estimate": self.size_estimate,
+            "label_ids": self.label_ids,
+            "created_at": _now(),
+        }
+
+    def to_values(self, gmail_account_id) -> Dict[str, Any]:
+        """Column values for EmailBulkWriter (keyed by column name)."""
+        values = self.header_values(gmail_account_id)
+        values.update({
+            "body_text_z": self.body_text_z,
+            "body_html_z": self.body_html_z,
+            "hash_dedup": self.doc_hash,
+            # both set by mark_indexed once the vectors have landed; until
+            # then the body phase retries the message
+            "indexed_at": None,
+            "hydrated_at": None,
+        })
+        return values
+
+
+def _parsed_email(gmsg: Dict[str, Any], headers_map: Dict[str, str],
+                  doc_hash: str) -> ParsedEmail:
+    size_estimate = gmsg.get("sizeEstimate")
+    label_ids = gmsg.get("labelIds") or []
+    return ParsedEmail(
+        message_id=gmsg.get("id"),
+        thread_id=gmsg.get("threadId"),
+        subject=headers_map.get("subject"),
+        from_addr=headers_map.get("from"),
+        to_addr=headers_map.get("to"),
+        cc=headers_map.get("cc"),
+        bcc=headers_map.get("bcc"),
+        date=message_date(headers_map, gmsg),
+        snippet=gmsg.get("snippet"),
+        headers=headers_map,
+        body_text="",
+        body_text_z=None,
+        body_html_z=None,
+        headers_json_z=compress_json(headers_map),
+        size_estimate=int(
+            size_estimate) if size_estimate is not None else None,
+        label_ids=list(label_ids),
+        doc_hash=doc_hash,
+    )
+
+
+def _from_record(rec: ParsedRecord) -> ParsedEmail:
+    headers_map = rec.headers
+    return ParsedEmail(
+        message_id=rec.message_id,
+        thread_id=rec.thread_id,
+        subject=headers_map.get("subject"),
+        from_addr=headers_map.get("from"),
+        to_addr=headers_map.get("to"),
+        cc=headers_map.get("cc"),
+        bcc=headers_map.get("bcc"),
+        date=rec.date,
+        snippet=rec.snippet,
+        headers=headers_map,
+        body_text=rec.body_text,
+        body_text_z=rec.body_text_z,
+        body_html_z=rec.body_html_z,
+        headers_json_z=rec.headers_json_z,
+        size_estimate=rec.size_estimate,
+        label_ids=rec.label_ids,
+        doc_hash=rec.doc_hash,
+        chunks=rec.chunks,
+    )
+
+
+def parse_gmail_message(gmsg: Dict[str, Any]) -> ParsedEmail:
+    """Turn a Gmail `format=FULL` message into the columns we store/index."""
+    return _from_record(parse_full(gmsg, chunk=False))
+
+
+def parse_gmail_metadata(gmsg: Dict[str, Any]) -> ParsedEmail:
+    """Turn a Gmail `format=METADATA` message into a header-only ParsedEmail."""
+    headers_map = {h.get("name", "").lower(): h.get("value", "")
+                   for h in (gmsg.get("payload") or {}).get("headers", [])}
+    return _parsed_email(gmsg, headers_map, "")
 
 
 class SyncService:
-    def __init__(self, db: Session, acct: models.GmailAccount):
+    def __init__(self, db: AsyncSession, acct: models.GmailAccount):
         self.db = db
         self.acct = acct
-        self.client = GmailClient(db, acct)
+        # an AsyncSession runs one operation at a time; pipeline stages, the
+        # bulk writer and checkpoints all share this one
+        self._db_lock = asyncio.Lock()
+        self.client = GmailClient(acct)
+        self._writer: EmailBulkWriter | None = None
+        # message_id -> stored row, for messages already indexed; lets the
+        # parse stage skip re-embedding unchanged content
+        self._indexed_rows: Dict[str, Any] = {}
+        self._relabel_vectors: Dict[str, List[str]] = {}
+        self.progress = ProgressReporter(str(acct.id))
 
     def _update_progress(self, **kwargs):
-        pid = str(self.acct.id)
-        curr = SYNC_PROGRESS.get(
-            pid, {"state": "idle", "total": 0, "processed": 0, "indexed": 0, "errors": 0})
-        curr.update(kwargs)
-        SYNC_PROGRESS[pid] = curr
+        self.progress.update(**kwargs)
+
+    def _update_phase(self, phase: str, **kwargs):
+        self.progress.update_phase(phase, **kwargs)
+
+    async def record_db_counts(self):
+        """Row counts for /sync/status, so polling it never runs COUNT(*)."""
+        E = models.EmailMessage
+        base = select(func.count()).select_from(E).where(E.gmail_account_id == self.acct.id)
+        async with self._db_lock:
+            emails = await self.db.scalar(base)
+            pending = await self.db.scalar(base.where(E.hydrated_at.is_(None)))
+        self._update_progress(db_emails=emails, db_bodies_pending=pending)
+
+    async def _save_account(self):
+        async with self._db_lock:
+            self.db.add(self.acct)
+            await self.db.commit()
 
     async def initial_sync(self, q: str | None = None):
-        # 1) gather all message IDs (for a progress total)
-        self._update_progress(state="listing", total=0,
-                              processed=0, indexed=0, errors=0)
-
-        ids: list[str] = []
-        async for mid in self.client.list_message_ids(q=q):
-            ids.append(mid)
-        total = len(ids)
-        self._update_progress(state="syncing", total=total)
-
-        for i, mid in enumerate(ids, start=1):
-            try:
-
-                exist = (
-                    self.db.query(models.EmailMessage)
-                    .filter(models.EmailMessage.message_id == mid)
-                    .one_or_none()
-                )
-                if exist:
-                    self._update_progress(processed=i)
-                    continue
-
-                gmsg = await self.client.get_message_full(mid)
-                headers_map, body_text, body_html = parse_message(gmsg)
-                subject = headers_map.get("subject")
-                from_addr = headers_map.get("from")
-                to_addr = headers_map.get("to")
-                cc = headers_map.get("cc")
-                bcc = headers_map.get("bcc")
-                date_hdr = headers_map.get("date")
-                snippet = gmsg.get("snippet")
-                thread_id = gmsg.get("threadId")
-                label_ids = gmsg.get("labelIds", [])
-                size_estimate = gmsg.get("sizeEstimate")
-                date = None
-                if date_hdr:
-                    try:
-                        from email.utils import parsedate_to_datetime
+        """
+        Two phases: list the mailbox and store header-only rows from
+        `format=METADATA` fetches, so browsing by sender/subject/date works
+        right away; then hydrate bodies and embeddings newest first.
+        """
+        try:
+            await self._initial_sync(q)
+        except Exception:
+            self._update_progress(state="error")
+            raise
+        finally:
+            await self.progress.aflush()
 
-                        date = parsedate_to_datetime(date_hdr)
-                    except Exception:
-                        pass
-
-                h = hashlib.sha256()
-                h.update(((subject or "") + "|" + (from_addr or "") + "|" +
-                         (body_text or "")).encode("utf-8", errors="ignore"))
-                doc_hash = h.hexdigest()[:64]
-
-                import datetime
-                row = models.EmailMessage(
-                    gmail_account_id=self.acct.id,
-                    message_id=mid,
-                    thread_id=thread_id,
-                    subject=subject,
-                    from_addr=from_addr,
-                    to_addr=to_addr,
-                    cc=cc,
-                    bcc=bcc,
-                    date=date,
-                    snippet=snippet,
-                    headers_json=headers_map,
-                    body_text=body_text or "",
-                    body_html=body_html or "",
-                    size_estimate=int(
-                        size_estimate) if size_estimate is not None else None,
-                    label_ids=list(label_ids) if label_ids else [],
-                    hash_dedup=doc_hash,
-                    indexed_at=None,
-                    created_at=datetime.datetime.now(
-                        datetime.timezone.utc),
-                )
-                self.db.add(row)
-                self.db.commit()
-                self.db.flush()
-                vectors = await build_email_vectors_async(
-                    embed_text=embed_text,
-                    message_id=mid,
-                    gmail_account_id=str(self.acct.id),
-                    subject=subject,
-                    body_text=body_text,
-                    thread_id=thread_id,
-                    date=date,
-                    label_ids=label_ids,
-                    doc_hash=doc_hash,
-                    # max_tokens_per_chunk=600,
-                    # overlap=80,
-                )
+    async def _initial_sync(self, q: str | None):
+        await self._sync_metadata(q)
+        await self.record_db_counts()
 
-                if vectors:
-                    await upsert_vectors(vectors, namespace=str(self.acct.id))
-                    import datetime
-                    row.indexed_at = datetime.datetime.now(
-                        datetime.timezone.utc)
-                    self.db.add(row)
-                    self.db.commit()
-                self._update_progress(processed=i)
-            except Exception as e:
-                print("EXCEPTION constructing/inserting EmailMessage:", repr(e))
-                print("TRACEBACK:\n", traceback.format_exc())
-                print(
-                    "TYPES:",
-                    "mid", type(mid),
-                    "thread_id", type(thread_id),
-                    "subject", type(subject),
-                    "from_addr", type(from_addr),
-                    "to_addr", type(to_addr),
-                    "cc", type(cc),
-                    "bcc", type(bcc),
-                    "date", type(date),
-                    "snippet", type(snippet),
-                    "headers_map", type(
-                        headers_map) if 'headers_map' in locals() else 'MISSING',
-                    "body_text", type(body_text),
-                    "body_html", type(body_html),
-                    "size_estimate", type(
-                        size_estimate) if 'size_estimate' in locals() else 'MISSING',
-                    "label_ids", type(
-                        label_ids) if 'label_ids' in locals() else 'MISSING',
-                    "doc_hash", type(doc_hash),
-                )
-                prev_err = 0
-                try:
-                    prev_err = self.SYNC_PROGRESS[str(self.acct.id)]["errors"]
-                except Exception:
-                    pass
-                self._update_progress(processed=i, errors=prev_err + 1)
         try:
             prof = await self.client.get_profile()
             hid = prof.get("historyId")
             if hid:
                 self.acct.history_id = str(hid)
-                self.db.add(self.acct)
-                self.db.commit()
+                await self._save_account()
         except Exception:
             pass
 
-        self._update_progress(state="done")
+        await self.hydrate_bodies()
+        await self.record_db_counts()
+        self._update_progress(state="done", phase=None)
+
+    async def _sync_metadata(self, q: str | None):
+        run = await start_or_resume_run(self.db, self.acct.id, "initial", q)
+        resumed_from = run.processed
+        self.progress.reset()
+        self._update_progress(state="listing", phase="metadata",
+                              run_id=str(run.id), resumed=run.resume_count > 0,
+                              resumed_from=resumed_from)
+        self._update_phase("metadata", state="listing", total=0,
+                           processed=resumed_from, errors=0)
+
+        # the total is only an estimate until listing finishes: seed it from
+        # the mailbox size (unknown for a filtered listing)
+        estimate = 0
+        if not q:
+            try:
+                prof = await self.client.get_profile()
+                estimate = int(prof.get("messagesTotal") or 0)
+            except Exception as e:
+                logger.warning("initial_sync: profile lookup failed: %r", e)
+        self._update_progress(state="syncing", total_estimated=True)
+        self._update_phase("metadata", state="running",
+                           total=max(estimate, resumed_from))
+
+        counters = {"processed": resumed_from, "errors": 0}
+
+        known = await KnownMessageIds.load(
+            self.db, self.acct.id, max_ids=settings.SYNC_KNOWN_IDS_MAX, lock=self._db_lock)
+
+        async def source():
+            # 1) stream listing pages straight into the pipeline; listing
+            # restarts at the checkpointed page, everything before it is done
+            listed = resumed_from
+
+            def restart():
+                nonlocal listed
+                listed = counters["processed"] = 0
+                checkpoint.restart()
+                self._update_progress(resumed=False, resumed_from=0)
+                self._update_phase("metadata", processed=0)
+
+            async for page_ids, next_token in resumable_pages(
+                    self.client, run, q, on_restart=restart):
+                listed += len(page_ids)
+                if listed > estimate:
+                    self._update_phase("metadata", total=listed)
+                checkpoint.add_page(page_ids, next_token)
+                # diff the listing against stored ids a chunk at a time
+                for start in range(0, len(page_ids), KNOWN_IDS_CHUNK):
+                    chunk = page_ids[start:start + KNOWN_IDS_CHUNK]
+                    missing = await known.missing(chunk)
+                    skipped = len(chunk) - len(missing)
+                    if skipped:
+                        counters["processed"] += skipped
+                        self._update_phase("metadata", processed=counters["processed"])
+                        missing_set = set(missing)
+                        for mid in chunk:
+                            if mid not in missing_set:
+                                checkpoint.done(mid)
+                    for mid in missing:
+                        yield mid
+            run.total = listed
+            self._update_progress(total_estimated=False)
+            self._update_phase("metadata", total=listed)
+
+        def on_done(mid: str, result):
+            checkpoint.done(mid)
+            counters["processed"] += 1
+            self._update_phase("metadata", **counters)
+
+        def on_error(mid: str, stage: str, exc: BaseException):
+            logger.error("initial_sync: %s failed for %s: %r", stage, mid, exc)
+            if isinstance(exc, GmailApiError) and exc.status_code == 404:
+                # deleted since it was listed: nothing left to store
+                checkpoint.done(mid)
+            else:
+                checkpoint.fail(mid)
+            counters["processed"] += 1
+            counters["errors"] += 1
+            self._update_phase("metadata", **counters)
+
+        def on_write_error(mid: str, exc: BaseException):
+            checkpoint.fail(mid)
+            counters["errors"] += 1
+            self._update_phase("metadata", errors=counters["errors"])
+
+        # 2) fetch metadata -> store header-only rows
+        try:
+            async with EmailBulkWriter(self.db, lock=self._db_lock,
+                                       on_error=on_write_error) as writer:
+                self._writer = writer
+                checkpoint = PageCheckpoint(self.db, run, flush=writer.flush,
+                                            lock=self._db_lock)
+                try:
+                    await run_pipeline(
+                        source(),
+                        self._metadata_stages(),
+                        key=lambda mid: mid,
+                        queue_size=settings.SYNC_QUEUE_SIZE,
+                        on_done=on_done,
+                        on_error=on_error,
+                    )
+                finally:
+                    await checkpoint.aclose()
+        except BaseException as e:
+            await finish_run(self.db, run, "failed", error=repr(e))
+            self._update_phase("metadata", state="failed")
+            raise
+        finally:
+            self._writer = None
+        if checkpoint.failed:
+            # the checkpoint stopped before the first failed message: the
+            # next run resumes there and retries what is still missing
+            await finish_run(self.db, run, "failed",
+                             error=f"{checkpoint.failed} messages failed")
+        else:
+            await finish_run(self.db, run, "done")
+        self._update_phase("metadata", state="done")
+
+    def _unhydrated(self):
+        E = models.EmailMessage
+        return (E.gmail_account_id == self.acct.id, E.hydrated_at.is_(None))
+
+    async def _unhydrated_ids(self):
+        """
+        Header-only message ids, newest first (undated ones last). Keyset
+        paging, so rows hydrated while we go don't shift later pages.
+        """
+        E = models.EmailMessage
+        base = select(E.message_id, E.date).where(*self._unhydrated())
+        passes = (
+            (base.where(E.date.isnot(None)), (E.date, E.message_id)),
+            (base.where(E.date.is_(None)), (E.message_id,)),
+        )
+        for base, cols in passes:
+            after = None
+            while True:
+                q = base
+                if after is not None:
+                    q = q.where(tuple_(*cols) < tuple_(*after))
+                async with self._db_lock:
+                    rows = (await self.db.execute(
+                        q.order_by(*(c.desc() for c in cols)).limit(HYDRATE_PAGE_SIZE))).all()
+                for row in rows:
+                    yield row.message_id
+                if len(rows) < HYDRATE_PAGE_SIZE:
+                    break
+                after = tuple(getattr(rows[-1], c.key) for c in cols)
+
+    async def hydrate_bodies(self):
+        """
+        Second sync phase: fetch `format=FULL` for header-only rows, newest
+        first, then store bodies, embed and upsert. A row only counts as
+        hydrated once its vectors landed (EmailBulkWriter.mark_indexed), so
+        rows that fail at any stage are picked up by the next pass.
+        """
+        async with self._db_lock:
+            pending = await self.db.scalar(
+                select(func.count()).select_from(models.EmailMessage).where(*self._unhydrated()))
+        if not pending:
+            self._update_phase("bodies", state="done")
+            return
+
+        self._update_progress(state="hydrating", phase="bodies")
+        self._update_phase("bodies", state="running", total=pending,
+                           processed=0, indexed=0, errors=0)
+        counters = {"processed": 0, "indexed": 0, "errors": 0}
+
+        def on_done(mid: str, result):
+            counters["processed"] += 1
+            if result:
+                counters["indexed"] += 1
+            self._update_phase("bodies", **counters)
+
+        def on_error(mid: str, stage: str, exc: BaseException):
+            logger.error("hydrate_bodies: %s failed for %s: %r", stage, mid, exc)
+            counters["processed"] += 1
+            counters["errors"] += 1
+            self._update_phase("bodies", **counters)
+
+        def on_write_error(mid: str, exc: BaseException):
+            counters["errors"] += 1
+            self._update_phase("bodies", errors=counters["errors"])
+
+        # fetch -> parse/store -> embed -> upsert, each stage bounded; fewer
+        # fetch workers than the metadata phase, it is the lower priority
+        try:
+            async with EmailBulkWriter(self.db, lock=self._db_lock,
+                                       on_error=on_write_error) as writer:
+                self._writer = writer
+                await run_pipeline(
+                    self._unhydrated_ids(),
+                    self._body_stages(settings.SYNC_HYDRATE_FETCH_CONCURRENCY),
+                    key=lambda mid: mid,
+                    queue_size=settings.SYNC_QUEUE_SIZE,
+                    on_done=on_done,
+                    on_error=on_error,
+                )
+        except BaseException:
+            self._update_phase("bodies", state="failed")
+            raise
+        finally:
+            self._writer = None
+        self._update_phase("bodies", state="done")
+
+    # --- sharded initial sync (see tasks/sync_tasks.py) ---
+
+    async def list_unsynced_ids(self, q: str | None = None,
+                                run: Optional[models.SyncRun] = None) -> Tuple[List[str], int]:
+        """
+        All listed message ids not stored yet, and how many were listed.
+        With `run`, listing resumes at its checkpointed page (the pages
+        before it count as listed).
+        """
+        known = await KnownMessageIds.load(
+            self.db, self.acct.id, max_ids=settings.SYNC_KNOWN_IDS_MAX, lock=self._db_lock)
+        out: List[str] = []
+        listed = 0
+        if run is None:
+            pages = self.client.list_message_pages(q=q)
+        else:
+            listed = run.processed or 0
+
+            def restart():
+                nonlocal listed
+                listed = 0
+
+            pages = resumable_pages(self.client, run, q, on_restart=restart)
+        async for page_ids, _ in pages:
+            listed += len(page_ids)
+            for start in range(0, len(page_ids), KNOWN_IDS_CHUNK):
+                out.extend(await known.missing(page_ids[start:start + KNOWN_IDS_CHUNK]))
+            self._update_phase("metadata", total=listed, processed=listed - len(out))
+        return out, listed
+
+    async def unhydrated_shards(self, size: int) -> List[List[str]]:
+        """Header-only ids cut into shards of `size`, newest first."""
+        shards: List[List[str]] = [[]]
+        async for mid in self._unhydrated_ids():
+            if len(shards[-1]) >= size:
+                shards.append([])
+            shards[-1].append(mid)
+        return [s for s in shards if s]
+
+    async def _run_shard(self, mids: List[str], stages: List[Stage], phase: str) -> Dict[str, int]:
+        counters = {"processed": 0, "errors": 0}
+        if phase == "bodies":
+            counters["indexed"] = 0
+
+        def on_done(mid: str, result):
+            counters["processed"] += 1
+            if result and "indexed" in counters:
+                counters["indexed"] += 1
+
+        def on_error(mid: str, stage: str, exc: BaseException):
+            logger.error("%s shard: %s failed for %s: %r", phase, stage, mid, exc)
+            counters["processed"] += 1
+            counters["errors"] += 1
+
+        def on_write_error(mid: str, exc: BaseException):
+            counters["errors"] += 1
+
+        async def source():
+            for mid in mids:
+                yield mid
+
+        async with EmailBulkWriter(self.db, lock=self._db_lock,
+                                   on_error=on_write_error) as writer:
+            self._writer = writer
+            try:
+                await run_pipeline(source(), stages, key=lambda mid: mid,
+                                   queue_size=settings.SYNC_QUEUE_SIZE,
+                                   on_done=on_done, on_error=on_error)
+            finally:
+                self._writer = None
+        # summed across every shard of the sync, in Redis
+        await add_shard_progress(str(self.acct.id), phase, **counters)
+        return counters
+
+    async def sync_metadata_shard(self, mids: List[str]) -> Dict[str, int]:
+        return await self._run_shard(mids, self._metadata_stages(), "metadata")
+
+    async def hydrate_shard(self, mids: List[str]) -> Dict[str, int]:
+        return await self._run_shard(
+            mids, self._body_stages(settings.SYNC_FETCH_CONCURRENCY), "bodies")
+
+    # --- sync pipeline stages ---
+
+    def _metadata_stages(self) -> List[Stage]:
+        """fetch METADATA -> store header-only row; needs self._writer."""
+        return [
+            Stage("fetch", self._fetch_metadata_stage,
+                  settings.SYNC_FETCH_CONCURRENCY,
+                  batch_size=settings.GMAIL_BATCH_SIZE),
+            Stage("store", self._store_metadata_stage,
+                  settings.SYNC_PARSE_CONCURRENCY),
+        ]
+
+    def _body_stages(self, fetch_concurrency: int) -> List[Stage]:
+        """fetch FULL -> parse/store -> embed -> upsert; needs self._writer."""
+        return [
+            Stage("fetch", self._fetch_stage, fetch_concurrency,
+                  batch_size=settings.GMAIL_BATCH_SIZE),
+            Stage("parse", self._parse_stage,
+                  settings.SYNC_PARSE_CONCURRENCY,
+                  batch_size=settings.SYNC_PARSE_BATCH),
+            Stage("embed", self._embed_stage,
+                  settings.SYNC_EMBED_CONCURRENCY,
+                  batch_size=settings.SYNC_EMBED_BATCH),
+            Stage("upsert", self._upsert_stage,
+                  settings.SYNC_UPSERT_CONCURRENCY,
+                  batch_size=settings.SYNC_UPSERT_BATCH),
+        ]
+
+    async def _fetch_metadata_stage(self, mids: List[str]) -> List[Any]:
+        results = await self.client.get_messages_metadata_batch(mids)
+        return [results[mid] for mid in mids]
+
+    async def _store_metadata_stage(self, gmsg: Dict[str, Any]) -> bool:
+        await self._writer.add(parse_gmail_metadata(gmsg).header_values(self.acct.id))
+        return True
+
+    async def _fetch_stage(self, mids: List[str]) -> List[Any]:
+        # raw JSON bytes: decoding happens in the ingest pool
+        results = await self.client.get_messages_full_batch(mids, raw=True)
+        return [results[mid] for mid in mids]
+
+    async def _parse_stage(self, raws: List[bytes]) -> List[Any]:
+        out: List[Any] = []
+        for rec in await parse_many(raws):
+            if isinstance(rec, Exception):
+                out.append(rec)
+            else:
+                out.append(await self._store_parsed(_from_record(rec)))
+        return out
+
+    async def _store_parsed(self, parsed: ParsedEmail) -> ParsedEmail | None:
+        stored = self._indexed_rows.get(parsed.message_id)
+        if stored is not None and stored.hash_dedup == parsed.doc_hash:
+            # same content is already embedded: refresh the header columns only
+            await self._writer.add(parsed.header_values(self.acct.id))
+            if sorted(stored.label_ids or []) != sorted(parsed.label_ids):
+                self._relabel_vectors[parsed.message_id] = parsed.label_ids
+            self.progress.incr("skipped_unchanged")
+            self.progress.incr("embed_tokens_saved",
+                               estimate_embedding_tokens(parsed.subject, parsed.body_text))
+            return None
+        await self._writer.add(parsed.to_values(self.acct.id))
+        return parsed
+
+    async def _embed_stage(self, batch: List[ParsedEmail]) -> List[Any]:
+        by_mid = await build_email_vectors_batch_async(
+            [p.index_kwargs(self.acct.id) for p in batch])
+        out: List[Any] = []
+        for parsed in batch:
+            vectors = by_mid.get(parsed.message_id)
+            if vectors:
+                out.append((parsed, vectors))
+            elif not estimate_embedding_tokens(parsed.subject, parsed.body_text):
+                # nothing to embed: done, or it would be re-fetched every pass
+                await self._writer.mark_indexed(parsed.message_id, 0)
+                out.append(None)
+            else:
+                out.append(RuntimeError("no chunk of the message was embedded"))
+        return out
+
+    async def _upsert_stage(self, items: List[Any]) -> List[Any]:
+        agg = UpsertAggregator(namespace=str(self.acct.id))
+        for parsed, vectors in items:
+            agg.add(parsed.message_id, vectors)
+        landed = await agg.flush()
+        out: List[Any] = []
+        for parsed, vectors in items:
+            err = landed.get(parsed.message_id)
+            if err is None:
+                # only messages whose vectors all landed count as indexed
+                await self._writer.mark_indexed(parsed.message_id, len(vectors))
+                out.append(True)
+            else:
+                out.append(err)
+        return out
 
     @staticmethod
     def get_progress(acct_id: str) -> Dict[str, Any]:
-        return SYNC_PROGRESS.get(acct_id, {"state": "idle", "total": 0, "processed": 0, "indexed": 0, "errors": 0})
+        """This process's copy; see progress.read_progress for the shared one."""
+        return SYNC_PROGRESS.get(acct_id, default_progress())
 
     async def incremental_sync(self):
         """Fetch changes since last stored history_id and apply them."""
+        try:
+            await self._incremental_sync()
+        except Exception:
+            self._update_progress(state="error")
+            raise
+        finally:
+            await self.progress.aflush()
+
+    async def _incremental_sync(self):
         logger.info("Reached incremental_sync")
         start_id = self.acct.history_id
         if not start_id:
@@ -190,21 +648,20 @@ class SyncService:
 
             prof = await self.client.get_profile()
             self.acct.history_id = str(prof.get("historyId"))
-            self.db.add(self.acct)
-            self.db.commit()
+            await self._save_account()
             self._update_progress(state="idle")
             return
         logger.info("Reached update porgres")
-        self._update_progress(state="incremental", total=0)
-
-        def _now():
-            return datetime.now(timezone.utc)
+        self.progress.clear_shard_counts()
+        self._update_progress(state="incremental", phase=None, total=0,
+                              processed=0, errors=0,
+                              skipped_unchanged=0, embed_tokens_saved=0)
 
-        latest_seen_int = int(start_id)
         page_token = None
-        processed = 0
         errors = 0
-        saw_any_history = False
+        # 1) fold every history page into one net change per message before
+        # touching Gmail messages, Postgres or Pinecone
+        history = HistoryCoalescer()
 
         while True:
 
@@ -244,8 +701,7 @@ class SyncService:
                     await self.initial_sync()
                     prof = await self.client.get_profile()
                     self.acct.history_id = str(prof.get("historyId"))
-                    self.db.add(self.acct)
-                    self.db.commit()
+                    await self._save_account()
                     self._update_progress(state="idle")
                     return
 
@@ -254,167 +710,162 @@ class SyncService:
                 logger.exception("get_history unexpected error: %s", e)
                 errors += 1
                 break
-            histories = data.get("history", [])
-            if histories:
-                saw_any_history = True
-
-            for h in histories:
-                hid = int(h.get("id", latest_seen_int))
-                latest_seen_int = max(latest_seen_int, hid)
-
-                for ma in h.get("messagesAdded", []) or []:
-                    msg = ma.get("message") or {}
-                    mid = msg.get("id")
-                    if not mid:
-                        continue
-                    try:
-                        gmsg = await self.client.get_message_full(mid)
-                        headers_map, body_text, body_html = parse_message(gmsg)
-                        subject = headers_map.get("subject")
-                        from_addr = headers_map.get("from")
-                        to_addr = headers_map.get("to")
-                        cc = headers_map.get("cc")
-                        bcc = headers_map.get("bcc")
-                        date_hdr = headers_map.get("date")
-                        snippet = gmsg.get("snippet")
-                        thread_id = gmsg.get("threadId")
-                        label_ids = gmsg.get("labelIds", [])
-                        size_estimate = gmsg.get("sizeEstimate")
-                        date = None
-                        if date_hdr:
-                            try:
-                                from email.utils import parsedate_to_datetime
-                                date = parsedate_to_datetime(date_hdr)
-                            except Exception:
-                                pass
-                        import hashlib
-                        hsh = hashlib.sha256()
-                        hsh.update(((subject or "") + "|" + (from_addr or "") +
-                                   "|" + (body_text or "")).encode("utf-8", errors="ignore"))
-                        doc_hash = hsh.hexdigest()[:64]
-
-                        row = (
-                            self.db.query(models.EmailMessage)
-                            .filter(
-                                models.EmailMessage.message_id == mid,
-                                models.EmailMessage.gmail_account_id == self.acct.id,
-                            )
-                            .one_or_none()
-                        )
-                        if not row:
-                            row = models.EmailMessage(
-                                gmail_account_id=self.acct.id,
-                                message_id=mid,
-                            )
-                        row.thread_id = thread_id
-                        row.subject = subject
-                        row.from_addr = from_addr
-                        row.to_addr = to_addr
-                        row.cc = cc
-                        row.bcc = bcc
-                        row.date = date
-                        row.snippet = snippet
-                        row.headers_json = headers_map
-                        row.body_text = body_text
-                        row.body_html = body_html
-                        row.size_estimate = size_estimate
-                        row.label_ids = label_ids
-                        row.hash_dedup = doc_hash
-                        logger.info("Full Messge %s ", body_text)
-                        if not row.created_at:
-                            from datetime import datetime, timezone
-                            row.created_at = datetime.now(timezone.utc)
-                        self.db.add(row)
-                        self.db.commit()
-                        vectors = await build_email_vectors_async(
-                            embed_text=embed_text,
-                            message_id=mid,
-                            gmail_account_id=str(self.acct.id),
-                            subject=subject,
-                            body_text=body_text,
-                            thread_id=thread_id,
-                            date=date,
-                            label_ids=label_ids,
-                            doc_hash=doc_hash,
-                        )
-                        if vectors:
-                            await upsert_vectors(vectors, namespace=str(self.acct.id))
-                            row.indexed_at = _now()
-                            self.db.add(row)
-                            self.db.commit()
-
-                        processed += 1
-                        self._update_progress(
-                            processed=processed, errors=errors)
-                    except Exception:
-                        errors += 1
-                        self._update_progress(
-                            processed=processed, errors=errors)
-                for md in h.get("messagesDeleted", []) or []:
-                    msg = md.get("message") or {}
-                    mid = msg.get("id")
-                    if not mid:
-                        continue
-                    try:
-                        row = (
-                            self.db.query(models.EmailMessage)
-                            .filter(models.EmailMessage.message_id == mid, models.EmailMessage.gmail_account_id == self.acct.id)
-                            .one_or_none()
-                        )
-                        if row:
-                            self.db.delete(row)
-                            self.db.commit()
-                        await delete_by_filter(
-                            namespace=str(self.acct.id),
-                            where={"message_id": {"$eq": mid}},
-                        )
-                        processed += 1
-                        self._update_progress(
-                            processed=processed, errors=errors)
-                    except Exception:
-                        errors += 1
-                        self._update_progress(
-                            processed=processed, errors=errors)
-
-                def _apply_labels(msg_wrapper_key: str, add: bool):
-                    for lr in h.get(msg_wrapper_key, []) or []:
-                        msg = lr.get("message") or {}
-                        mid = msg.get("id")
-                        if not mid:
-                            continue
-                        row = (
-                            self.db.query(models.EmailMessage)
-                            .filter(models.EmailMessage.message_id == mid, models.EmailMessage.gmail_account_id == self.acct.id)
-                            .one_or_none()
-                        )
-                        if not row:
-                            continue
-                        labels = (msg.get("labelIds") or row.label_ids or [])
-                        if add:
-                            row.label_ids = sorted(
-                                list(set((row.label_ids or []) + labels)))
-                        else:
-                            row.label_ids = [l for l in (
-                                row.label_ids or []) if l not in labels]
-                        self.db.add(row)
-                        self.db.commit()
-
-                _apply_labels("labelsAdded", add=True)
-                _apply_labels("labelsRemoved", add=False)
+            history.add_records(data.get("history") or [])
 
             page_token = data.get("nextPageToken")
             if not page_token:
 
                 break
-        if saw_any_history and latest_seen_int:
-            self.acct.history_id = str(latest_seen_int)
+
+        deleted = history.deleted()
+        added = history.added()
+        relabeled = history.relabeled()
+        logger.info("incremental_sync: %d history records -> %d added, %d deleted, %d relabeled",
+                    history.records, len(added), len(deleted), len(relabeled))
+        counters = {"processed": 0, "errors": errors}
+        self._update_progress(total=len(added) + len(deleted) + len(relabeled),
+                              **counters)
+
+        def on_write_error(mid: str, exc: BaseException):
+            counters["errors"] += 1
+            self._update_progress(errors=counters["errors"])
+
+        async with EmailBulkWriter(self.db, lock=self._db_lock,
+                                   on_error=on_write_error) as writer:
+            self._writer = writer
+            try:
+                # 2) deletes and label edits: one statement / request per batch
+                if deleted:
+                    await self._delete_messages(deleted, counters)
+                if relabeled:
+                    await self._relabel_messages(relabeled, counters)
+
+                # 3) new messages: concurrent fetch -> parse -> embed -> upsert
+                if added:
+                    def on_done(mid: str, result):
+                        counters["processed"] += 1
+                        self._update_progress(**counters)
+
+                    def on_error(mid: str, stage: str, exc: BaseException):
+                        logger.error("incremental_sync: %s failed for %s: %r", stage, mid, exc)
+                        counters["processed"] += 1
+                        counters["errors"] += 1
+                        self._update_progress(**counters)
+
+                    async def source():
+                        for mid in added:
+                            yield mid
+
+                    self._indexed_rows = await self._load_indexed_rows(added)
+                    await run_pipeline(
+                        source(),
+                        self._body_stages(settings.SYNC_FETCH_CONCURRENCY),
+                        key=lambda mid: mid,
+                        queue_size=settings.SYNC_QUEUE_SIZE,
+                        on_done=on_done,
+                        on_error=on_error,
+                    )
+                    if self._relabel_vectors:
+                        await self._update_vector_labels(self._relabel_vectors, counters)
+            finally:
+                self._writer = None
+                self._indexed_rows = {}
+                self._relabel_vectors = {}
+
+        if history.records and history.latest_history_id:
+            self.acct.history_id = str(max(int(start_id), history.latest_history_id))
         else:
             try:
                 prof = await self.client.get_profile()
                 self.acct.history_id = str(prof.get("historyId"))
             except Exception:
-                self.acct.history_id = str(latest_seen_int)
-
-        self.db.add(self.acct)
-        self.db.commit()
-        self._update_progress(state="idle")
+                self.acct.history_id = str(start_id)
+        # feeds the scheduler's per-account change rate
+        observe_changes(self.acct, len(added) + len(deleted) + len(relabeled))
+
+        await self._save_account()
+        # bodies left header-only by an interrupted initial sync
+        await self.hydrate_bodies()
+        await self.record_db_counts()
+        self._update_progress(state="idle", phase=None)
+
+    async def _delete_messages(self, mids: List[str], counters: Dict[str, int]):
+        E = models.EmailMessage
+        for start in range(0, len(mids), KNOWN_IDS_CHUNK):
+            chunk = mids[start:start + KNOWN_IDS_CHUNK]
+            try:
+                async with self._db_lock:
+                    try:
+                        await self.db.execute(
+                            delete(E)
+                            .where(E.gmail_account_id == self.acct.id, E.message_id.in_(chunk))
+                            .execution_options(synchronize_session=False)
+                        )
+                        await self.db.commit()
+                    except Exception:
+                        await self.db.rollback()
+                        raise
+                await delete_by_filter(
+                    namespace=str(self.acct.id),
+                    where={"message_id": {"$in": chunk}},
+                )
+                counters["processed"] += len(chunk)
+            except Exception as e:
+                logger.error("incremental_sync: deleting %d messages failed: %r", len(chunk), e)
+                counters["processed"] += len(chunk)
+                counters["errors"] += len(chunk)
+            self._update_progress(**counters)
+
+    async def _rows_by_mid(self, cols, mids: List[str], *where) -> Dict[str, Any]:
+        """`cols` of this account's rows for `mids`, one IN query per chunk."""
+        E = models.EmailMessage
+        out: Dict[str, Any] = {}
+        for start in range(0, len(mids), KNOWN_IDS_CHUNK):
+            chunk = mids[start:start + KNOWN_IDS_CHUNK]
+            async with self._db_lock:
+                rows = (await self.db.execute(
+                    select(E.message_id, *cols)
+                    .where(E.gmail_account_id == self.acct.id, E.message_id.in_(chunk), *where)
+                )).all()
+            for r in rows:
+                out[r.message_id] = r
+        return out
+
+    async def _load_indexed_rows(self, mids: List[str]) -> Dict[str, Any]:
+        E = models.EmailMessage
+        return await self._rows_by_mid(
+            (E.hash_dedup, E.label_ids), mids,
+            E.indexed_at.isnot(None), E.hash_dedup.isnot(None))
+
+    async def _update_vector_labels(self, labels: Dict[str, List[str]], counters: Dict[str, int]):
+        E = models.EmailMessage
+        rows = await self._rows_by_mid((E.chunk_count,), list(labels))
+        chunk_counts: Dict[str, Optional[int]] = {
+            mid: r.chunk_count for mid, r in rows.items()}
+        failed = await update_message_metadata(
+            str(self.acct.id), {mid: {"label_ids": l} for mid, l in labels.items()},
+            chunk_counts)
+        counters["errors"] += sum(1 for e in failed.values() if e is not None)
+        self._update_progress(**counters)
+
+    async def _relabel_messages(self, changes: List[NetChange], counters: Dict[str, int]):
+        E = models.EmailMessage
+        rows = await self._rows_by_mid(
+            (E.label_ids, E.indexed_at, E.chunk_count), [ch.message_id for ch in changes])
+
+        # labels live in every chunk's metadata too: rewrite it in place, no re-embedding
+        vector_labels: Dict[str, List[str]] = {}
+        for ch in changes:
+            row = rows.get(ch.message_id)
+            if row is None:
+                continue  # never synced here
+            labels = ch.final_labels(row.label_ids)
+            await self._writer.set_labels(ch.message_id, labels)
+            if row.indexed_at is not None and row.chunk_count != 0:
+                vector_labels[ch.message_id] = labels
+        counters["processed"] += len(changes)
+
+        if vector_labels:
+            await self._update_vector_labels(vector_labels, counters)
+        else:
+            self._update_progress(**counters)
@@ -1,17 +1,13 @@
 from __future__ import annotations
 
-import os
-
 from app.celery_app import celery_app
-from celery.schedules import crontab
-
-# use CELERY_SCHEDULE_MINUTES (default 15) to run every N minutes
-# N = int(os.getenv("CELERY_SCHEDULE_MINUTES", "15"))
-N = 15
+from app.config import settings
 
+# a cheap tick: only accounts whose per-account next_sync_at is due are
+# checked (services/sync_schedule.py), so it can run often
 celery_app.conf.beat_schedule = {
-    "incremental-sync-every-n-min": {
+    "incremental-sync-scheduler": {
         "task": "app.tasks.sync_tasks.schedule_incremental_for_all",
-        "schedule": crontab(minute=f"*/{N}"),
+        "schedule": float(settings.SYNC_SCHED_TICK_S),
     },
 }
@@ -1,46 +1,299 @@
 from __future__ import annotations
 
-import asyncio
+import logging
 import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, List, Optional
 
-from celery import shared_task
+from celery import chord, group, shared_task
 from sqlalchemy.orm import Session
 
 from .. import models
-from ..db import SessionLocal
+from ..config import settings
+from ..db import SessionLocal, async_session
+from ..services.sync_lease import SyncLease, coalesce_if_running, run_exclusive
+from ..services.sync_runs import finish_run, start_or_resume_run
+from ..services.sync_schedule import back_off, claim_due_accounts, observe_changes
 from ..services.sync_service import SyncService
+from .worker_loop import run_async
+
+logger = logging.getLogger(__name__)
 
 
 @shared_task
-def incremental_sync_account(acct_id: str):
-    """Run incremental sync for a single Gmail account."""
-    db: Session = SessionLocal()
+def incremental_sync_account(acct_id: str, lease_token: Optional[str] = None):
+    """Run incremental sync for a single Gmail account (under `lease_token`'s
+    lease when one is handed on)."""
     try:
-        acct = db.query(models.GmailAccount).filter(
-            models.GmailAccount.id == acct_id).one_or_none()
-        if not acct:
+        ran = _with_service(acct_id, lambda svc: run_exclusive(
+            acct_id, "incremental", svc.incremental_sync, svc.incremental_sync,
+            token=lease_token))
+        if ran is None:
             return {"ok": False, "error": "account_not_found"}
-        svc = SyncService(db, acct)
-        asyncio.run(svc.incremental_sync())
-        return {"ok": True}
+        return {"ok": True, "coalesced": not ran}
     except Exception as e:
         return {"ok": False, "error": str(e)}
-    finally:
-        db.close()
 
 
 @shared_task
 def schedule_incremental_for_all():
-    """Enqueue per-account incremental syncs.
-    This is idempotent and safe to run periodically.
+    """Enqueue an activity check for every account that is due.
+    This is idempotent and safe to run periodically (every SYNC_SCHED_TICK_S).
     """
 
     db: Session = SessionLocal()
     try:
-        acct_ids = [str(r.id) for r in db.query(models.GmailAccount.id).all()]
+        acct_ids = claim_due_accounts(db)
     finally:
         db.close()
 
     for aid in acct_ids:
-        incremental_sync_account.delay(aid)
+        check_account_activity.delay(aid)
     return {"queued": len(acct_ids)}
+
+
+@shared_task
+def check_account_activity(acct_id: str):
+    """
+    One getProfile call: an account whose historyId hasn't moved only gets
+    its change rate decayed and its next check pushed out; otherwise a full
+    incremental sync is enqueued (or coalesced into the one running).
+    """
+    async def check(svc: SyncService) -> bool:
+        try:
+            prof = await svc.client.get_profile()
+        except Exception as e:
+            logger.warning("activity check failed for %s: %r", acct_id, e)
+            back_off(svc.acct)
+            await svc.db.commit()
+            return False
+        latest = str(prof.get("historyId") or "")
+        if svc.acct.history_id and latest == svc.acct.history_id:
+            observe_changes(svc.acct, 0)
+            await svc.db.commit()
+            return False
+        return True
+
+    moved = _with_service(acct_id, check)
+    if moved is None:
+        return {"ok": False, "error": "account_not_found"}
+    if not moved:
+        return {"ok": True, "moved": False}
+    # accounts mid-sync get a rerun flag instead of a second, overlapping task
+    if run_async(coalesce_if_running(acct_id, "scheduled")):
+        return {"ok": True, "moved": True, "coalesced": True}
+    incremental_sync_account.delay(acct_id)
+    return {"ok": True, "moved": True}
+
+
+# --- sharded initial sync ---
+#
+# initial_sync_coordinator lists the mailbox and fans out metadata shards;
+# the chord callback initial_sync_finalize stores history_id and fans out
+# body hydration shards (newest first); initial_sync_complete closes the run.
+# Shards are idempotent (upserts), so a failed one is simply retried.
+# The coordinator takes the account's sync lease; every later task renews it
+# with the token passed along, keep_initial_lease renews it while shards wait
+# in the queue, and initial_sync_complete releases it.
+
+
+def _with_service(acct_id: str, fn: Callable[[SyncService], Awaitable[Any]]) -> Any:
+    async def run():
+        async with async_session() as db:
+            acct = await db.get(models.GmailAccount, uuid.UUID(acct_id))
+            if not acct:
+                return None
+            return await fn(SyncService(db, acct))
+
+    return run_async(run())
+
+
+def _lease(acct_id: str, token: Optional[str] = None) -> SyncLease:
+    return SyncLease(acct_id, "initial", ttl_s=settings.SYNC_SHARD_LEASE_TTL_S, token=token)
+
+
+def _fan_out(shard_task, acct_id: str, shards: List[List[str]], callback,
+             lease_token: Optional[str]):
+    if not shards:
+        callback.delay([])
+        return
+    chord(group(shard_task.s(acct_id, ids, lease_token) for ids in shards))(callback)
+
+
+def _run_shard(task, acct_id: str, mids: List[str], method: str,
+               lease_token: Optional[str]):
+    async def work(svc: SyncService):
+        if not lease_token:
+            return await getattr(svc, method)(mids)
+        lease = _lease(acct_id, lease_token)
+        await lease.renew()
+        # renewed every ttl/3 while the shard runs, however long it takes
+        async with lease.heartbeat():
+            return await getattr(svc, method)(mids)
+
+    try:
+        counts = _with_service(acct_id, work)
+    except Exception as e:
+        if task.request.retries < task.max_retries:
+            raise task.retry(exc=e, countdown=min(300, 10 * 2 ** task.request.retries))
+        # out of retries: report it instead of raising, or the chord never finishes
+        logger.exception("%s shard of %d ids failed for good", method, len(mids))
+        return {"ok": False, "ids": len(mids), "error": str(e)}
+    if counts is None:
+        return {"ok": False, "error": "account_not_found"}
+    return {"ok": True, **counts}
+
+
+@shared_task
+def initial_sync_coordinator(acct_id: str, q: Optional[str] = None):
+    """List the mailbox and enqueue metadata shards of SYNC_SHARD_SIZE ids."""
+    lease = _lease(acct_id)
+
+    async def plan(svc: SyncService):
+        if not await lease.acquire():
+            return False
+        try:
+            async with lease.heartbeat():
+                return await _plan(svc)
+        except BaseException:
+            await lease.drop()
+            raise
+
+    async def _plan(svc: SyncService):
+        run = await start_or_resume_run(svc.db, svc.acct.id, "initial", q)
+        svc.progress.reset()
+        svc.progress.update(state="listing", phase="metadata", sharded=True,
+                            run_id=str(run.id))
+        svc.progress.update_phase("metadata", state="listing")
+        # taken before listing: anything that changes meanwhile is replayed
+        # by the first incremental sync
+        prof = await svc.client.get_profile()
+        ids, listed = await svc.list_unsynced_ids(q, run)
+        run.total = listed
+        svc.db.add(run)
+        await svc.db.commit()
+
+        size = max(1, settings.SYNC_SHARD_SIZE)
+        shards = [ids[i:i + size] for i in range(0, len(ids), size)]
+        svc.progress.update(state="syncing", shards=len(shards))
+        svc.progress.update_phase("metadata", state="running", total=listed,
+                                  processed=listed - len(ids))
+        await svc.progress.aflush()
+        return str(run.id), str(prof.get("historyId") or ""), shards
+
+    res = _with_service(acct_id, plan)
+    if res is None:
+        return {"ok": False, "error": "account_not_found"}
+    if res is False:
+        return {"ok": True, "coalesced": True}
+    run_id, history_id, shards = res
+    keep_initial_lease.apply_async((acct_id, run_id, lease.token, time.time()),
+                                   countdown=settings.SYNC_SHARD_LEASE_TTL_S / 3)
+    _fan_out(sync_metadata_shard, acct_id, shards,
+             initial_sync_finalize.s(acct_id, run_id, history_id, lease.token),
+             lease.token)
+    return {"ok": True, "shards": len(shards)}
+
+
+@shared_task
+def keep_initial_lease(acct_id: str, run_id: str, lease_token: str, started: float):
+    """
+    Renew a sharded initial sync's lease every ttl/3 while its run is open,
+    so shards waiting in the queue don't let it expire. Stops once the run
+    is closed or the lease is lost, and after SYNC_SHARD_LEASE_MAX_S (a chord
+    that never completes must not hold the account forever).
+    """
+    if time.time() - started > settings.SYNC_SHARD_LEASE_MAX_S:
+        logger.warning("initial sync run %s still open after %ds; no longer renewing its lease",
+                       run_id, settings.SYNC_SHARD_LEASE_MAX_S)
+        return {"ok": False, "error": "expired"}
+
+    async def keep() -> bool:
+        async with async_session() as db:
+            run = await db.get(models.SyncRun, uuid.UUID(run_id))
+        if run is None or run.state != "running":
+            return False
+        return await _lease(acct_id, lease_token).renew()
+
+    if not run_async(keep()):
+        return {"ok": True, "renewing": False}
+    keep_initial_lease.apply_async((acct_id, run_id, lease_token, started),
+                                   countdown=settings.SYNC_SHARD_LEASE_TTL_S / 3)
+    return {"ok": True, "renewing": True}
+
+
+@shared_task(bind=True, max_retries=settings.SYNC_SHARD_MAX_RETRIES)
+def sync_metadata_shard(self, acct_id: str, mids: List[str], lease_token: Optional[str] = None):
+    return _run_shard(self, acct_id, mids, "sync_metadata_shard", lease_token)
+
+
+@shared_task
+def initial_sync_finalize(results: List[dict], acct_id: str, run_id: str, history_id: str,
+                          lease_token: Optional[str] = None):
+    """Chord callback of the metadata shards: set history_id, start hydration."""
+    failed = sum(1 for r in results or [] if not (r or {}).get("ok"))
+
+    async def finalize(svc: SyncService):
+        if not lease_token:
+            return await _finalize(svc)
+        lease = _lease(acct_id, lease_token)
+        await lease.renew()
+        async with lease.heartbeat():
+            return await _finalize(svc)
+
+    async def _finalize(svc: SyncService):
+        await svc.progress.load()
+        if history_id:
+            svc.acct.history_id = history_id
+            svc.db.add(svc.acct)
+            await svc.db.commit()
+        svc.progress.update_phase("metadata", state="done", failed_shards=failed)
+        await svc.record_db_counts()
+        shards = await svc.unhydrated_shards(max(1, settings.SYNC_SHARD_SIZE))
+        svc.progress.update(state="hydrating", phase="bodies", shards=len(shards))
+        svc.progress.update_phase("bodies", state="running",
+                                  total=sum(len(s) for s in shards),
+                                  processed=0, indexed=0, errors=0)
+        await svc.progress.aflush()
+        return shards
+
+    shards = _with_service(acct_id, finalize)
+    if shards is None:
+        return {"ok": False, "error": "account_not_found"}
+    _fan_out(hydrate_shard, acct_id, shards,
+             initial_sync_complete.s(acct_id, run_id, lease_token), lease_token)
+    return {"ok": True, "failed_shards": failed, "hydrate_shards": len(shards)}
+
+
+@shared_task(bind=True, max_retries=settings.SYNC_SHARD_MAX_RETRIES)
+def hydrate_shard(self, acct_id: str, mids: List[str], lease_token: Optional[str] = None):
+    return _run_shard(self, acct_id, mids, "hydrate_shard", lease_token)
+
+
+@shared_task
+def initial_sync_complete(results: List[dict], acct_id: str, run_id: str,
+                          lease_token: Optional[str] = None):
+    """Chord callback of the hydration shards; releases the sync lease."""
+    failed = sum(1 for r in results or [] if not (r or {}).get("ok"))
+
+    async def complete(svc: SyncService):
+        await svc.progress.load()
+        run = await svc.db.get(models.SyncRun, uuid.UUID(run_id))
+        if run is not None:
+            await finish_run(svc.db, run, "done")
+        svc.progress.update_phase("bodies", state="done", failed_shards=failed)
+        await svc.record_db_counts()
+        svc.progress.update(state="done", phase=None)
+        await svc.progress.aflush()
+        if not lease_token:
+            return False
+        # True: the lease is kept for the rerun
+        return await _lease(acct_id, lease_token).release()
+
+    # triggers coalesced while the shards ran get one incremental sync, which
+    # takes over the lease so no other sync can start in between
+    rerun = _with_service(acct_id, complete)
+    if rerun:
+        incremental_sync_account.delay(acct_id, lease_token)
+    return {"ok": True, "failed_shards": failed, "rerun": bool(rerun)}
@@ -0,0 +1,123 @@
+# app/tasks/worker_loop.py
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Coroutine, Optional
+
+from celery.signals import (worker_process_init, worker_process_shutdown,
+                            worker_shutdown)
+
+from ..db import aclose_async_engine, async_engine
+from ..services.ingest_pool import shutdown_pool
+from ..utils.embeddings import _client_lazy, aclose_client
+from ..utils.http import aclose_http_client, http_client
+from ..utils.redis_client import aclose_redis, get_redis
+from ..utils.vectorstore import _index_lazy
+
+logger = logging.getLogger(__name__)
+
+# how long worker shutdown waits for the pooled clients to close
+_CLOSE_TIMEOUT_S = 10
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+async def _open_clients():
+    # everything below caches per loop; building it here means the first
+    # task doesn't pay for TLS handshakes and pool setup
+    get_redis()
+    http_client()
+    async_engine()
+    try:
+        _client_lazy()
+        await asyncio.to_thread(_index_lazy)
+    except Exception as e:
+        # built again on first use; a missing key shouldn't stop the worker
+        logger.warning("worker loop: embedding clients not ready (%r)", e)
+
+
+async def _close_clients():
+    for close in (aclose_http_client, aclose_redis, aclose_async_engine, aclose_client):
+        try:
+            await close()
+        except Exception:
+            logger.exception("worker loop: %s failed", close.__name__)
+
+
+def start() -> asyncio.AbstractEventLoop:
+    """
+    Start this process's event loop on a daemon thread and open the pooled
+    clients on it. Idempotent; a loop inherited through fork is dropped
+    (its thread did not survive) and replaced.
+    """
+    global _loop, _thread, _pid
+    with _lock:
+        if _loop is not None and _pid == os.getpid():
+            return _loop
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name="celery-async-loop",
+                                  daemon=True)
+        thread.start()
+        _loop, _thread, _pid = loop, thread, os.getpid()
+    asyncio.run_coroutine_threadsafe(_open_clients(), loop).result()
+    logger.info("worker loop started in pid %s", _pid)
+    return loop
+
+
+def run_async(coro: Coroutine[Any, Any, Any]) -> Any:
+    """
+    Run `coro` on the worker's event loop and block the calling task until
+    it is done. Replaces asyncio.run() in tasks, which built (and tore down)
+    a loop, a DB pool, Redis and HTTP connections for every task.
+    """
+    loop = _loop if _loop is not None and _pid == os.getpid() else start()
+    fut = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return fut.result()
+    except BaseException:
+        # e.g. a soft time limit raised in the task thread: stop the coroutine too
+        fut.cancel()
+        raise
+
+
+def stop():
+    """Close the pooled clients, then stop and close the loop."""
+    global _loop, _thread, _pid
+    with _lock:
+        loop, thread = _loop, _thread
+        if loop is None or _pid != os.getpid():
+            return
+        _loop = _thread = _pid = None
+    try:
+        asyncio.run_coroutine_threadsafe(_close_clients(), loop).result(_CLOSE_TIMEOUT_S)
+    except Exception:
+        logger.exception("worker loop: closing clients failed")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(_CLOSE_TIMEOUT_S)
+    if not thread.is_alive():
+        loop.close()
+    shutdown_pool()
+    logger.info("worker loop stopped")
+
+
+# prefork children start their loop as soon as they are forked; solo and
+# thread pools start it lazily on the first run_async()
+@worker_process_init.connect
+def _on_process_init(**_):
+    start()
+
+
+@worker_process_shutdown.connect
+def _on_process_shutdown(**_):
+    stop()
+
+
+@worker_shutdown.connect
+def _on_worker_shutdown(**_):
+    stop()
@@ -0,0 +1,52 @@
+# app/utils/body_codec.py
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any, Optional
+
+import zstandard as zstd
+
+# email bodies are written once and read rarely: favour ratio a little
+ZSTD_LEVEL = 6
+
+# (de)compressor objects are not thread-safe; one pair per thread
+_local = threading.local()
+
+
+def _compressor() -> zstd.ZstdCompressor:
+    c = getattr(_local, "c", None)
+    if c is None:
+        c = _local.c = zstd.ZstdCompressor(level=ZSTD_LEVEL)
+    return c
+
+
+def _decompressor() -> zstd.ZstdDecompressor:
+    d = getattr(_local, "d", None)
+    if d is None:
+        d = _local.d = zstd.ZstdDecompressor()
+    return d
+
+
+def compress_text(s: Optional[str]) -> Optional[bytes]:
+    """zstd frame of the UTF-8 text; None for an empty body."""
+    if not s:
+        return None
+    return _compressor().compress(s.encode("utf-8", errors="surrogatepass"))
+
+
+def decompress_text(blob: Optional[bytes]) -> Optional[str]:
+    if blob is None:
+        return None
+    return _decompressor().decompress(blob).decode("utf-8", errors="replace")
+
+
+def compress_json(obj: Any) -> Optional[bytes]:
+    if not obj:
+        return None
+    return compress_text(json.dumps(obj, ensure_ascii=False, separators=(",", ":")))
+
+
+def decompress_json(blob: Optional[bytes]) -> Any:
+    text = decompress_text(blob)
+    return json.loads(text) if text is not None else None
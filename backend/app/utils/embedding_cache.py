@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+import struct
+import sys
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+
+from .. import models
+from ..config import settings
+from ..db import async_session
+from .time import utcnow
+
+logger = logging.getLogger(__name__)
+
+CACHE_TABLE = models.EmbeddingCache.__table__
+
+# keys per SELECT / rows per INSERT
+_IO_CHUNK = 1000
+# a hit only rewrites last_used_at when it is older than this
+_TOUCH_AFTER = timedelta(hours=1)
+# rows deleted per eviction round at most
+_EVICT_BATCH = 10_000
+
+_ws_re = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _ws_re.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def pack_vector(vec: List[float], dtype: str) -> bytes:
+    if dtype == "float16":
+        return struct.pack(f"<{len(vec)}e", *vec)
+    a = array("f", vec)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def unpack_vector(raw: bytes, dtype: str) -> List[float]:
+    if dtype == "float16":
+        return list(struct.unpack(f"<{len(raw) // 2}e", raw))
+    a = array("f")
+    a.frombytes(raw)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tolist()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store: Postgres table `embedding_cache` with
+    an optional in-process LRU (raw bytes, so entries stay compact) in front.
+
+    Keys are sha256(model, dims, normalized text); a model or dimension
+    change never returns stale vectors. Rows stored with another dtype (after
+    EMBED_CACHE_DTYPE changed) are still hits, converted on read, and are
+    replaced by the next write of their key. Every operation is best
+    effort: a database error is logged and treated as a miss.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        dims: Optional[int],
+        *,
+        dtype: str = "float32",
+        lru_size: int = 0,
+        max_rows: int = 0,
+        evict_interval_s: float = 300.0,
+    ):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"unsupported embedding cache dtype: {dtype!r}")
+        self.model = model
+        self.dims = dims or 0
+        self.dtype = dtype
+        self.lru_size = lru_size
+        self.max_rows = max_rows
+        self.evict_interval_s = evict_interval_s
+        self._lru: OrderedDict[bytes, bytes] = OrderedDict()
+        self._last_evict = 0.0
+        self._warned = False
+        self.counters: Dict[str, int] = {
+            "lookups": 0, "lru_hits": 0, "db_hits": 0, "misses": 0,
+            "stored": 0, "evicted": 0, "errors": 0,
+        }
+
+    def key(self, text: str) -> bytes:
+        h = hashlib.sha256()
+        h.update(f"{self.model}\0{self.dims}\0".encode())
+        h.update(normalize_text(text).encode("utf-8", errors="ignore"))
+        return h.digest()
+
+    # --- LRU ---
+
+    def _lru_get(self, key: bytes) -> Optional[bytes]:
+        raw = self._lru.get(key)
+        if raw is not None:
+            self._lru.move_to_end(key)
+        return raw
+
+    def _lru_put(self, key: bytes, raw: bytes):
+        if self.lru_size <= 0:
+            return
+        self._lru[key] = raw
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _failed(self, what: str, e: Exception):
+        self.counters["errors"] += 1
+        if not self._warned:
+            logger.warning("embedding cache %s failed (%r); continuing uncached", what, e)
+            self._warned = True
+
+    # --- lookups ---
+
+    async def _select(self, keys: List[bytes]) -> Dict[bytes, bytes]:
+        """Raw vectors (in self.dtype) for the keys found in the table."""
+        found: Dict[bytes, bytes] = {}
+        async with async_session() as db:
+            for i in range(0, len(keys), _IO_CHUNK):
+                chunk = keys[i:i + _IO_CHUNK]
+                rows = (await db.execute(
+                    select(CACHE_TABLE.c.key, CACHE_TABLE.c.dtype, CACHE_TABLE.c.vector)
+                    .where(CACHE_TABLE.c.key.in_(chunk))
+                )).all()
+                for r in rows:
+                    raw = bytes(r.vector)
+                    if r.dtype != self.dtype:
+                        raw = pack_vector(unpack_vector(raw, r.dtype), self.dtype)
+                    found[bytes(r.key)] = raw
+            if found:
+                now = utcnow()
+                hits = list(found)
+                for i in range(0, len(hits), _IO_CHUNK):
+                    await db.execute(
+                        update(CACHE_TABLE)
+                        .where(CACHE_TABLE.c.key.in_(hits[i:i + _IO_CHUNK]),
+                               CACHE_TABLE.c.last_used_at < now - _TOUCH_AFTER)
+                        .values(last_used_at=now)
+                    )
+                await db.commit()
+        return found
+
+    async def get_many(self, keys: Iterable[bytes]) -> Dict[bytes, List[float]]:
+        """{key: vector} for every key found in the LRU or the table."""
+        keys = list(dict.fromkeys(keys))
+        self.counters["lookups"] += len(keys)
+        out: Dict[bytes, List[float]] = {}
+        missing: List[bytes] = []
+        for k in keys:
+            raw = self._lru_get(k)
+            if raw is None:
+                missing.append(k)
+            else:
+                out[k] = unpack_vector(raw, self.dtype)
+        self.counters["lru_hits"] += len(out)
+
+        if missing:
+            try:
+                found = await self._select(missing)
+            except Exception as e:
+                self._failed("lookup", e)
+                found = {}
+            for k, raw in found.items():
+                self._lru_put(k, raw)
+                out[k] = unpack_vector(raw, self.dtype)
+            self.counters["db_hits"] += len(found)
+            self.counters["misses"] += len(missing) - len(found)
+        return out
+
+    # --- stores / eviction ---
+
+    async def _insert(self, rows: List[Dict]):
+        stmt = insert(CACHE_TABLE)
+        # a key already stored (e.g. in another dtype) takes the new vector
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CACHE_TABLE.c.key],
+            set_={c: stmt.excluded[c] for c in ("dims", "dtype", "vector", "last_used_at")},
+        )
+        async with async_session() as db:
+            for i in range(0, len(rows), _IO_CHUNK):
+                await db.execute(stmt, rows[i:i + _IO_CHUNK])
+            await db.commit()
+
+    async def _evict(self) -> int:
+        async with async_session() as db:
+            # planner estimate (kept by autovacuum), not a COUNT(*) scan;
+            # -1 until the table was first analyzed
+            count = (await db.execute(text(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = 'embedding_cache'::regclass"
+            ))).scalar_one()
+            excess = min(count - self.max_rows, _EVICT_BATCH)
+            if excess <= 0:
+                return 0
+            oldest = (select(CACHE_TABLE.c.key)
+                      .order_by(CACHE_TABLE.c.last_used_at.asc().nulls_first())
+                      .limit(excess))
+            res = await db.execute(delete(CACHE_TABLE).where(CACHE_TABLE.c.key.in_(oldest)))
+            await db.commit()
+            return res.rowcount or 0
+
+    async def put_many(self, items: Dict[bytes, List[float]]):
+        if not items:
+            return
+        now = utcnow()
+        rows = []
+        for k, vec in items.items():
+            raw = pack_vector(vec, self.dtype)
+            self._lru_put(k, raw)
+            rows.append({"key": k, "model": self.model, "dims": len(vec),
+                         "dtype": self.dtype, "vector": raw,
+                         "created_at": now, "last_used_at": now})
+        try:
+            await self._insert(rows)
+            self.counters["stored"] += len(rows)
+        except Exception as e:
+            self._failed("store", e)
+            return
+
+        # size bound: trim least recently used rows, at most once per interval
+        if self.max_rows > 0 and time.monotonic() - self._last_evict >= self.evict_interval_s:
+            self._last_evict = time.monotonic()
+            try:
+                evicted = await self._evict()
+            except Exception as e:
+                self._failed("eviction", e)
+                return
+            if evicted:
+                logger.info("embedding cache: evicted %d rows", evicted)
+                self.counters["evicted"] += evicted
+
+    def stats(self) -> Dict[str, float]:
+        c = self.counters
+        hits = c["lru_hits"] + c["db_hits"]
+        return {
+            **c,
+            "hit_rate": round(hits / c["lookups"], 4) if c["lookups"] else 0.0,
+            "lru_entries": len(self._lru),
+            "lru_size": self.lru_size,
+            "max_rows": self.max_rows,
+            "dtype": self.dtype,
+            "model": self.model,
+        }
+
+
+_cache: EmbeddingCache | None = None
+
+
+def embedding_cache(model: str) -> EmbeddingCache | None:
+    """Process-wide cache for `model`, or None when EMBED_CACHE_ENABLED is off."""
+    global _cache
+    if not settings.EMBED_CACHE_ENABLED:
+        return None
+    if _cache is None or _cache.model != model:
+        _cache = EmbeddingCache(
+            model,
+            settings.EMBEDDING_DIM,
+            dtype=settings.EMBED_CACHE_DTYPE,
+            lru_size=settings.EMBED_CACHE_LRU_SIZE,
+            max_rows=settings.EMBED_CACHE_MAX_ROWS,
+        )
+    return _cache
+
+
+def cache_stats() -> Dict[str, float]:
+    return _cache.stats() if _cache is not None else {"enabled": settings.EMBED_CACHE_ENABLED}
@@ -1,12 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import List, Optional
+from typing import Dict, Hashable, List, Optional, Tuple
 
 from openai import AsyncOpenAI
 from tenacity import retry, stop_after_attempt, wait_exponential_jitter
 
 from ..config import settings
+from .embedding_cache import embedding_cache
+from .query_cache import query_cache
 
 _client: AsyncOpenAI | None = None
 
@@ -22,6 +25,13 @@ def _client_lazy() -> AsyncOpenAI:
     return _client
 
 
+async def aclose_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+    _client = None
+
+
 MODEL = settings.EMBEDDING_MODEL or "text-embedding-3-large"
 
 
@@ -31,21 +41,164 @@ async def embed_text(text: str) -> Optional[List[float]]:
     text = (text or "").strip()
     if not text:
         return None
+    cache = embedding_cache(MODEL)
+    if cache:
+        key = cache.key(text)
+        hit = (await cache.get_many([key])).get(key)
+        if hit is not None:
+            return hit
     client = _client_lazy()
     resp = await client.embeddings.create(model=MODEL, input=[text])
     vec = resp.data[0].embedding
+    if cache:
+        await cache.put_many({key: vec})
     return vec
 
 
+# provider limits for one embeddings request
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=1, max=6))
+async def _embed_inputs(inputs: List[str]) -> List[List[float]]:
+    client = _client_lazy()
+    resp = await client.embeddings.create(model=MODEL, input=inputs)
+    # the API may not return items in input order
+    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+
+
 async def embed_batch(texts: List[str]) -> List[Optional[List[float]]]:
-    """Embed a batch of texts; keeps order; returns list where items can be None for empty inputs."""
+    """
+    Embed a batch of texts; keeps order; items are None for empty inputs.
+    Goes through EmbeddingBatcher, so the request limits hold for any size.
+    """
     if not texts:
         return []
-    client = _client_lazy()
-    inputs = [(t or "").strip() for t in texts]
-    resp = await client.embeddings.create(model=MODEL, input=inputs)
-    return [d.embedding if inputs[i] else None for i, d in enumerate(resp.data)]
+    batcher = EmbeddingBatcher()
+    for i, text in enumerate(texts):
+        batcher.add(i, text)
+    vecs = await batcher.run()
+    return [vecs.get(i) for i in range(len(texts))]
+
+
+async def embed_query(query: str) -> Optional[List[float]]:
+    """
+    Embed a search/chat query through the query-vector cache (in-process,
+    then Redis). Queries skip the persistent chunk cache on purpose.
+    """
+    query = (query or "").strip()
+    if not query:
+        return None
+    cache = query_cache(MODEL)
+    vec = await cache.get(query)
+    if vec is None:
+        vec = (await _embed_inputs([query]))[0]
+        await cache.put(query, vec)
+    return vec
+
+
+def _estimate_tokens(text: str) -> int:
+    # ~4 chars/token for English; 3 keeps us safely under the request cap
+    return len(text) // 3 + 1
+
+
+class EmbeddingBatcher:
+    """
+    Collects texts from many callers (e.g. chunks of many emails) and embeds
+    them in as few requests as the provider limits allow.
+
+        batcher = EmbeddingBatcher()
+        batcher.add((message_id, chunk_index), chunk_text, n_tokens)
+        vectors = await batcher.run()   # {(message_id, chunk_index): vec | None}
+
+    Empty texts are never sent and map to None, like `embed_text`. Identical
+    texts are sent once, and texts found in the embedding cache not at all.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_inputs: int = MAX_INPUTS_PER_REQUEST,
+        max_tokens: int | None = None,
+        concurrency: int | None = None,
+    ):
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens or settings.EMBED_MAX_TOKENS_PER_REQUEST
+        self.concurrency = concurrency or settings.EMBED_REQUEST_CONCURRENCY
+        self._items: List[Tuple[Hashable, str, int]] = []
+        self._empty: List[Hashable] = []
+
+    def add(self, key: Hashable, text: str, n_tokens: int | None = None):
+        text = (text or "").strip()
+        if not text:
+            self._empty.append(key)
+            return
+        n = n_tokens if n_tokens is not None else _estimate_tokens(text)
+        self._items.append((key, text, max(1, n)))
+
+    def __len__(self) -> int:
+        return len(self._items) + len(self._empty)
+
+    def _pack(self, items: List[Tuple[Hashable, str, int]]) -> List[List[Tuple[Hashable, str, int]]]:
+        """Greedy packing by input count and summed token estimate."""
+        groups: List[List[Tuple[Hashable, str, int]]] = []
+        cur: List[Tuple[Hashable, str, int]] = []
+        cur_tokens = 0
+        for item in items:
+            n = item[2]
+            if cur and (len(cur) >= self.max_inputs or cur_tokens + n > self.max_tokens):
+                groups.append(cur)
+                cur, cur_tokens = [], 0
+            cur.append(item)
+            cur_tokens += n
+        if cur:
+            groups.append(cur)
+        return groups
+
+    async def run(self) -> Dict[Hashable, Optional[List[float]]]:
+        out: Dict[Hashable, Optional[List[float]]] = {k: None for k in self._empty}
+        owners: Dict[str, List[Hashable]] = {}
+        unique: List[Tuple[Hashable, str, int]] = []
+        for item in self._items:
+            keys = owners.get(item[1])
+            if keys is None:
+                owners[item[1]] = [item[0]]
+                unique.append(item)
+            else:
+                keys.append(item[0])
+        self._items, self._empty = [], []
+
+        cache = embedding_cache(MODEL)
+        cache_keys: Dict[str, bytes] = {}
+        if cache and unique:
+            cache_keys = {text: cache.key(text) for _, text, _ in unique}
+            hits = await cache.get_many(cache_keys.values())
+            todo = []
+            for item in unique:
+                vec = hits.get(cache_keys[item[1]])
+                if vec is None:
+                    todo.append(item)
+                    continue
+                for key in owners[item[1]]:
+                    out[key] = vec
+            unique = todo
+
+        fresh: Dict[str, List[float]] = {}
+        sem = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def send(group: List[Tuple[Hashable, str, int]]):
+            async with sem:
+                vecs = await _embed_inputs([text for _, text, _ in group])
+            for (_, text, _), vec in zip(group, vecs):
+                fresh[text] = vec
+                for key in owners[text]:
+                    out[key] = vec
+
+        await asyncio.gather(*(send(g) for g in self._pack(unique)))
+        if cache and fresh:
+            await cache.put_many({cache_keys[t]: vec for t, vec in fresh.items()})
+        return out
 
 
 def build_embedding_text(subject: str | None, body_text: str | None) -> str:
@@ -1,138 +1,374 @@
+import asyncio
+import json
 import logging
+import random
+import re
+import uuid
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 import httpx
-from sqlalchemy.orm import Session
+from sqlalchemy import update
 
 from .. import models
 from ..config import settings
+from ..db import async_session
+from . import google_oauth
+from .http import http_client
+from .rate_limit import GMAIL_QUOTA_COST, GmailRateLimiter
 from .security import decrypt, encrypt
 
 GMAIL_API = "https://gmail.googleapis.com/gmail/v1/users"
-TOKEN_URL = "https://oauth2.googleapis.com/token"
+GMAIL_BATCH_URL = "https://gmail.googleapis.com/batch/gmail/v1"
+
+# Gmail rejects batches of more than 100 calls
+GMAIL_BATCH_MAX = 100
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+RATE_LIMIT_RETRIES = 6
+# headers kept by format=METADATA fetches (everything an EmailMessage row stores)
+METADATA_HEADERS = ("Subject", "From", "To", "Cc", "Bcc", "Date")
 
 logger = logging.getLogger(__name__)
 
 
+class GmailApiError(Exception):
+    """A failed Gmail call (or a failed sub-request of a batch)."""
+
+    def __init__(self, status_code: int, reason: str = "", message_id: str | None = None):
+        self.status_code = status_code
+        self.reason = reason
+        self.message_id = message_id
+        super().__init__(f"gmail {status_code} {reason} ({message_id})")
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status_code == 429 or \
+            (self.status_code == 403 and self.reason in RATE_LIMIT_REASONS)
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code in RETRYABLE_STATUS or self.rate_limited
+
+
+def _error_reason(body: Any) -> str:
+    """Pull the Google error reason (e.g. `rateLimitExceeded`) out of an error payload."""
+    if not isinstance(body, dict):
+        return ""
+    err = body.get("error") or {}
+    if not isinstance(err, dict):
+        return str(err)
+    errors = err.get("errors") or []
+    if errors and isinstance(errors[0], dict) and errors[0].get("reason"):
+        return errors[0]["reason"]
+    return err.get("status") or err.get("message") or ""
+
+
+def _is_rate_limited(r: httpx.Response) -> bool:
+    if r.status_code == 429:
+        return True
+    if r.status_code != 403:
+        return False
+    try:
+        return _error_reason(r.json()) in RATE_LIMIT_REASONS
+    except ValueError:
+        return False
+
+
+def _backoff(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return min(2 ** attempt, 32) * (0.5 + random.random())
+
+
+_boundary_re = re.compile(r'boundary="?([^";]+)"?', re.I)
+_content_id_re = re.compile(rb"content-id:\s*<response-([^>]+)>", re.I)
+_blank_line_re = re.compile(rb"\r?\n\r?\n")
+
+
+def _build_batch_body(boundary: str, ids: List[str], params: str) -> bytes:
+    parts = []
+    for i, mid in enumerate(ids):
+        parts.append(
+            f"--{boundary}\r\n"
+            "Content-Type: application/http\r\n"
+            f"Content-ID: <{i}>\r\n\r\n"
+            f"GET /gmail/v1/users/me/messages/{mid}?{params}\r\n\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    return "".join(parts).encode()
+
+
+def _parse_batch_response(content: bytes, content_type: str,
+                          raw: bool = False) -> List[Tuple[str, int, Any]]:
+    """
+    Split a multipart/mixed batch response into (content_id, status, json_body).
+    Each part wraps a raw HTTP response: status line, headers, blank line, body.
+    With `raw`, 2xx bodies are returned as the undecoded JSON bytes.
+    """
+    m = _boundary_re.search(content_type or "")
+    if not m:
+        raise ValueError(f"batch response has no boundary: {content_type!r}")
+    delim = b"--" + m.group(1).encode()
+
+    out: List[Tuple[str, int, Any]] = []
+    for part in content.split(delim)[1:]:
+        if part.startswith(b"--"):
+            break
+        outer = _blank_line_re.split(part.strip(b"\r\n"), 1)
+        if len(outer) != 2:
+            continue
+        outer_headers, http = outer
+        cid = _content_id_re.search(outer_headers)
+        inner = _blank_line_re.split(http, 1)
+        status_line = inner[0].split(b"\n", 1)[0].split()
+        try:
+            status = int(status_line[1])
+        except (IndexError, ValueError):
+            continue
+        body: Any = None
+        if raw and 200 <= status < 300 and len(inner) == 2:
+            body = inner[1]
+        elif len(inner) == 2 and inner[1].strip():
+            try:
+                body = json.loads(inner[1])
+            except ValueError:
+                body = inner[1].decode(errors="ignore")
+        out.append((cid.group(1).decode() if cid else "", status, body))
+    return out
+
+
 class GmailClient:
 
-    def __init__(self, db: Session, acct: models.GmailAccount):
-        self.db = db
+    def __init__(self, acct: models.GmailAccount):
         self.acct = acct
+        # concurrent fetches must not all refresh the same expired token
+        self._token_lock = asyncio.Lock()
+        self._scope_checked_for: str | None = None
+        self.limiter = GmailRateLimiter(str(acct.id))
 
-    async def _ensure_token(self):
+    def _token_fresh(self) -> bool:
         now = datetime.now(timezone.utc)
-        if self.acct.expiry and self.acct.expiry - now > timedelta(minutes=5):
+        return bool(self.acct.expiry and self.acct.expiry - now > timedelta(minutes=5))
+
+    async def _ensure_token(self):
+        if self._token_fresh():
             return
+        async with self._token_lock:
+            if self._token_fresh():
+                return
+            await self._refresh_token()
+
+    async def _refresh_token(self):
+        now = datetime.now(timezone.utc)
         if not self.acct.refresh_token:
             return
-        refresh = decrypt(self.acct.refresh_token)
-        async with httpx.AsyncClient(timeout=20) as client:
-            data = {
-                "client_id": settings.GOOGLE_CLIENT_ID,
-                "client_secret": settings.GOOGLE_CLIENT_SECRET,
-                "refresh_token": refresh,
-                "grant_type": "refresh_token",
-            }
-            r = await client.post(TOKEN_URL, data=data)
-            r.raise_for_status()
-            payload = r.json()
-            access_token = payload["access_token"]
-            expires_in = payload.get("expires_in", 3600)
-            new_expiry = now + timedelta(seconds=expires_in)
-            self.acct.access_token = encrypt(access_token)
-            self.acct.expiry = new_expiry
-            self.db.add(self.acct)
-            self.db.commit()
+        payload = await google_oauth.refresh_access_token(
+            decrypt(self.acct.refresh_token))
+        expires_in = payload.get("expires_in", 3600)
+        self.acct.access_token = encrypt(payload["access_token"])
+        self.acct.expiry = now + timedelta(seconds=expires_in)
+        if payload.get("scope"):
+            self.acct.token_scope = payload["scope"]
+        self.acct.token_updated_at = now
+        # a session of its own: the caller's may be busy in another task
+        A = models.GmailAccount
+        async with async_session() as db:
+            await db.execute(
+                update(A).where(A.id == self.acct.id).values(
+                    access_token=self.acct.access_token,
+                    expiry=self.acct.expiry,
+                    token_scope=self.acct.token_scope,
+                    token_updated_at=now,
+                )
+            )
+            await db.commit()
 
     async def _auth_headers(self) -> Dict[str, str]:
         """helper method to build Authorization header"""
         await self._ensure_token()
         access = decrypt(
             self.acct.access_token) if self.acct.access_token else None
+        if access and access != self._scope_checked_for:
+            await self._check_scope(access)
         return {"Authorization": f"Bearer {access}"}
 
-    async def list_message_ids(self, q: Optional[str] = None, label_ids: Optional[Iterable[str]] = None):
-        """Yield Gmail message IDs (IDs only) with optional query/labels."""
-        url = f"{GMAIL_API}/me/messages"
-        headers = await self._auth_headers()
-        live_token = headers["Authorization"].split()[-1]
+    async def _check_scope(self, access: str):
+        """Verify gmail.readonly was granted; runs once per access token."""
+        try:
+            scopes = await google_oauth.token_scopes(access)
+        except httpx.HTTPError as e:
+            logger.warning("tokeninfo lookup failed for %s: %r",
+                           self.acct.id, e)
+            return
+        self._scope_checked_for = access
+        if google_oauth.GMAIL_READONLY_SCOPE not in scopes:
+            logger.error("gmail account %s token lacks %s (granted: %s)",
+                         self.acct.id, google_oauth.GMAIL_READONLY_SCOPE, " ".join(sorted(scopes)))
+
+    async def _get(self, method: str, url: str, *, params: Optional[Dict[str, Any]] = None,
+                   timeout: float = 30) -> Dict[str, Any]:
+        """
+        GET a Gmail endpoint under the account's quota limiter. Rate-limit
+        responses slow the shared limiter down and are retried with backoff
+        instead of failing the caller.
+        """
+        attempt = 0
+        while True:
+            await self.limiter.acquire(GMAIL_QUOTA_COST[method])
+            headers = await self._auth_headers()
+            r = await http_client().get(url, headers=headers, params=params, timeout=timeout)
+            if _is_rate_limited(r) and attempt + 1 < RATE_LIMIT_RETRIES:
+                await self.limiter.on_rate_limited()
+                await asyncio.sleep(_backoff(attempt, r.headers.get("retry-after")))
+                attempt += 1
+                continue
+            try:
+                r.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                logger.error("gmail %s error: %s", method, e.response.text)
+                raise
+            await self.limiter.on_success()
+            return r.json()
 
-        async with httpx.AsyncClient() as c:
-            info = (await c.get("https://oauth2.googleapis.com/tokeninfo",
-                                params={"access_token": live_token})).json()
-        print("LIST MESSAGE IDS LIVE token scopes:", info.get("scope"))
+    async def list_message_pages(self, q: Optional[str] = None,
+                                 label_ids: Optional[Iterable[str]] = None,
+                                 page_token: Optional[str] = None):
+        """Yield (message_ids, next_page_token) per listing page, optionally resuming at `page_token`."""
+        url = f"{GMAIL_API}/me/messages"
         params: Dict[str, Any] = {"maxResults": 500}
         if q:
             params["q"] = q
         if label_ids:
             params["labelIds"] = list(label_ids)
-        next_token = None
-        async with httpx.AsyncClient(timeout=None) as client:
-            while True:
-                if next_token:
-                    params["pageToken"] = next_token
-                r = await client.get(url, headers=headers, params=params)
-                try:
-                    r.raise_for_status()
-                except httpx.HTTPStatusError as e:
-                    try:
-                        print("Gmail error JSON:", e.response.json())
-                    except Exception:
-                        print("Gmail error text:", e.response.text)
-                    raise
-                data = r.json()
-                for m in data.get("messages", []):
-                    yield m["id"]
-                next_token = data.get("nextPageToken")
-                if not next_token:
-                    break
+        next_token = page_token
+        while True:
+            if next_token:
+                params["pageToken"] = next_token
+            data = await self._get("messages.list", url, params=params, timeout=60)
+            next_token = data.get("nextPageToken")
+            yield [m["id"] for m in data.get("messages", [])], next_token
+            if not next_token:
+                break
+
+    async def list_message_ids(self, q: Optional[str] = None, label_ids: Optional[Iterable[str]] = None):
+        """Yield Gmail message IDs (IDs only) with optional query/labels."""
+        async for ids, _ in self.list_message_pages(q=q, label_ids=label_ids):
+            for mid in ids:
+                yield mid
 
     async def get_message_full(self, message_id: str) -> Dict[str, Any]:
         url = f"{GMAIL_API}/me/messages/{message_id}"
+        return await self._get("messages.get", url, params={"format": "FULL"})
+
+    async def _send_batch(self, client: httpx.AsyncClient, ids: List[str],
+                          params: str, raw: bool = False
+                          ) -> Dict[str, Union[Dict[str, Any], bytes, GmailApiError]]:
+        """One batch HTTP request; returns a result or error for every id sent."""
+        boundary = f"batch_{uuid.uuid4().hex}"
+        # each sub-request is billed like a standalone call
+        await self.limiter.acquire(GMAIL_QUOTA_COST["messages.get"] * len(ids))
         headers = await self._auth_headers()
-        live_token = headers["Authorization"].split()[-1]
-
-        async with httpx.AsyncClient() as c:
-            info = (await c.get("https://oauth2.googleapis.com/tokeninfo",
-                                params={"access_token": live_token})).json()
-        print("LIVE token scopes:", info.get("scope"))
-        params = {"format": "FULL"}
-        async with httpx.AsyncClient(timeout=30) as client:
+        headers["Content-Type"] = f"multipart/mixed; boundary={boundary}"
+        try:
+            r = await client.post(GMAIL_BATCH_URL, headers=headers,
+                                  content=_build_batch_body(boundary, ids, params),
+                                  timeout=60)
+            r.raise_for_status()
+            parts = _parse_batch_response(
+                r.content, r.headers.get("content-type", ""), raw)
+        except httpx.HTTPStatusError as e:
             try:
-                # use lowercase
-                r = await client.get(url, headers=headers, params=params)
-                r.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                try:
-                    print("Gmail get error:", e.response.json())
-                except Exception:
-                    print("Gmail get error text:", e.response.text)
-                raise
-            return r.json()
+                reason = _error_reason(e.response.json())
+            except Exception:
+                reason = ""
+            if e.response.status_code == 429 or reason in RATE_LIMIT_REASONS:
+                await self.limiter.on_rate_limited()
+            return {mid: GmailApiError(e.response.status_code, reason, mid) for mid in ids}
+        except (httpx.TransportError, ValueError) as e:
+            logger.warning("gmail batch request failed: %r", e)
+            return {mid: GmailApiError(503, "transport", mid) for mid in ids}
+
+        results: Dict[str, Union[Dict[str, Any], GmailApiError]] = {}
+        for cid, status, body in parts:
+            try:
+                mid = ids[int(cid)]
+            except (ValueError, IndexError):
+                continue
+            if 200 <= status < 300 and isinstance(body, (bytes, dict)):
+                results[mid] = body
+            else:
+                results[mid] = GmailApiError(status, _error_reason(body), mid)
+        # a sub-request missing from the response is treated as transient
+        for mid in ids:
+            results.setdefault(mid, GmailApiError(503, "missing", mid))
+        if any(isinstance(r, GmailApiError) and r.rate_limited for r in results.values()):
+            await self.limiter.on_rate_limited()
+        else:
+            await self.limiter.on_success()
+        return results
+
+    async def get_messages_full_batch(
+        self,
+        ids: List[str],
+        *,
+        fmt: str = "FULL",
+        metadata_headers: Iterable[str] = (),
+        max_attempts: int = 4,
+        raw: bool = False,
+    ) -> Dict[str, Union[Dict[str, Any], bytes, GmailApiError]]:
+        """
+        Fetch many messages through Gmail's batch endpoint.
+
+        Returns {message_id: message_json | GmailApiError}; with `raw` the
+        message is left as JSON bytes, for parsing off the event loop. Sub-requests that
+        fail with a retryable status (429/5xx/rate-limit 403) are re-sent on
+        their own with exponential backoff; the rest are returned as errors.
+        """
+        if not ids:
+            return {}
+        size = max(1, min(settings.GMAIL_BATCH_SIZE, GMAIL_BATCH_MAX))
+        params = f"format={fmt}" + "".join(
+            f"&metadataHeaders={h}" for h in metadata_headers)
+        pending = list(dict.fromkeys(ids))
+        results: Dict[str, Union[Dict[str, Any], bytes, GmailApiError]] = {}
+
+        client = http_client()
+        for attempt in range(max_attempts):
+            if attempt:
+                await asyncio.sleep(_backoff(attempt))
+            retry: List[str] = []
+            for start in range(0, len(pending), size):
+                chunk = pending[start:start + size]
+                for mid, res in (await self._send_batch(client, chunk, params, raw)).items():
+                    results[mid] = res
+                    if isinstance(res, GmailApiError) and res.retryable:
+                        retry.append(mid)
+            if not retry:
+                break
+            logger.info("gmail batch: retrying %d/%d sub-requests",
+                        len(retry), len(pending))
+            pending = retry
+        return results
+
+    async def get_messages_metadata_batch(
+        self, ids: List[str]
+    ) -> Dict[str, Union[Dict[str, Any], GmailApiError]]:
+        """Headers, labels, snippet and size only; no body parts."""
+        return await self.get_messages_full_batch(
+            ids, fmt="METADATA", metadata_headers=METADATA_HEADERS)
 
     async def get_history(self, start_history_id: str, page_token: Optional[str] = None) -> Dict[str, Any]:
         url = f"{GMAIL_API}/me/history"
-        headers = await self._auth_headers()
         params: Dict[str, Any] = {
             "startHistoryId": start_history_id,
             "historyTypes": ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
             "maxResults": 1000,
         }
-        logger.info("r.json()")
         if page_token:
             params["pageToken"] = page_token
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.get(url, headers=headers, params=params)
-            r.raise_for_status()
-            logger.info("r.json() ", r.json())
-            return r.json()
+        return await self._get("history.list", url, params=params)
 
     async def get_profile(self) -> Dict[str, Any]:
         url = f"{GMAIL_API}/me/profile"
-        headers = await self._auth_headers()
-        async with httpx.AsyncClient(timeout=20) as client:
-            r = await client.get(url, headers=headers)
-            r.raise_for_status()
-            return r.json()
+        return await self._get("getProfile", url, timeout=20)
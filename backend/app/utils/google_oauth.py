@@ -1,13 +1,23 @@
+import hashlib
+import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from urllib.parse import urlencode
 
-import httpx
-
 from ..config import settings
+from .http import http_client
 
 AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
 TOKEN_URL = "https://oauth2.googleapis.com/token"
+TOKENINFO_URL = "https://oauth2.googleapis.com/tokeninfo"
 USERINFO_URL = "https://openidconnect.googleapis.com/v1/userinfo"
+GMAIL_READONLY_SCOPE = "https://www.googleapis.com/auth/gmail.readonly"
+
+logger = logging.getLogger(__name__)
+
+# sha256(access_token) -> granted scopes; tokens live ~1h so a small LRU is plenty
+_SCOPE_CACHE: "OrderedDict[str, frozenset[str]]" = OrderedDict()
+_SCOPE_CACHE_MAX = 1024
 
 # SCOPES = (settings.GOOGLE_OAUTH_SCOPES or "").split()
 
@@ -36,26 +46,72 @@ def build_auth_url(state: str) -> str:
 
 
 async def exchange_code_for_tokens(code: str):
-    async with httpx.AsyncClient(timeout=20) as client:
-        data = {
-            "code": code,
-            "client_id": settings.GOOGLE_CLIENT_ID,
-            "client_secret": settings.GOOGLE_CLIENT_SECRET,
-            "redirect_uri": settings.GOOGLE_REDIRECT_URI,
-            "grant_type": "authorization_code",
-        }
-        r = await client.post(TOKEN_URL, data=data)
-        r.raise_for_status()
-        payload = r.json()
-        access_token = payload["access_token"]
-        refresh_token = payload.get("refresh_token")
-        expires_in = payload.get("expires_in", 3600)
-        expiry = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
-        return access_token, refresh_token, expiry, payload
+    data = {
+        "code": code,
+        "client_id": settings.GOOGLE_CLIENT_ID,
+        "client_secret": settings.GOOGLE_CLIENT_SECRET,
+        "redirect_uri": settings.GOOGLE_REDIRECT_URI,
+        "grant_type": "authorization_code",
+    }
+    r = await http_client().post(TOKEN_URL, data=data, timeout=20)
+    r.raise_for_status()
+    payload = r.json()
+    access_token = payload["access_token"]
+    refresh_token = payload.get("refresh_token")
+    expires_in = payload.get("expires_in", 3600)
+    expiry = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    remember_token_scopes(access_token, payload.get("scope"))
+    return access_token, refresh_token, expiry, payload
+
+
+async def refresh_access_token(refresh_token: str) -> dict:
+    data = {
+        "client_id": settings.GOOGLE_CLIENT_ID,
+        "client_secret": settings.GOOGLE_CLIENT_SECRET,
+        "refresh_token": refresh_token,
+        "grant_type": "refresh_token",
+    }
+    r = await http_client().post(TOKEN_URL, data=data, timeout=20)
+    r.raise_for_status()
+    payload = r.json()
+    remember_token_scopes(payload["access_token"], payload.get("scope"))
+    return payload
 
 
 async def fetch_userinfo(access_token: str):
-    async with httpx.AsyncClient(timeout=20) as client:
-        r = await client.get(USERINFO_URL, headers={"Authorization": f"Bearer {access_token}"})
-        r.raise_for_status()
-        return r.json()
+    r = await http_client().get(USERINFO_URL, headers={"Authorization": f"Bearer {access_token}"},
+                                timeout=20)
+    r.raise_for_status()
+    return r.json()
+
+
+def _token_key(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode()).hexdigest()
+
+
+def _cache_scopes(key: str, scopes: frozenset[str]):
+    _SCOPE_CACHE[key] = scopes
+    _SCOPE_CACHE.move_to_end(key)
+    while len(_SCOPE_CACHE) > _SCOPE_CACHE_MAX:
+        _SCOPE_CACHE.popitem(last=False)
+
+
+def remember_token_scopes(access_token: str, scope: str | None):
+    """Cache the scopes Google reported when it issued `access_token`."""
+    if not access_token or not scope:
+        return
+    _cache_scopes(_token_key(access_token), frozenset(scope.split()))
+
+
+async def token_scopes(access_token: str) -> frozenset[str]:
+    """Granted scopes for a token; hits `tokeninfo` at most once per token."""
+    key = _token_key(access_token)
+    cached = _SCOPE_CACHE.get(key)
+    if cached is not None:
+        _SCOPE_CACHE.move_to_end(key)
+        return cached
+    r = await http_client().get(TOKENINFO_URL, params={"access_token": access_token}, timeout=20)
+    r.raise_for_status()
+    scopes = frozenset((r.json().get("scope") or "").split())
+    _cache_scopes(key, scopes)
+    return scopes
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+import httpx
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+_clients_built = 0
+
+
+def _build_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    try:
+        return httpx.AsyncClient(
+            http2=True,
+            limits=limits,
+            timeout=httpx.Timeout(30, connect=10),
+        )
+    except ImportError:
+        # `h2` missing: keep pooling/keep-alive, just over HTTP/1.1
+        logger.warning("h2 not installed; shared HTTP client falls back to HTTP/1.1")
+        return httpx.AsyncClient(
+            limits=limits,
+            timeout=httpx.Timeout(30, connect=10),
+        )
+
+
+def _close_stale(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop | None):
+    """Close a client left behind on another loop, on that loop."""
+    if client.is_closed or loop is None:
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+    elif not loop.is_closed():
+        loop.run_until_complete(client.aclose())
+    else:
+        # its loop is gone (e.g. asyncio.run returned): nothing can await the
+        # close any more; the sockets go when the client is collected
+        logger.debug("shared HTTP client dropped with its closed loop")
+
+
+def http_client() -> httpx.AsyncClient:
+    """
+    Process-wide pooled client for Google APIs (Gmail + OAuth).
+
+    Connections belong to the event loop that opened them, so a new client is
+    built if we are called from a different loop than the cached one; the
+    old one is closed on its own loop while that still exists.
+    """
+    global _client, _client_loop, _clients_built
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        if _client is not None and _client_loop is not loop:
+            try:
+                _close_stale(_client, _client_loop)
+            except Exception as e:
+                logger.debug("closing the previous HTTP client failed: %r", e)
+        _client = _build_client()
+        _client_loop = loop
+        _clients_built += 1
+    return _client
+
+
+async def aclose_http_client():
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    Connection pool usage, for sizing HTTP_MAX_CONNECTIONS.
+
+    Best effort: the counts come from httpx/httpcore internals, which are not
+    public API; on versions where they moved, only the configured limits and
+    `clients_built` are reported (with "introspection": False).
+    """
+    stats: Dict[str, Any] = {
+        "max_connections": settings.HTTP_MAX_CONNECTIONS,
+        "max_keepalive": settings.HTTP_MAX_KEEPALIVE,
+        "clients_built": _clients_built,
+        "connections": 0,
+        "active": 0,
+        "idle": 0,
+        "http2": 0,
+    }
+    if _client is None or _client.is_closed:
+        return stats
+    # httpx keeps the httpcore pool on its default transport; not public API
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    try:
+        conns = list(getattr(pool, "connections", None) or [])
+    except Exception:
+        conns = None
+    if pool is None or conns is None:
+        stats["introspection"] = False
+        return stats
+    stats["connections"] = len(conns)
+    for c in conns:
+        try:
+            if c.is_idle():
+                stats["idle"] += 1
+            else:
+                stats["active"] += 1
+            inner = getattr(c, "_connection", None)
+            if inner is not None and type(inner).__name__.startswith("AsyncHTTP2"):
+                stats["http2"] += 1
+        except Exception:
+            continue
+    return stats
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 import base64
+import html as htmllib
 import re
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 
 def _b64url_decode(s: str) -> bytes:
@@ -14,15 +15,78 @@ def _b64url_decode(s: str) -> bytes:
     return base64.urlsafe_b64decode(s)
 
 
-_tag_re = re.compile(r"<[^>]+>")
-_ws_re = re.compile(r"\s+")
+# one pass: <script>/<style>/<head> blocks with their content, comments, tags
+_html_drop_re = re.compile(
+    r"<(script|style|head)\b.*?</\1\s*>|<!--.*?-->|<[^>]*>", re.S | re.I)
+_charset_re = re.compile(r"""charset\s*=\s*["']?([\w.:-]+)""", re.I)
 
 
 def _strip_html(html: str) -> str:
 
-    text = _tag_re.sub(" ", html)
-    text = _ws_re.sub(" ", text)
-    return text.strip()
+    text = _html_drop_re.sub(" ", html)
+    if "&" in text:
+        text = htmllib.unescape(text)
+    return " ".join(text.split())
+
+
+def _header(part: Dict[str, Any], name: str) -> str:
+    for h in part.get("headers") or ():
+        if (h.get("name") or "").lower() == name:
+            return h.get("value") or ""
+    return ""
+
+
+def _is_attachment(part: Dict[str, Any]) -> bool:
+    if part.get("filename"):
+        return True
+    return _header(part, "content-disposition").lower().startswith("attachment")
+
+
+def _decode_part(part: Dict[str, Any]) -> str:
+    raw = _b64url_decode(part["body"]["data"])
+    m = _charset_re.search(_header(part, "content-type"))
+    if m:
+        try:
+            return raw.decode(m.group(1), errors="ignore")
+        except LookupError:
+            pass
+    return raw.decode("utf-8", errors="ignore")
+
+
+def _select(part: Dict[str, Any], plain: List[dict], html: List[dict]):
+    """
+    Collect the text/plain and text/html parts that make up the body,
+    without decoding anything: one alternative of each kind per
+    multipart/alternative, the root of a multipart/related, every inline
+    part of anything else (multipart/mixed, forwarded messages).
+    """
+    mime = (part.get("mimeType") or "").lower()
+    children = part.get("parts")
+    if children:
+        children = [c for c in children if not _is_attachment(c)]
+        if mime == "multipart/alternative":
+            # ordered plainest first; the last of each kind is the best one
+            best_plain: Optional[List[dict]] = None
+            best_html: Optional[List[dict]] = None
+            for c in children:
+                p: List[dict] = []
+                h: List[dict] = []
+                _select(c, p, h)
+                best_plain = p or best_plain
+                best_html = h or best_html
+            plain.extend(best_plain or ())
+            html.extend(best_html or ())
+        elif mime == "multipart/related":
+            if children:
+                _select(children[0], plain, html)
+        else:
+            for c in children:
+                _select(c, plain, html)
+    elif (part.get("body") or {}).get("data"):
+        if mime == "text/plain":
+            plain.append(part)
+        elif mime == "text/html":
+            html.append(part)
 
 
 def parse_message(gmsg: Dict[str, Any]) -> Tuple[Dict[str, str], str, str]:
@@ -32,38 +96,13 @@ def parse_message(gmsg: Dict[str, Any]) -> Tuple[Dict[str, str], str, str]:
     headers = {h.get("name", "").lower(): h.get("value", "")
                for h in headers_list}
 
-    def walk(parts):
-        if not parts:
-            return None
-        for p in parts:
-            mime = (p.get("mimeType") or "").lower()
-            body = p.get("body", {})
-            data = body.get("data")
-            if mime.startswith("text/plain") and data:
-                raw = _b64url_decode(data)
-                return (raw.decode(errors="ignore"), None)
-            if mime.startswith("text/html") and data:
-                raw = _b64url_decode(data)
-                return (None, raw.decode(errors="ignore"))
-            # nested multipart
-            res = walk(p.get("parts"))
-            if res:
-                return res
-        return None
-    body_text = body_html = None
-
-    if payload.get("body", {}).get("data"):
-        mime = (payload.get("mimeType") or "").lower()
-        raw = _b64url_decode(payload["body"]["data"]).decode(errors="ignore")
-        if mime.startswith("text/plain"):
-            body_text = raw
-        elif mime.startswith("text/html"):
-            body_html = raw
-    else:
-        res = walk(payload.get("parts"))
-        if res:
-            body_text, body_html = res
-
-    if body_text is None and body_html:
-        body_text = _strip_html(body_html)
-    return headers, (body_text or ""), (body_html or "")
+    plain: List[dict] = []
+    html: List[dict] = []
+    _select(payload, plain, html)
+
+    # the HTML alternative is kept for display; the indexed text comes from
+    # the plain one when there is one, so the HTML is never stripped then
+    body_html = "\n".join(_decode_part(p) for p in html)
+    if plain:
+        return headers, "\n".join(_decode_part(p) for p in plain), body_html
+    return headers, (_strip_html(body_html) if body_html else ""), body_html
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from .embedding_cache import normalize_text, pack_vector, unpack_vector
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class QueryVectorCache:
+    """
+    Query embeddings for /search and chat, keyed by (model, normalized query).
+
+    A TTL-bounded in-process LRU, backed by an optional Redis tier (float32
+    bytes, base64) so every API worker shares what one of them embedded.
+    Redis errors count as misses.
+    """
+
+    def __init__(self, model: str, *, size: int, ttl_s: float,
+                 redis_ttl_s: int, use_redis: bool):
+        self.model = model
+        self.size = size
+        self.ttl_s = ttl_s
+        self.redis_ttl_s = redis_ttl_s
+        self.use_redis = use_redis
+        self._lru: OrderedDict[str, Tuple[float, List[float]]] = OrderedDict()
+        self._redis_warned = False
+        self.counters: Dict[str, int] = {
+            "lookups": 0, "lru_hits": 0, "redis_hits": 0, "misses": 0, "redis_errors": 0,
+        }
+
+    def key(self, query: str) -> str:
+        norm = normalize_text(query).casefold()
+        digest = hashlib.sha256(f"{self.model}\0{norm}".encode("utf-8", errors="ignore"))
+        return f"qemb:{digest.hexdigest()}"
+
+    def _redis_failed(self, e: Exception):
+        self.counters["redis_errors"] += 1
+        if not self._redis_warned:
+            logger.warning("query cache: redis unavailable (%r); using local tier only", e)
+            self._redis_warned = True
+
+    def _lru_put(self, key: str, vec: List[float]):
+        if self.size <= 0:
+            return
+        self._lru[key] = (time.monotonic() + self.ttl_s, vec)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    async def get(self, query: str) -> Optional[List[float]]:
+        key = self.key(query)
+        self.counters["lookups"] += 1
+        entry = self._lru.get(key)
+        if entry is not None:
+            expires, vec = entry
+            if expires > time.monotonic():
+                self._lru.move_to_end(key)
+                self.counters["lru_hits"] += 1
+                return vec
+            del self._lru[key]
+
+        if self.use_redis:
+            try:
+                raw = await get_redis().get(key)
+            except Exception as e:
+                self._redis_failed(e)
+                raw = None
+            if raw:
+                vec = unpack_vector(base64.b64decode(raw), "float32")
+                self._lru_put(key, vec)
+                self.counters["redis_hits"] += 1
+                return vec
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, query: str, vec: List[float]):
+        key = self.key(query)
+        self._lru_put(key, vec)
+        if self.use_redis:
+            try:
+                await get_redis().set(
+                    key, base64.b64encode(pack_vector(vec, "float32")).decode(),
+                    ex=self.redis_ttl_s)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def stats(self) -> Dict[str, float]:
+        c = self.counters
+        hits = c["lru_hits"] + c["redis_hits"]
+        return {
+            **c,
+            "hit_rate": round(hits / c["lookups"], 4) if c["lookups"] else 0.0,
+            "lru_entries": len(self._lru),
+            "size": self.size,
+            "ttl_s": self.ttl_s,
+            "redis": self.use_redis,
+        }
+
+
+_cache: QueryVectorCache | None = None
+
+
+def query_cache(model: str) -> QueryVectorCache:
+    global _cache
+    if _cache is None or _cache.model != model:
+        _cache = QueryVectorCache(
+            model,
+            size=settings.QUERY_EMBED_CACHE_SIZE,
+            ttl_s=settings.QUERY_EMBED_CACHE_TTL_S,
+            redis_ttl_s=settings.QUERY_EMBED_CACHE_REDIS_TTL_S,
+            use_redis=settings.QUERY_EMBED_CACHE_REDIS,
+        )
+    return _cache
+
+
+def query_cache_stats() -> Dict[str, float]:
+    return _cache.stats() if _cache is not None else {"lookups": 0}
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+
+from ..config import settings
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Gmail per-user quota units per call
+# https://developers.google.com/gmail/api/reference/quota
+GMAIL_QUOTA_COST: Dict[str, int] = {
+    "messages.get": 5,
+    "messages.list": 5,
+    "history.list": 2,
+    "getProfile": 1,
+}
+
+# Token bucket with reservation: a caller always takes its units and sleeps off
+# any debt, so waiters are served in arrival order. `rate` lives in the same
+# hash so AIMD adjustments are shared by every worker.
+_ACQUIRE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local units = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local rate = tonumber(b[3]) or tonumber(ARGV[3])
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - units
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 3600)
+local wait = 0
+if tokens < 0 then wait = -tokens / rate end
+return tostring(wait) .. ' ' .. tostring(rate)
+"""
+
+# ARGV: mode ('inc' | 'dec'), max_rate, min_rate, step, cooldown_s
+_ADJUST_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local max_rate = tonumber(ARGV[2])
+local min_rate = tonumber(ARGV[3])
+local b = redis.call('HMGET', KEYS[1], 'rate', 'cut_at')
+local rate = tonumber(b[1]) or max_rate
+if ARGV[1] == 'dec' then
+  local cut_at = tonumber(b[2]) or 0
+  if now - cut_at < tonumber(ARGV[5]) then return tostring(rate) end
+  rate = math.max(min_rate, rate / 2)
+  redis.call('HSET', KEYS[1], 'rate', rate, 'cut_at', now)
+else
+  if rate >= max_rate then return tostring(rate) end
+  rate = math.min(max_rate, rate + tonumber(ARGV[4]))
+  redis.call('HSET', KEYS[1], 'rate', rate)
+end
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(rate)
+"""
+
+
+class _LocalBucket:
+    """In-process fallback with the same semantics as the Redis scripts."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.tokens = burst
+        self.ts = time.monotonic()
+        self.cut_at = 0.0
+
+    def acquire(self, units: float, burst: float) -> float:
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens +
+                          max(0.0, now - self.ts) * self.rate) - units
+        self.ts = now
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, mode: str, max_rate: float, min_rate: float, step: float, cooldown: float):
+        now = time.monotonic()
+        if mode == "dec":
+            if now - self.cut_at >= cooldown:
+                self.rate = max(min_rate, self.rate / 2)
+                self.cut_at = now
+        else:
+            self.rate = min(max_rate, self.rate + step)
+
+
+_local: Dict[str, _LocalBucket] = {}
+_redis_warned = False
+
+
+class GmailRateLimiter:
+    """
+    Per-account Gmail quota limiter, weighted by method cost.
+
+    Shared through Redis across asyncio tasks, API workers and Celery
+    workers; falls back to an in-process bucket if Redis is unreachable.
+    The refill rate follows AIMD: +GMAIL_QUOTA_INCREASE units/s per success,
+    halved (at most once per cooldown) when Google says rateLimitExceeded.
+    """
+
+    def __init__(self, account_key: str):
+        self.key = f"gmail:quota:{account_key}"
+        self.max_rate = float(settings.GMAIL_QUOTA_UNITS_PER_SEC)
+        self.min_rate = float(settings.GMAIL_QUOTA_MIN_UNITS_PER_SEC)
+        self.burst = self.max_rate
+        self.step = float(settings.GMAIL_QUOTA_INCREASE)
+        self.cooldown = 1.0
+        # last rate seen; lets on_success skip the round trip at full speed
+        self.rate = self.max_rate
+
+    def _bucket(self) -> _LocalBucket:
+        b = _local.get(self.key)
+        if b is None:
+            b = _local[self.key] = _LocalBucket(self.max_rate, self.burst)
+        return b
+
+    async def _script(self, script: str, *args) -> str | None:
+        global _redis_warned
+        if not settings.GMAIL_RATE_LIMIT_SHARED:
+            return None
+        try:
+            return await get_redis().eval(script, 1, self.key, *args)
+        except Exception as e:
+            if not _redis_warned:
+                logger.warning("gmail rate limiter: redis unavailable (%r); using local bucket", e)
+                _redis_warned = True
+            return None
+
+    async def acquire(self, units: int):
+        # a single call may cost more than the bucket holds (a 100-call
+        # batch); take it in burst-sized pieces
+        remaining = float(units)
+        while remaining > 0:
+            take = min(remaining, self.burst)
+            remaining -= take
+            res = await self._script(_ACQUIRE_LUA, take, self.burst, self.max_rate)
+            if res is not None:
+                wait_s, rate_s = res.split()
+                wait, self.rate = float(wait_s), float(rate_s)
+            else:
+                bucket = self._bucket()
+                wait, self.rate = bucket.acquire(take, self.burst), bucket.rate
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def on_success(self):
+        if self.rate < self.max_rate:
+            await self._adjust("inc")
+
+    async def on_rate_limited(self):
+        logger.info("gmail rate limited on %s; halving rate", self.key)
+        await self._adjust("dec")
+
+    async def _adjust(self, mode: str):
+        args: Tuple = (mode, self.max_rate, self.min_rate, self.step, self.cooldown)
+        res = await self._script(_ADJUST_LUA, *args)
+        if res is not None:
+            self.rate = float(res)
+        else:
+            bucket = self._bucket()
+            bucket.adjust(*args)
+            self.rate = bucket.rate
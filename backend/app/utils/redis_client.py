@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import asyncio
+
+import redis.asyncio as aioredis
+
+from ..config import settings
+
+_client: aioredis.Redis | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    Process-wide async Redis client (REDIS_URL).
+
+    Like the shared HTTP client, its connections belong to one event loop, so
+    a new client is built when called from a different loop.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        _client_loop = loop
+    return _client
+
+
+async def aclose_redis():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
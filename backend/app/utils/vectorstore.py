@@ -1,13 +1,19 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict, List, Optional
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from pinecone import Pinecone
 from tenacity import retry, stop_after_attempt, wait_exponential_jitter
 
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 _pc: Pinecone | None = None
 _index = None
 
@@ -33,6 +39,76 @@ async def upsert_vectors(items: List[Dict[str, Any]], namespace: str) -> Dict[st
     return {"upserted": len(items)}
 
 
+def _vector_bytes(v: Dict[str, Any]) -> int:
+    """Serialized size of one vector as it goes over the wire (JSON)."""
+    return len(json.dumps(v, separators=(",", ":"), default=str).encode())
+
+
+class UpsertAggregator:
+    """
+    Buffers vectors of many messages and upserts them in batches bounded by
+    both vector count and serialized bytes (Pinecone caps a request at 2MB /
+    1000 vectors). Batches go out in parallel with bounded concurrency.
+
+    `flush()` reports per owner (usually a message_id): None when every batch
+    holding one of its vectors landed, else the exception of a failed batch.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        *,
+        max_vectors: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ):
+        self.namespace = namespace
+        self.max_vectors = max_vectors or settings.PINECONE_UPSERT_MAX_VECTORS
+        self.max_bytes = max_bytes or settings.PINECONE_UPSERT_MAX_BYTES
+        self.concurrency = concurrency or settings.PINECONE_UPSERT_CONCURRENCY
+        self._owners: Dict[str, None] = {}
+        self._batches: List[Tuple[List[Dict[str, Any]], set]] = []
+        self._cur: List[Dict[str, Any]] = []
+        self._cur_owners: set = set()
+        self._cur_bytes = 0
+
+    def add(self, owner: str, vectors: List[Dict[str, Any]]):
+        self._owners.setdefault(owner)
+        for v in vectors:
+            size = _vector_bytes(v)
+            if self._cur and (len(self._cur) >= self.max_vectors or
+                              self._cur_bytes + size > self.max_bytes):
+                self._seal()
+            self._cur.append(v)
+            self._cur_owners.add(owner)
+            self._cur_bytes += size
+
+    def _seal(self):
+        if self._cur:
+            self._batches.append((self._cur, self._cur_owners))
+        self._cur, self._cur_owners, self._cur_bytes = [], set(), 0
+
+    async def flush(self) -> Dict[str, Optional[BaseException]]:
+        self._seal()
+        batches, owners = self._batches, self._owners
+        self._batches, self._owners = [], {}
+        result: Dict[str, Optional[BaseException]] = {o: None for o in owners}
+        sem = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def send(items: List[Dict[str, Any]], batch_owners: set):
+            try:
+                async with sem:
+                    await upsert_vectors(items, namespace=self.namespace)
+            except Exception as e:
+                logger.error("pinecone upsert of %d vectors failed: %r",
+                             len(items), e)
+                for o in batch_owners:
+                    result[o] = e
+
+        await asyncio.gather(*(send(items, o) for items, o in batches))
+        return result
+
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=1, max=6))
 async def delete_ids(ids: List[str], namespace: str):
     if not ids:
@@ -60,7 +136,90 @@ async def delete_by_filter(namespace: str, where: Optional[Dict[str, Any]] = Non
     return {"deleted": "unknown"}  # Pinecone doesn’t return count here
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=1, max=6))
+# passes over a group's ids; each pass retries only the ids that failed
+UPDATE_ATTEMPTS = 3
+
+
+def _update_group(index, items: List[Tuple[str, Dict[str, Any]]], namespace: str) -> List[Tuple[str, BaseException]]:
+    """
+    Update each id of the group, retrying the failed ones with backoff (a
+    throttled or transient error should not leave stale label filters).
+    Runs in a worker thread. Returns the ids that failed every attempt.
+    """
+    failed: List[Tuple[str, Dict[str, Any], BaseException]] = []
+    pending = items
+    for attempt in range(UPDATE_ATTEMPTS):
+        if attempt:
+            time.sleep(min(2 ** attempt, 6) * (0.5 + random.random()))
+        failed = []
+        for vid, meta in pending:
+            try:
+                index.update(id=vid, set_metadata=meta, namespace=namespace)
+            except Exception as e:
+                failed.append((vid, meta, e))
+        if not failed:
+            return []
+        pending = [(vid, meta) for vid, meta, _ in failed]
+    return [(vid, e) for vid, _, e in failed]
+
+
+def _list_chunk_ids(index, message_id: str, namespace: str) -> List[str]:
+    ids: List[str] = []
+    for page in index.list(prefix=f"{message_id}#", namespace=namespace):
+        ids.extend(page)
+    return ids
+
+
+async def update_message_metadata(
+    namespace: str,
+    metadata: Dict[str, Dict[str, Any]],
+    chunk_counts: Dict[str, Optional[int]],
+    *,
+    group_size: int = 50,
+    concurrency: Optional[int] = None,
+) -> Dict[str, Optional[BaseException]]:
+    """
+    Merge `metadata[message_id]` into the metadata of every chunk vector of
+    each message (ids `{message_id}#{idx}`), leaving the embeddings alone.
+
+    Chunk ids come from `chunk_counts`; a message whose count is unknown
+    (None) has its ids listed by prefix. Pinecone updates one id per call, so
+    the updates of all messages are spread over `concurrency` worker threads.
+    Returns {message_id: None | exception of a failed update}.
+    """
+    index = _index_lazy()
+    result: Dict[str, Optional[BaseException]] = {mid: None for mid in metadata}
+    items: List[Tuple[str, Dict[str, Any]]] = []
+    owner: Dict[str, str] = {}
+    for mid, meta in metadata.items():
+        count = chunk_counts.get(mid)
+        if count is None:
+            try:
+                ids = await asyncio.to_thread(_list_chunk_ids, index, mid, namespace)
+            except Exception as e:
+                logger.error("pinecone list of %s chunks failed: %r", mid, e)
+                result[mid] = e
+                continue
+        else:
+            ids = [f"{mid}#{i}" for i in range(count)]
+        for vid in ids:
+            items.append((vid, meta))
+            owner[vid] = mid
+
+    sem = asyncio.Semaphore(max(1, concurrency or settings.PINECONE_UPDATE_CONCURRENCY))
+
+    async def send(group: List[Tuple[str, Dict[str, Any]]]):
+        async with sem:
+            failed = await asyncio.to_thread(_update_group, index, group, namespace)
+        for vid, e in failed:
+            logger.error("pinecone metadata update of %s failed: %r", vid, e)
+            result[owner[vid]] = e
+
+    await asyncio.gather(*(send(items[i:i + group_size])
+                           for i in range(0, len(items), group_size)))
+    return result
+
+
 async def query_top_k(namespace: str, vector: List[float], top_k: int = 8, filter: Optional[dict] = None):
     index = _index_lazy()
     res = await asyncio.to_thread(
@@ -0,0 +1,119 @@
+"""
+Event-loop stall / tail latency: blocking Session vs AsyncSession.
+
+Runs the /emails list queries (COUNT + one page, newest first) from many
+concurrent coroutines on one event loop, the way request handlers do:
+
+  sync   -- SessionLocal on the loop, as the handlers did before the port
+  async  -- async_session(), as they do now
+
+Requests arrive at a fixed --rate (open loop) and latency is measured from
+each one's arrival, so time spent queued behind a blocked event loop
+counts. Meanwhile a ticker coroutine wakes every 10 ms and records how
+late it was; that lag is what every other request (and SSE stream) on the
+worker waits. Needs DATABASE_URL pointing at a database with synced mail.
+
+    python scripts/bench_async_session.py --account <gmail_account uuid> \\
+        --rate 3 --requests 150
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func, select  # noqa: E402
+
+from app import models  # noqa: E402
+from app.db import SessionLocal, aclose_async_engine, async_session  # noqa: E402
+
+TICK_S = 0.01
+
+
+def _queries(acct_id):
+    E = models.EmailMessage
+    where = E.gmail_account_id == acct_id
+    count = select(func.count()).select_from(E).where(where)
+    page = (select(E.id, E.subject, E.from_addr, E.date, E.snippet)
+            .where(where).order_by(E.date.desc().nulls_last(), E.id).limit(50))
+    return count, page
+
+
+async def _sync_request(acct_id):
+    count, page = _queries(acct_id)
+    with SessionLocal() as db:
+        db.execute(count).scalar_one()
+        db.execute(page).all()
+
+
+async def _async_request(acct_id):
+    count, page = _queries(acct_id)
+    async with async_session() as db:
+        (await db.execute(count)).scalar_one()
+        (await db.execute(page)).all()
+
+
+def _pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(p / 100 * len(xs)))] * 1000
+
+
+async def run(mode: str, acct_id, concurrency: int, requests: int, rate: float):
+    request = _sync_request if mode == "sync" else _async_request
+    latencies, lags = [], []
+    stop = asyncio.Event()
+
+    async def ticker():
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            t = loop.time()
+            await asyncio.sleep(TICK_S)
+            lags.append(max(0.0, loop.time() - t - TICK_S))
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(arrival: float):
+        # a blocked loop delays the wake-up too: latency counts from arrival
+        await asyncio.sleep(max(0.0, arrival - time.perf_counter()))
+        async with sem:
+            await request(acct_id)
+        latencies.append(time.perf_counter() - arrival)
+
+    await request(acct_id)  # warm the pool
+    tick = asyncio.create_task(ticker())
+    t0 = time.perf_counter()
+    gap = 1 / rate if rate > 0 else 0.0
+    await asyncio.gather(*(one(t0 + i * gap) for i in range(requests)))
+    wall = time.perf_counter() - t0
+    stop.set()
+    await tick
+    await aclose_async_engine()
+
+    print(f"{mode:>5}: {requests / wall:7.1f} req/s  "
+          f"latency p50 {_pct(latencies, 50):7.1f} ms  p99 {_pct(latencies, 99):7.1f} ms  "
+          f"loop lag p50 {_pct(lags, 50):6.1f} ms  p99 {_pct(lags, 99):6.1f} ms  "
+          f"max {max(lags) * 1000:6.1f} ms  (mean lag {statistics.mean(lags) * 1000:.1f} ms)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--account", required=True, help="gmail_account.id to query")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--requests", type=int, default=500)
+    ap.add_argument("--rate", type=float, default=0,
+                    help="arrivals per second (0: all at once)")
+    ap.add_argument("--mode", choices=("sync", "async", "both"), default="both")
+    args = ap.parse_args()
+    acct_id = uuid.UUID(args.account)
+    for mode in (("sync", "async") if args.mode == "both" else (args.mode,)):
+        asyncio.run(run(mode, acct_id, args.concurrency, args.requests, args.rate))
+
+
+if __name__ == "__main__":
+    main()
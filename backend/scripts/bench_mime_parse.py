@@ -0,0 +1,158 @@
+"""
+Micro-benchmark for utils/mime_parse.parse_message against the parser it
+replaced (first text/* part in walk order, whole-string regex stripping).
+
+    python scripts/bench_mime_parse.py                  # synthetic corpus
+    python scripts/bench_mime_parse.py --corpus DIR     # *.json messages.get
+                                                        # format=FULL responses
+
+The synthetic corpus mimics the common Gmail shapes: HTML-only newsletters
+with a large <style> block, multipart/alternative with the HTML part first,
+and multipart/mixed (alternative + attachment).
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.utils import mime_parse  # noqa: E402
+
+
+# --- the previous implementation, kept verbatim as the baseline ---
+
+def _b64url_decode(s):
+    s = s or ""
+    pad = (-len(s)) % 4
+    if pad:
+        s += "=" * pad
+    return base64.urlsafe_b64decode(s)
+
+
+_tag_re = re.compile(r"<[^>]+>")
+_ws_re = re.compile(r"\s+")
+
+
+def _strip_html(html):
+    text = _tag_re.sub(" ", html)
+    text = _ws_re.sub(" ", text)
+    return text.strip()
+
+
+def baseline_parse_message(gmsg):
+    payload = gmsg.get("payload", {})
+    headers = {h.get("name", "").lower(): h.get("value", "")
+               for h in payload.get("headers", [])}
+
+    def walk(parts):
+        if not parts:
+            return None
+        for p in parts:
+            mime = (p.get("mimeType") or "").lower()
+            data = p.get("body", {}).get("data")
+            if mime.startswith("text/plain") and data:
+                return (_b64url_decode(data).decode(errors="ignore"), None)
+            if mime.startswith("text/html") and data:
+                return (None, _b64url_decode(data).decode(errors="ignore"))
+            res = walk(p.get("parts"))
+            if res:
+                return res
+        return None
+    body_text = body_html = None
+    if payload.get("body", {}).get("data"):
+        mime = (payload.get("mimeType") or "").lower()
+        raw = _b64url_decode(payload["body"]["data"]).decode(errors="ignore")
+        if mime.startswith("text/plain"):
+            body_text = raw
+        elif mime.startswith("text/html"):
+            body_html = raw
+    else:
+        res = walk(payload.get("parts"))
+        if res:
+            body_text, body_html = res
+    if body_text is None and body_html:
+        body_text = _strip_html(body_html)
+    return headers, (body_text or ""), (body_html or "")
+
+
+# --- corpora ---
+
+def _b64(s):
+    return base64.urlsafe_b64encode(s.encode()).decode().rstrip("=")
+
+
+def synthetic_corpus(n=300, seed=1):
+    rnd = random.Random(seed)
+    words = "the quick brown fox invoice meeting déjà vu schedule report".split()
+
+    def para(k):
+        return " ".join(rnd.choice(words) for _ in range(k))
+
+    style = "<style>" + ".c{color:red}" * 400 + "</style>"
+
+    def html_body(k):
+        return (f"<html><head>{style}</head><body>"
+                + "".join(f"<p class='c'>{para(40)} &amp; more</p>" for _ in range(k))
+                + "<script>var x=1;</script></body></html>")
+
+    def ct(v):
+        return [{"name": "Content-Type", "value": v}]
+
+    out = []
+    for i in range(n):
+        k = rnd.randint(5, 60)
+        plain = {"mimeType": "text/plain", "headers": ct("text/plain; charset=utf-8"),
+                 "body": {"data": _b64(para(40 * k))}}
+        html = {"mimeType": "text/html", "headers": ct("text/html; charset=utf-8"),
+                "body": {"data": _b64(html_body(k))}}
+        att = {"mimeType": "application/pdf", "filename": "a.pdf",
+               "body": {"attachmentId": "x"}}
+        if i % 3 == 0:
+            payload = {"mimeType": "text/html", "headers": [], "body": html["body"]}
+        elif i % 3 == 1:
+            payload = {"mimeType": "multipart/alternative", "headers": [], "body": {},
+                       "parts": [html, plain]}
+        else:
+            payload = {"mimeType": "multipart/mixed", "headers": [], "body": {},
+                       "parts": [{"mimeType": "multipart/alternative", "body": {},
+                                  "parts": [plain, html]}, att]}
+        out.append({"payload": payload})
+    return out
+
+
+def load_corpus(path):
+    out = []
+    for name in sorted(glob.glob(os.path.join(path, "*.json"))):
+        with open(name, encoding="utf-8") as f:
+            out.append(json.load(f))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--corpus", help="directory of format=FULL message JSON files")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    if not corpus:
+        sys.exit("empty corpus")
+    print(f"{len(corpus)} messages ({'from ' + args.corpus if args.corpus else 'synthetic'})")
+    for name, fn in (("baseline", baseline_parse_message), ("current", mime_parse.parse_message)):
+        t = min(timeit.repeat(lambda: [fn(m) for m in corpus],
+                              number=args.repeat, repeat=args.repeat)) / args.repeat
+        chars = sum(len(fn(m)[1]) for m in corpus)
+        print(f"{name:>8}: {t * 1000:8.1f} ms/pass  {t / len(corpus) * 1e6:7.1f} us/msg  "
+              f"text {chars} chars")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import pytest
+
+gmail_client = pytest.importorskip("app.utils.gmail_client")
+_parse_batch_response = gmail_client._parse_batch_response
+
+CT = "multipart/mixed; boundary=batch_abc"
+
+
+def _part(cid, status_line, body=b"", headers=b"Content-Type: application/json; charset=UTF-8"):
+    return (b"--batch_abc\r\n"
+            b"Content-Type: application/http\r\n"
+            b"Content-ID: <response-" + cid + b">\r\n\r\n"
+            + status_line + b"\r\n" + headers + b"\r\n\r\n" + body + b"\r\n")
+
+
+def _batch(*parts):
+    return b"".join(parts) + b"--batch_abc--\r\n"
+
+
+def test_parts_are_split_with_status_and_json_body():
+    content = _batch(
+        _part(b"0", b"HTTP/1.1 200 OK", b'{"id": "a"}'),
+        _part(b"1", b"HTTP/1.1 404 Not Found",
+              b'{"error": {"code": 404, "errors": [{"reason": "notFound"}]}}'),
+    )
+    out = _parse_batch_response(content, CT)
+    assert out == [
+        ("0", 200, {"id": "a"}),
+        ("1", 404, {"error": {"code": 404, "errors": [{"reason": "notFound"}]}}),
+    ]
+    assert gmail_client._error_reason(out[1][2]) == "notFound"
+
+
+def test_raw_keeps_success_bodies_undecoded():
+    content = _batch(
+        _part(b"0", b"HTTP/1.1 200 OK", b'{"id": "a"}'),
+        _part(b"1", b"HTTP/1.1 429 Too Many Requests", b'{"error": {"status": "x"}}'),
+    )
+    (cid0, s0, b0), (cid1, s1, b1) = _parse_batch_response(content, CT, raw=True)
+    assert (cid0, s0) == ("0", 200) and b0.strip() == b'{"id": "a"}'
+    # errors are still decoded so the caller can read the reason
+    assert (cid1, s1, b1) == ("1", 429, {"error": {"status": "x"}})
+
+
+def test_quoted_boundary_and_bare_newlines():
+    content = (b'--batch_abc\nContent-Type: application/http\nContent-ID: <response-7>\n\n'
+               b'HTTP/1.1 200 OK\nContent-Type: application/json\n\n{"id": "z"}\n'
+               b'--batch_abc--\n')
+    assert _parse_batch_response(content, 'multipart/mixed; boundary="batch_abc"') == \
+        [("7", 200, {"id": "z"})]
+
+
+def test_non_json_and_empty_bodies():
+    content = _batch(
+        _part(b"0", b"HTTP/1.1 503 Service Unavailable", b"backend error",
+              b"Content-Type: text/plain"),
+        _part(b"1", b"HTTP/1.1 204 No Content"),
+    )
+    assert _parse_batch_response(content, CT) == [
+        ("0", 503, "backend error"),
+        ("1", 204, None),
+    ]
+
+
+def test_malformed_parts_are_skipped():
+    content = _batch(
+        b"--batch_abc\r\ngarbage without a blank line\r\n",
+        _part(b"1", b"HTTP/1.1 nope"),
+        _part(b"2", b"HTTP/1.1 200 OK", b"{}"),
+    )
+    assert _parse_batch_response(content, CT) == [("2", 200, {})]
+
+
+def test_missing_boundary_raises():
+    with pytest.raises(ValueError):
+        _parse_batch_response(b"", "application/json")
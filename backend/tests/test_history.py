@@ -0,0 +1,101 @@
+from app.services.history import HistoryCoalescer
+
+
+def _msg(mid, labels=None):
+    m = {"id": mid, "threadId": "t" + mid}
+    if labels is not None:
+        m["labelIds"] = labels
+    return m
+
+
+def _added(hid, mid, labels=None):
+    return {"id": str(hid), "messagesAdded": [{"message": _msg(mid, labels)}]}
+
+
+def _deleted(hid, mid):
+    return {"id": str(hid), "messagesDeleted": [{"message": _msg(mid)}]}
+
+
+def _labels(hid, mid, key, changed, labels=None):
+    return {"id": str(hid), key: [{"message": _msg(mid, labels), "labelIds": changed}]}
+
+
+def _fold(*records):
+    c = HistoryCoalescer()
+    c.add_records(records)
+    return c
+
+
+def test_add_then_delete_is_never_fetched():
+    c = _fold(_added(1, "a", ["INBOX"]), _labels(2, "a", "labelsAdded", ["STARRED"]),
+              _deleted(3, "a"))
+    assert c.added() == []
+    assert c.deleted() == ["a"]
+    assert c.relabeled() == []
+
+
+def test_added_message_is_fetched_once():
+    c = _fold(_added(1, "a", ["INBOX"]), _added(2, "a", ["INBOX"]), _added(3, "b"))
+    assert c.added() == ["a", "b"]
+    assert len(c) == 2 and c.records == 3
+    assert c.latest_history_id == 3
+
+
+def test_label_edits_fold_into_one_change():
+    c = _fold(_labels(1, "a", "labelsAdded", ["STARRED"]),
+              _labels(2, "a", "labelsRemoved", ["UNREAD"]),
+              _labels(3, "a", "labelsRemoved", ["STARRED"]),
+              _labels(4, "a", "labelsAdded", ["IMPORTANT"]))
+    (ch,) = c.relabeled()
+    assert ch.labels is None
+    assert ch.labels_added == {"IMPORTANT"}
+    assert ch.labels_removed == {"UNREAD", "STARRED"}
+    assert ch.final_labels(["INBOX", "UNREAD", "STARRED"]) == ["IMPORTANT", "INBOX"]
+
+
+def test_full_label_set_replaces_earlier_edits():
+    c = _fold(_labels(1, "a", "labelsAdded", ["STARRED"]),
+              _labels(2, "a", "labelsRemoved", ["INBOX"], labels=["UNREAD"]))
+    (ch,) = c.relabeled()
+    assert ch.labels == ["UNREAD"]
+    assert not ch.labels_added and not ch.labels_removed
+    assert ch.final_labels(["INBOX", "STARRED"]) == ["UNREAD"]
+
+
+def test_delta_after_full_set_applies_on_top_of_it():
+    # labelsAdded without a labelIds snapshot must not be lost once a full
+    # set has been seen, nor be overwritten by the stored labels
+    c = _fold(_labels(1, "a", "labelsRemoved", ["INBOX"], labels=["UNREAD"]),
+              _labels(2, "a", "labelsAdded", ["STARRED"]))
+    (ch,) = c.relabeled()
+    assert ch.labels == ["UNREAD"]
+    assert ch.final_labels(["INBOX", "CATEGORY_SOCIAL"]) == ["STARRED", "UNREAD"]
+
+
+def test_removed_then_added_back_cancels_out():
+    c = _fold(_labels(1, "a", "labelsRemoved", ["UNREAD"]),
+              _labels(2, "a", "labelsAdded", ["UNREAD"]))
+    (ch,) = c.relabeled()
+    assert ch.labels_added == {"UNREAD"} and not ch.labels_removed
+    assert ch.final_labels(["INBOX"]) == ["INBOX", "UNREAD"]
+
+
+def test_existing_message_deleted_is_not_relabeled():
+    c = _fold(_labels(1, "a", "labelsAdded", ["STARRED"]), _deleted(2, "a"))
+    assert c.deleted() == ["a"]
+    assert c.relabeled() == []
+
+
+def test_new_message_labels_are_taken_from_its_records():
+    c = _fold(_added(1, "a", ["INBOX", "UNREAD"]),
+              _labels(2, "a", "labelsRemoved", ["UNREAD"]))
+    assert c.added() == ["a"]
+    assert c.relabeled() == []
+    assert c._changes["a"].final_labels(None) == ["INBOX"]
+
+
+def test_records_without_ids_are_ignored():
+    c = _fold({"id": "x", "messagesAdded": [{"message": {}}]},
+              {"messagesDeleted": [{}]})
+    assert len(c) == 0 and c.records == 2
+    assert c.latest_history_id == 0
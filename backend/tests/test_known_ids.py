@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+known_ids = pytest.importorskip("app.services.known_ids")
+KnownMessageIds = known_ids.KnownMessageIds
+_as_u64 = known_ids._as_u64
+
+
+class _Result:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def all(self):
+        return self._rows
+
+
+class FakeDb:
+    """Serves pre-cut keyset pages, then an empty one; records IN queries."""
+
+    def __init__(self, pages=(), found=()):
+        self.pages = [[(mid,) for mid in p] for p in pages]
+        self.found = list(found)
+        self.scalar_calls = 0
+
+    async def execute(self, stmt):
+        return _Result(self.pages.pop(0) if self.pages else [])
+
+    async def scalars(self, stmt):
+        self.scalar_calls += 1
+        return _Result(self.found)
+
+
+def _load(pages, max_ids=1_000):
+    return asyncio.run(KnownMessageIds.load(FakeDb(pages), "acct", max_ids))
+
+
+@pytest.mark.parametrize("mid,expected", [
+    ("18c2f0a1b2c3d4e5", 0x18c2f0a1b2c3d4e5),
+    ("ffffffffffffffff", 2 ** 64 - 1),
+    ("a", 10),
+    ("", None),
+    ("18C2F0A1B2C3D4E5", None),        # uppercase doesn't round-trip
+    ("018c2f0a1b2c3d4e", None),        # nor does a leading zero
+    ("18c2f0a1b2c3d4e5a", None),       # > 64 bits
+    ("<abc@example.com>", None),
+])
+def test_as_u64(mid, expected):
+    assert _as_u64(mid) == expected
+
+
+def test_missing_against_preloaded_ids():
+    known = _load([["18c0000000000001", "18c0000000000003"], ["18c0000000000005", "Legacy-ID"]])
+    assert known.preloaded and len(known) == 4
+    ids = ["18c0000000000005", "18c0000000000002", "Legacy-ID", "legacy-id", "18c0000000000003"]
+    assert asyncio.run(known.missing(ids)) == ["18c0000000000002", "legacy-id"]
+
+
+def test_ids_of_different_lengths_do_not_collide():
+    # "ab" and "00ab" are different ids; only canonical hex is packed, and
+    # shorter ids live in their own array
+    known = _load([["ab", "18c0000000000001", "fff"]])
+    assert asyncio.run(known.missing(["ab", "fff", "abc", "18c0000000000001"])) == ["abc"]
+
+
+def test_out_of_order_pages_are_sorted():
+    known = _load([["18c0000000000009", "18c0000000000001"], ["18c0000000000005"]])
+    assert list(known._packed[16]) == sorted(known._packed[16])
+    assert asyncio.run(known.missing(["18c0000000000001", "18c0000000000002"])) == \
+        ["18c0000000000002"]
+
+
+def test_over_max_ids_falls_back_to_in_queries():
+    db = FakeDb([["18c0000000000001", "18c0000000000002", "18c0000000000003"]],
+                found=["18c0000000000002"])
+    known = asyncio.run(KnownMessageIds.load(db, "acct", max_ids=2))
+    assert not known.preloaded
+    assert asyncio.run(known.missing(["18c0000000000002", "18c0000000000004"])) == \
+        ["18c0000000000004"]
+    assert db.scalar_calls == 1
+    assert asyncio.run(known.missing([])) == [] and db.scalar_calls == 1
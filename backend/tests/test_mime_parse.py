@@ -0,0 +1,106 @@
+import base64
+
+from app.utils.mime_parse import _decode_part, _select, parse_message
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _leaf(mime, text, charset="utf-8", **extra):
+    raw = text.encode(charset) if isinstance(text, str) else text
+    part = {"mimeType": mime,
+            "headers": [{"name": "Content-Type", "value": f"{mime}; charset={charset}"}],
+            "body": {"data": _b64(raw)}}
+    part.update(extra)
+    return part
+
+
+def _multi(mime, *parts):
+    return {"mimeType": mime, "headers": [], "body": {"size": 0}, "parts": list(parts)}
+
+
+def _pick(payload):
+    plain, html = [], []
+    _select(payload, plain, html)
+    return plain, html
+
+
+def test_decode_uses_declared_charset():
+    part = _leaf("text/plain", "déjà vu", charset="iso-8859-1")
+    assert _decode_part(part) == "déjà vu"
+
+
+def test_decode_quoted_and_unknown_charsets():
+    part = _leaf("text/plain", "naïve")
+    part["headers"] = [{"name": "content-type", "value": 'text/plain; charset="UTF-8"'}]
+    assert _decode_part(part) == "naïve"
+    part["headers"] = [{"name": "Content-Type", "value": "text/plain; charset=x-unknown"}]
+    assert _decode_part(part) == "naïve"
+
+
+def test_decode_without_padding_or_headers():
+    assert _decode_part({"body": {"data": _b64(b"ab")}}) == "ab"
+
+
+def test_alternative_keeps_one_of_each_whatever_the_order():
+    plain = _leaf("text/plain", "hi")
+    html = _leaf("text/html", "<p>hi</p>")
+    assert _pick(_multi("multipart/alternative", html, plain)) == ([plain], [html])
+    assert _pick(_multi("multipart/alternative", plain, html)) == ([plain], [html])
+
+
+def test_alternative_prefers_the_last_of_a_kind():
+    rich = _multi("multipart/related", _leaf("text/html", "<p>rich</p>"),
+                  {"mimeType": "image/png", "body": {"attachmentId": "i"}})
+    plain = _leaf("text/plain", "plain")
+    html_simple = _leaf("text/html", "<p>simple</p>")
+    p, h = _pick(_multi("multipart/alternative", plain, html_simple, rich))
+    assert p == [plain] and h == [rich["parts"][0]]
+
+
+def test_mixed_collects_inline_parts_and_skips_attachments():
+    body = _leaf("text/plain", "see attached")
+    att = _leaf("text/plain", "notes", filename="notes.txt")
+    disp = _leaf("text/plain", "log")
+    disp["headers"].append({"name": "Content-Disposition", "value": "attachment"})
+    footer = _leaf("text/plain", "-- footer")
+    p, h = _pick(_multi("multipart/mixed", body, att, disp, footer))
+    assert p == [body, footer] and h == []
+
+
+def test_related_uses_only_its_root():
+    root = _leaf("text/html", "<img src=cid:x>")
+    other = _leaf("text/html", "<p>not the body</p>")
+    assert _pick(_multi("multipart/related", root, other)) == ([], [root])
+
+
+def test_parts_without_data_are_ignored():
+    empty = {"mimeType": "text/plain", "body": {"size": 0}}
+    assert _pick(_multi("multipart/mixed", empty)) == ([], [])
+
+
+def test_parse_indexes_plain_and_keeps_html_for_display():
+    msg = {"payload": _multi("multipart/alternative",
+                             _leaf("text/html", "<p>HTML</p>"), _leaf("text/plain", "Plain"))}
+    msg["payload"]["headers"] = [{"name": "Subject", "value": "Hi"}]
+    headers, text, html = parse_message(msg)
+    assert headers == {"subject": "Hi"}
+    assert (text, html) == ("Plain", "<p>HTML</p>")
+
+
+def test_parse_plain_only():
+    assert parse_message({"payload": _leaf("text/plain", "just text")})[1:] == ("just text", "")
+
+
+def test_parse_html_only_strips_markup():
+    doc = ("<html><head><title>t</title><style>.a{}</style></head><body>"
+           "<script>var x = '<p>';</script><!-- c --><p>Tom &amp; Jerry</p>"
+           "<div>second\n\n line</div></body></html>")
+    headers, text, html = parse_message({"payload": _leaf("text/html", doc)})
+    assert text == "Tom & Jerry second line"
+    assert html == doc
+
+
+def test_parse_empty_message():
+    assert parse_message({}) == ({}, "", "")
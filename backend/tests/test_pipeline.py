@@ -0,0 +1,121 @@
+import asyncio
+
+from app.services.pipeline import Stage, run_pipeline
+
+
+async def _source(items):
+    for it in items:
+        yield it
+
+
+def _run(items, stages, **kw):
+    done, errors = {}, []
+    asyncio.run(run_pipeline(
+        _source(items), stages, key=str,
+        on_done=lambda k, r: done.__setitem__(k, r),
+        on_error=lambda k, stage, e: errors.append((k, stage)),
+        **kw))
+    return done, errors
+
+
+def test_items_flow_through_every_stage():
+    async def double(x):
+        return x * 2
+
+    async def inc(x):
+        return x + 1
+
+    done, errors = _run(range(20), [Stage("double", double, concurrency=3),
+                                    Stage("inc", inc, concurrency=2)])
+    assert done == {str(i): i * 2 + 1 for i in range(20)}
+    assert errors == []
+
+
+def test_failing_item_is_dropped_and_reported():
+    async def picky(x):
+        if x == 3:
+            raise ValueError("bad")
+        return x
+
+    done, errors = _run(range(5), [Stage("picky", picky)])
+    assert set(done) == {"0", "1", "2", "4"}
+    assert errors == [("3", "picky")]
+
+
+def test_none_result_ends_the_item_early():
+    seen = []
+
+    async def first(x):
+        return None if x % 2 else x
+
+    async def second(x):
+        seen.append(x)
+        return x
+
+    done, _ = _run(range(6), [Stage("first", first), Stage("second", second)])
+    assert sorted(seen) == [0, 2, 4]
+    assert done["1"] is None and done["4"] == 4
+
+
+def test_batches_are_bounded_and_per_item_errors_isolated():
+    sizes = []
+
+    async def batch(xs):
+        sizes.append(len(xs))
+        return [ValueError("odd") if x % 2 else x for x in xs]
+
+    done, errors = _run(range(10), [Stage("batch", batch, batch_size=4, linger=0.5)])
+    assert max(sizes) <= 4 and sum(sizes) == 10
+    assert set(done) == {"0", "2", "4", "6", "8"}
+    assert sorted(k for k, _ in errors) == ["1", "3", "5", "7", "9"]
+
+
+def test_batch_stage_raising_fails_the_whole_batch():
+    async def boom(xs):
+        raise RuntimeError("down")
+
+    done, errors = _run(range(3), [Stage("boom", boom, batch_size=8)])
+    assert done == {}
+    assert sorted(errors) == [("0", "boom"), ("1", "boom"), ("2", "boom")]
+
+
+def test_linger_flushes_a_partial_batch():
+    # the source stalls after two items: the batch must go out after
+    # `linger` rather than wait for a full batch
+    sizes = []
+
+    async def slow_source():
+        yield 1
+        yield 2
+        await asyncio.sleep(0.3)
+        yield 3
+
+    async def batch(xs):
+        sizes.append(len(xs))
+        return xs
+
+    done = {}
+    asyncio.run(run_pipeline(slow_source(), [Stage("b", batch, batch_size=10, linger=0.02)],
+                             key=str, on_done=lambda k, r: done.__setitem__(k, r)))
+    assert sizes == [2, 1]
+    assert set(done) == {"1", "2", "3"}
+
+
+def test_shutdown_with_many_workers_and_empty_source():
+    async def ident(x):
+        return x
+
+    # every worker of every stage must see _DONE or this hangs
+    done, _ = asyncio.run(asyncio.wait_for(asyncio.to_thread(
+        _run, [], [Stage("a", ident, concurrency=4),
+                   Stage("b", ident, concurrency=3, batch_size=5)]), 5))
+    assert done == {}
+
+
+def test_batch_returning_too_few_results_fails_every_item():
+    async def short(xs):
+        return xs[:-1]
+
+    done, errors = _run(range(3), [Stage("short", short, batch_size=8, linger=0.5)])
+    assert done == {}
+    assert sorted(errors) == [("0", "short"), ("1", "short"), ("2", "short")]
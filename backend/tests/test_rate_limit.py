@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+rate_limit = pytest.importorskip("app.utils.rate_limit")
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """A limiter on the in-process bucket (no Redis), with sleeps recorded."""
+    s = rate_limit.settings
+    monkeypatch.setattr(s, "GMAIL_RATE_LIMIT_SHARED", False)
+    monkeypatch.setattr(s, "GMAIL_QUOTA_UNITS_PER_SEC", 100)
+    monkeypatch.setattr(s, "GMAIL_QUOTA_MIN_UNITS_PER_SEC", 10)
+    monkeypatch.setattr(s, "GMAIL_QUOTA_INCREASE", 5)
+    monkeypatch.setattr(rate_limit, "_local", {})
+    # the bucket's clock only moves when the limiter sleeps
+    clock = [1000.0]
+    slept = []
+
+    async def fake_sleep(s):
+        slept.append(s)
+        clock[0] += s
+
+    monkeypatch.setattr(rate_limit.asyncio, "sleep", fake_sleep)
+    # the module's own clock only: the event loop keeps the real one
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    lim = rate_limit.GmailRateLimiter("acct")
+    lim.slept = slept
+    return lim
+
+
+def test_burst_is_free_then_debt_is_slept_off(limiter):
+    asyncio.run(limiter.acquire(100))
+    assert limiter.slept == []
+    asyncio.run(limiter.acquire(50))
+    assert limiter.slept == pytest.approx([0.5])
+
+
+def test_call_larger_than_burst_is_taken_in_pieces(limiter):
+    asyncio.run(limiter.acquire(250))
+    # 100 free; the next 100 cost 1s; the 1s slept refilled 100, so the last
+    # 50 only wait 0.5s
+    assert limiter.slept == pytest.approx([1.0, 0.5])
+
+
+def test_rate_limited_halves_once_per_cooldown(limiter):
+    asyncio.run(limiter.on_rate_limited())
+    assert limiter.rate == 50
+    asyncio.run(limiter.on_rate_limited())
+    assert limiter.rate == 50
+
+
+def test_rate_never_below_min(limiter):
+    bucket = limiter._bucket()
+    for _ in range(10):
+        bucket.cut_at = 0.0  # pretend the cooldown passed
+        asyncio.run(limiter.on_rate_limited())
+    assert limiter.rate == 10
+
+
+def test_success_raises_rate_additively_up_to_max(limiter):
+    asyncio.run(limiter.on_rate_limited())
+    asyncio.run(limiter.on_success())
+    assert limiter.rate == 55
+    for _ in range(20):
+        asyncio.run(limiter.on_success())
+    assert limiter.rate == 100
+
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+sync_runs = pytest.importorskip("app.services.sync_runs")
+httpx = pytest.importorskip("httpx")
+PageCheckpoint = sync_runs.PageCheckpoint
+
+
+class FakeDb:
+    def __init__(self, run):
+        self.run = run
+        self.commits = []
+
+    def add(self, obj):
+        pass
+
+    async def commit(self):
+        r = self.run
+        self.commits.append((r.page_token, r.processed, r.high_water_mark))
+
+    async def rollback(self):
+        pass
+
+
+def _checkpoint(flush=None):
+    run = SimpleNamespace(id="run", page_token=None, processed=0, high_water_mark=None,
+                          updated_at=None)
+    db = FakeDb(run)
+
+    async def no_flush():
+        pass
+
+    return PageCheckpoint(db, run, flush=flush or no_flush, lock=asyncio.Lock()), db
+
+
+def test_checkpoint_moves_over_finished_prefix_only():
+    async def go():
+        cp, db = _checkpoint()
+        cp.add_page(["a", "b"], "t1")
+        cp.add_page(["c"], "t2")
+        cp.done("c")
+        cp.done("a")
+        await cp.aclose()
+        assert db.commits == []
+        cp.done("b")
+        await cp.aclose()
+        return db.commits[-1]
+
+    assert asyncio.run(go()) == ("t2", 3, "c")
+
+
+def test_failed_id_holds_the_checkpoint_before_its_page():
+    async def go():
+        cp, db = _checkpoint()
+        cp.add_page(["a"], "t1")
+        cp.add_page(["b", "c"], "t2")
+        cp.add_page(["d"], "t3")
+        for mid in "acd":
+            cp.done(mid)
+        cp.fail("b")
+        await cp.aclose()
+        return cp.failed, db.commits[-1]
+
+    assert asyncio.run(go()) == (1, ("t1", 1, "a"))
+
+
+def test_write_failure_during_flush_pulls_the_snapshot_back():
+    async def go():
+        holder = {}
+
+        async def flush():
+            holder["cp"].fail("b")
+
+        cp, db = _checkpoint(flush)
+        holder["cp"] = cp
+        cp.add_page(["a"], "t1")
+        cp.add_page(["b"], "t2")
+        cp.done("a")
+        cp.done("b")
+        await cp.aclose()
+        return db.commits
+
+    assert asyncio.run(go()) == [("t1", 1, "a")]
+
+
+class FakeClient:
+    """Lists pages of ids; a page token in `rejected` answers 400."""
+
+    def __init__(self, pages, rejected=()):
+        self.pages = pages
+        self.rejected = set(rejected)
+        self.calls = []
+
+    async def list_message_pages(self, q=None, page_token=None):
+        self.calls.append(page_token)
+        if page_token in self.rejected:
+            req = httpx.Request("GET", "https://gmail.googleapis.com/")
+            raise httpx.HTTPStatusError("bad token", request=req,
+                                        response=httpx.Response(400, request=req))
+        start = int(page_token or 0)
+        for i in range(start, len(self.pages)):
+            nxt = str(i + 1) if i + 1 < len(self.pages) else None
+            yield self.pages[i], nxt
+
+
+def _collect(client, run, on_restart=None):
+    async def go():
+        return [p async for p in sync_runs.resumable_pages(client, run, None, on_restart)]
+    return asyncio.run(go())
+
+
+def test_resume_lists_from_the_stored_token():
+    run = SimpleNamespace(id="run", page_token="1", processed=2, high_water_mark="b")
+    pages = _collect(FakeClient([["a", "b"], ["c"], ["d"]]), run)
+    assert pages == [(["c"], "2"), (["d"], None)]
+
+
+def test_rejected_token_restarts_the_listing():
+    run = SimpleNamespace(id="run", page_token="7", processed=9, high_water_mark="x")
+    restarts = []
+    client = FakeClient([["a"], ["b"]], rejected={"7"})
+    pages = _collect(client, run, lambda: restarts.append(1))
+    assert pages == [(["a"], "1"), (["b"], None)]
+    assert client.calls == ["7", None]
+    assert restarts == [1]
+    assert (run.page_token, run.processed, run.high_water_mark) == (None, 0, None)
@@ -0,0 +1,73 @@
+import math
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+sync_schedule = pytest.importorskip("app.services.sync_schedule")
+
+NOW = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def sched(monkeypatch):
+    s = sync_schedule.settings
+    monkeypatch.setattr(s, "SYNC_SCHED_MIN_INTERVAL_S", 120)
+    monkeypatch.setattr(s, "SYNC_SCHED_MAX_INTERVAL_S", 3600)
+    monkeypatch.setattr(s, "SYNC_SCHED_TARGET_CHANGES", 5)
+    monkeypatch.setattr(s, "SYNC_SCHED_RATE_WINDOW_S", 6 * 3600)
+    monkeypatch.setattr(s, "SYNC_SCHED_JITTER", 0.0)
+    return s
+
+
+def _acct(rate=None, last=None):
+    return SimpleNamespace(change_rate=rate, last_checked_at=last, next_sync_at=None)
+
+
+@pytest.mark.parametrize("rate,expected", [
+    (0, 3600),          # idle: longest interval
+    (-1, 3600),
+    (1, 3600),          # 5 changes take 5h: clamped to max
+    (60, 300),          # 5 changes in 5 min
+    (10_000, 120),      # clamped to min
+])
+def test_next_interval(rate, expected):
+    assert sync_schedule.next_interval_s(rate) == pytest.approx(expected)
+
+
+def test_jitter_stays_in_band(sched):
+    sched.SYNC_SCHED_JITTER = 0.2
+    xs = [sync_schedule.next_interval_s(60) for _ in range(200)]
+    assert all(240 <= x <= 360 for x in xs)
+    assert len(set(xs)) > 1
+
+
+def test_first_observation_only_starts_the_clock():
+    acct = _acct()
+    sync_schedule.observe_changes(acct, 5000, now=NOW)
+    assert acct.change_rate == 0.0
+    assert acct.last_checked_at == NOW
+    assert acct.next_sync_at == NOW + timedelta(seconds=3600)
+
+
+def test_rate_moves_toward_observation_by_elapsed_weight():
+    acct = _acct(rate=0.0, last=NOW - timedelta(hours=6))
+    sync_schedule.observe_changes(acct, 60, now=NOW)
+    # observed 10/h, weight 1 - e^-1 after one full window
+    assert acct.change_rate == pytest.approx(10 * 0.6321, rel=1e-3)
+    assert acct.last_checked_at == NOW
+    assert acct.next_sync_at == NOW + timedelta(
+        seconds=sync_schedule.next_interval_s(acct.change_rate))
+
+
+def test_short_interval_barely_moves_the_rate():
+    acct = _acct(rate=2.0, last=NOW - timedelta(minutes=2))
+    sync_schedule.observe_changes(acct, 100, now=NOW)
+    assert 2.0 < acct.change_rate < 20.0
+
+
+def test_quiet_checks_decay_the_rate():
+    acct = _acct(rate=30.0, last=NOW - timedelta(hours=1))
+    sync_schedule.observe_changes(acct, 0, now=NOW)
+    assert acct.change_rate < 30.0
+    assert acct.change_rate == pytest.approx(30.0 * math.exp(-1 / 6))
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+vectorstore = pytest.importorskip("app.utils.vectorstore")
+UpsertAggregator = vectorstore.UpsertAggregator
+
+
+def _vec(vid, dims=4):
+    return {"id": vid, "values": [0.5] * dims, "metadata": {"message_id": vid.split("#")[0]}}
+
+
+class _Calls(list):
+    # ids whose batch should fail
+    fail: set = set()
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Batches handed to Pinecone; a batch holding an id in `sent.fail` raises."""
+    calls = _Calls()
+
+    async def fake_upsert(items, namespace):
+        calls.append([v["id"] for v in items])
+        if calls.fail & {v["id"] for v in items}:
+            raise RuntimeError("upsert failed")
+        return {"upserted": len(items)}
+
+    monkeypatch.setattr(vectorstore, "upsert_vectors", fake_upsert)
+    return calls
+
+
+def test_batches_sealed_by_vector_count(sent):
+    agg = UpsertAggregator("ns", max_vectors=3, max_bytes=10 ** 6, concurrency=2)
+    agg.add("m1", [_vec(f"m1#{i}") for i in range(4)])
+    agg.add("m2", [_vec(f"m2#{i}") for i in range(3)])
+    result = asyncio.run(agg.flush())
+    assert sorted(len(b) for b in sent) == [1, 3, 3]
+    assert sorted(i for b in sent for i in b) == sorted(
+        [f"m1#{i}" for i in range(4)] + [f"m2#{i}" for i in range(3)])
+    assert result == {"m1": None, "m2": None}
+
+
+def test_batches_sealed_by_bytes(sent):
+    size = vectorstore._vector_bytes(_vec("m1#0"))
+    agg = UpsertAggregator("ns", max_vectors=1000, max_bytes=2 * size, concurrency=1)
+    agg.add("m1", [_vec(f"m1#{i}") for i in range(5)])
+    asyncio.run(agg.flush())
+    assert [len(b) for b in sent] == [2, 2, 1]
+
+
+def test_oversized_vector_still_goes_out_alone(sent):
+    agg = UpsertAggregator("ns", max_vectors=10, max_bytes=10, concurrency=1)
+    agg.add("m1", [_vec("m1#0"), _vec("m1#1")])
+    asyncio.run(agg.flush())
+    assert sent == [["m1#0"], ["m1#1"]]
+
+
+def test_failed_batch_fails_only_its_owners(sent):
+    sent.fail = {"m2#1"}
+    agg = UpsertAggregator("ns", max_vectors=2, max_bytes=10 ** 6, concurrency=4)
+    agg.add("m1", [_vec("m1#0"), _vec("m1#1")])           # batch 1
+    agg.add("m2", [_vec("m2#0"), _vec("m2#1")])           # batch 2 (fails)
+    agg.add("m3", [_vec("m3#0")])                         # batch 3
+    result = asyncio.run(agg.flush())
+    assert result["m1"] is None and result["m3"] is None
+    assert isinstance(result["m2"], RuntimeError)
+
+
+def test_owner_spanning_batches_fails_if_any_fails(sent):
+    sent.fail = {"m1#2"}
+    agg = UpsertAggregator("ns", max_vectors=2, max_bytes=10 ** 6, concurrency=4)
+    agg.add("m0", [_vec("m0#0")])
+    agg.add("m1", [_vec(f"m1#{i}") for i in range(3)])
+    # batches: [m0#0, m1#0] [m1#1, m1#2]
+    result = asyncio.run(agg.flush())
+    assert result["m0"] is None
+    assert isinstance(result["m1"], RuntimeError)
+
+
+def test_owner_without_vectors_is_reported_and_flush_resets(sent):
+    agg = UpsertAggregator("ns", max_vectors=5, max_bytes=10 ** 6, concurrency=1)
+    agg.add("empty", [])
+    assert asyncio.run(agg.flush()) == {"empty": None}
+    assert sent == []
+    assert asyncio.run(agg.flush()) == {}
+
+
+class _FlakyIndex:
+    """Fails the first `flaky[id]` updates of an id."""
+
+    def __init__(self, **flaky):
+        self.flaky = flaky
+        self.calls = []
+
+    def update(self, id, set_metadata, namespace):
+        self.calls.append(id)
+        if self.flaky.get(id, 0) > 0:
+            self.flaky[id] -= 1
+            raise RuntimeError("429")
+
+
+def test_update_group_retries_only_failed_ids(monkeypatch):
+    monkeypatch.setattr(vectorstore.time, "sleep", lambda s: None)
+    index = _FlakyIndex(b=1)
+    failed = vectorstore._update_group(index, [("a", {}), ("b", {})], "ns")
+    assert failed == []
+    assert index.calls == ["a", "b", "b"]
+
+
+def test_update_group_gives_up_after_attempts(monkeypatch):
+    monkeypatch.setattr(vectorstore.time, "sleep", lambda s: None)
+    index = _FlakyIndex(b=99)
+    failed = vectorstore._update_group(index, [("a", {}), ("b", {})], "ns")
+    assert [vid for vid, _ in failed] == ["b"]
+    assert isinstance(failed[0][1], RuntimeError)
+    assert index.calls.count("b") == vectorstore.UPDATE_ATTEMPTS
@@ -13,7 +13,14 @@ export function SyncBadge() {
       case 'syncing': {
         const t = status.total ?? 0
         const p = status.processed ?? 0
-        return t > 0 ? `Syncing ${p}/${t}` : 'Syncing…'
+        const approx = status.total_estimated ? '~' : ''
+        return t > 0 ? `Syncing ${p}/${approx}${t}` : 'Syncing…'
+      }
+      case 'hydrating': {
+        // headers are in; bodies and embeddings still loading
+        const t = status.bodies?.total ?? 0
+        const p = status.bodies?.processed ?? 0
+        return t > 0 ? `Indexing ${p}/${t}` : 'Indexing…'
       }
       case 'done': return 'Up to date'
       case 'error': return 'Sync error'
@@ -23,7 +30,7 @@ export function SyncBadge() {
 
   const color = status.state === 'error'
     ? 'text-red-600'
-    : status.state === 'syncing' || status.state === 'initializing'
+    : status.state === 'syncing' || status.state === 'hydrating' || status.state === 'initializing'
       ? 'text-amber-600'
       : 'text-emerald-600'
 
@@ -3,9 +3,12 @@ import { useCallback, useEffect, useRef, useState } from 'react'
 import { getSyncStatus } from '@/components/api/syncApi'
 import { SyncStatus } from '@/types'
 
+// Live progress from /sync/stream (SSE); falls back to polling /sync/status
+// when the stream cannot be opened or drops.
 export function useSyncStatus(pollMs = 2000) {
   const [status, setStatus] = useState<SyncStatus>({ state: 'idle' })
   const timer = useRef<number | null>(null)
+  const esRef = useRef<EventSource | null>(null)
 
   const poll = useCallback(async () => {
     try {
@@ -15,7 +18,7 @@ export function useSyncStatus(pollMs = 2000) {
     }
   }, [])
 
-  const start = useCallback(() => {
+  const startPolling = useCallback(() => {
     if (timer.current) return
     void poll()
     timer.current = window.setInterval(poll, pollMs)
@@ -26,8 +29,41 @@ export function useSyncStatus(pollMs = 2000) {
       window.clearInterval(timer.current)
       timer.current = null
     }
+    if (esRef.current) {
+      esRef.current.close()
+      esRef.current = null
+    }
   }, [])
 
+  const start = useCallback(() => {
+    if (esRef.current || timer.current) return
+    if (typeof EventSource === 'undefined') {
+      startPolling()
+      return
+    }
+    const es = new EventSource('/api/sync/stream', { withCredentials: true } as any)
+    esRef.current = es
+
+    es.addEventListener('snapshot', (e: MessageEvent) => {
+      try {
+        setStatus(JSON.parse(e.data))
+      } catch {}
+    })
+
+    es.addEventListener('progress', (e: MessageEvent) => {
+      try {
+        const delta = JSON.parse(e.data)
+        setStatus(prev => ({ ...prev, ...delta }))
+      } catch {}
+    })
+
+    es.addEventListener('error', () => {
+      es.close()
+      esRef.current = null
+      startPolling()
+    })
+  }, [startPolling])
+
   useEffect(() => {
     start()
     return () => stop()
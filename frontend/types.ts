@@ -12,9 +12,20 @@ export interface ChatSession {
   updatedAt: string;
 }
 
+export type SyncPhaseStatus = {
+  state: 'idle' | 'listing' | 'running' | 'done' | 'failed'
+  total: number
+  processed: number
+  indexed?: number
+  errors: number
+}
 export type SyncStatus = {
-  state: 'idle' | 'initializing' | 'syncing' | 'done' | 'error'
+  state: 'idle' | 'initializing' | 'syncing' | 'hydrating' | 'done' | 'error'
   total?: number
+  total_estimated?: boolean
+  phase?: 'metadata' | 'bodies' | null
+  metadata?: SyncPhaseStatus
+  bodies?: SyncPhaseStatus
   processed?: number
   errors?: number
   started_at?: string